@@ -13,6 +13,34 @@ import schedule
 from datetime import datetime
 import os
 import sys
+import sqlite3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connect/read timeouts for API calls, so a stalled server cannot hang the app
+API_TIMEOUT = (3.05, 10)
+
+# Aladhan calculation method used for all requests (ISNA)
+API_METHOD = 2
+
+# SQLite file keeping fetched timetables across restarts, distinct from the
+# full app's prayer_times.db whose timetable table has another schema
+STORE_FILE = "minimal_prayer_times.db"
+
+
+def create_session():
+    """HTTP session with keep-alive pooling and retries with jittered backoff"""
+    retry_options = dict(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    try:
+        retry = Retry(backoff_jitter=0.5, **retry_options)
+    except TypeError:
+        # urllib3 < 2 has no backoff jitter
+        retry = Retry(**retry_options)
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 class PrayerApp:
     def __init__(self):
@@ -20,6 +48,8 @@ class PrayerApp:
         self.settings = self.load_settings()
         self.running = False
         self.lock_window = None
+        self.session = create_session()
+        self.store = self.open_store()
         
     def load_settings(self):
         """Load settings from JSON file"""
@@ -30,7 +60,8 @@ class PrayerApp:
             "longitude": -0.1278,
             "lock_duration": 10,  # in minutes
             "play_adhan": True,
-            "auto_start": False
+            "auto_start": False,
+            "api_url": "http://api.aladhan.com"  # Or a local timetable_server.py node
         }
         
         if os.path.exists(self.settings_file):
@@ -52,28 +83,84 @@ class PrayerApp:
         with open(self.settings_file, 'w') as f:
             json.dump(self.settings, f, indent=2)
     
+    def open_store(self):
+        """Open the SQLite timetable store (WAL mode), None if unavailable"""
+        try:
+            store = sqlite3.connect(STORE_FILE, check_same_thread=False)
+            store.execute("PRAGMA journal_mode=WAL")
+            with store:
+                store.execute("""
+                    CREATE TABLE IF NOT EXISTS timetable (
+                        city TEXT NOT NULL,
+                        country TEXT NOT NULL,
+                        method INTEGER NOT NULL,
+                        date TEXT NOT NULL,
+                        timings TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        fetched_at REAL NOT NULL,
+                        PRIMARY KEY (city, country, method, date)
+                    )
+                """)
+            return store
+        except Exception as e:
+            print(f"Timetable store unavailable: {e}")
+            return None
+    
+    def load_stored_times(self, date_key):
+        """Return stored timings for a date, or None"""
+        if self.store is None:
+            return None
+        try:
+            row = self.store.execute(
+                "SELECT timings FROM timetable WHERE city = ? AND country = ? AND method = ? AND date = ?",
+                (self.settings['city'], self.settings['country'], API_METHOD, date_key)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error reading stored prayer times: {e}")
+            return None
+    
+    def save_stored_times(self, date_key, timings):
+        """Store fetched timings for a date"""
+        if self.store is None:
+            return
+        try:
+            with self.store:
+                self.store.execute(
+                    "INSERT OR REPLACE INTO timetable VALUES (?, ?, ?, ?, ?, 'online', ?)",
+                    (self.settings['city'], self.settings['country'], API_METHOD, date_key,
+                     json.dumps(timings), time.time()))
+        except Exception as e:
+            print(f"Error storing prayer times: {e}")
+    
     def get_prayer_times(self):
-        """Fetch prayer times from AlAdhan API"""
+        """Get today's prayer times from the local store, or fetch them from AlAdhan API"""
+        date_key = datetime.now().strftime('%d-%m-%Y')
+        stored = self.load_stored_times(date_key)
+        if stored:
+            return stored
+        
         try:
-            url = f"http://api.aladhan.com/v1/timingsByCity/{datetime.now().strftime('%d-%m-%Y')}"
+            url = f"{self.settings['api_url'].rstrip('/')}/v1/timingsByCity/{date_key}"
             params = {
                 'city': self.settings['city'],
                 'country': self.settings['country'],
-                'method': 2  # ISNA method
+                'method': API_METHOD
             }
             
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=API_TIMEOUT)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('code') == 200:
                     timings = data['data']['timings']
-                    return {
+                    result = {
                         'Fajr': timings['Fajr'][:5],
                         'Dhuhr': timings['Dhuhr'][:5],
                         'Asr': timings['Asr'][:5],
                         'Maghrib': timings['Maghrib'][:5],
                         'Isha': timings['Isha'][:5]
                     }
+                    self.save_stored_times(date_key, result)
+                    return result
             return None
         except Exception as e:
             print(f"Error fetching prayer times: {e}")
@@ -158,7 +158,12 @@ class TestPrayerTimeService(unittest.TestCase):
     """Test the main service"""
     
     def setUp(self):
-        self.service = PrayerTimeService()
+        # In-memory config, store and ledger, and no network
+        config = ConfigManager(None)
+        config.set_app_setting('timetable_store', '')
+        config.set_app_setting('event_ledger', '')
+        self.service = PrayerTimeService(config_manager=config)
+        self.service.times_source = 'offline'
     
     def test_init(self):
         """Test service initialization"""
@@ -0,0 +1,387 @@
+"""
+Accuracy and throughput benchmark of the calculation engines
+
+Runs a fixed matrix of cities (including latitudes above 60 degrees), all
+methods of PrayerCalculator.METHODS and dates through the scalar, range,
+batch and grid lookup paths. Accuracy is the difference in displayed
+minutes from the reference fixtures in benchmark_reference.json;
+throughput is location-days per second.
+
+    python benchmark.py run -o benchmark_baseline.json
+    python benchmark.py run -o results.json
+    python benchmark.py compare benchmark_baseline.json results.json
+
+compare exits with status 1 when a path got slower by more than
+--slowdown or less accurate than the baseline. After an intended change
+of the results, rewrite the fixtures with `python benchmark.py reference`.
+
+`python benchmark.py startup` measures, with -X importtime in a fresh
+interpreter, importing service and building PrayerTimeService, and exits
+with status 1 when either exceeds its budget or a deferred dependency
+(see lazy_import.py) is imported at startup.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from calculation_params import TIME_NAMES
+from cities import find_city
+from prayer_calculator import PrayerCalculator, compute_batch
+from prayer_times import UNDEFINED_TIME, format_many
+
+BENCHMARK_CITIES = ('Makkah', 'Jakarta', 'Cairo', 'Karachi', 'Istanbul', 'New York', 'London',
+                    'Sydney', 'Cape Town', 'Oslo', 'Helsinki', 'Reykjavik', 'Tromso')
+
+BENCHMARK_DATES = ('2026-01-15', '2026-03-20', '2026-05-10', '2026-06-21', '2026-08-01',
+                   '2026-09-23', '2026-11-10', '2026-12-21', '2027-02-28', '2028-02-29')
+
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_reference.json')
+
+PATHS = ('scalar', 'range', 'batch', 'grid')
+
+# Methods the grid is built for (a grid holds one method)
+GRID_METHOD = 'MWL'
+
+# Startup budgets in milliseconds, and the dependencies that must load on first use only
+STARTUP_BUDGET_MS = {'import': 150.0, 'build': 100.0}
+DEFERRED_MODULES = ('numpy', 'requests', 'pygame', 'pystray', 'PIL', 'prayer_engine')
+
+_STARTUP_SCRIPT = '''
+import time
+import service
+start = time.perf_counter()
+service.PrayerTimeService()
+print(f"{(time.perf_counter() - start) * 1000:.3f}")
+'''
+
+
+def benchmark_sites():
+    """(name, latitude, longitude, IANA zone) of the benchmark cities"""
+    sites = []
+    for name in BENCHMARK_CITIES:
+        entry = find_city(name)
+        sites.append((entry[0], entry[3], entry[4], entry[5]))
+    return sites
+
+
+def benchmark_dates():
+    return [datetime.date.fromisoformat(day) for day in BENCHMARK_DATES]
+
+
+def _key(city, method, date_obj):
+    return f"{city}|{method}|{date_obj.isoformat()}"
+
+
+def _calculator(method, lat, lng, zone, grid=None):
+    calculator = PrayerCalculator(method=method, coordinates=(lat, lng), timezone=zone, cache_size=0)
+    if grid is not None:
+        calculator.set_grid(grid)
+    return calculator
+
+
+def reference_times():
+    """Displayed times of the whole matrix from the scalar engine"""
+    reference = {}
+    for method in sorted(PrayerCalculator.METHODS):
+        for city, lat, lng, zone in benchmark_sites():
+            calculator = _calculator(method, lat, lng, zone)
+            for date_obj in benchmark_dates():
+                formatted = calculator.get_prayer_times(date_obj).formatted()
+                reference[_key(city, method, date_obj)] = [formatted[name] for name in TIME_NAMES]
+    return reference
+
+
+def write_reference(path=REFERENCE_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'events': list(TIME_NAMES), 'times': reference_times()}, f, indent=0, sort_keys=True)
+        f.write('\n')
+
+
+def load_reference(path=REFERENCE_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data['events'] != list(TIME_NAMES):
+        raise ValueError(f"{path}: fixtures were written for other events")
+    return data['times']
+
+
+def _minutes(text):
+    hours, minutes = text.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def compare_times(expected, actual):
+    """(largest difference in minutes, sum of differences, compared, mismatches) of two time lists"""
+    worst = total = compared = mismatches = 0
+    for want, got in zip(expected, actual):
+        if want == UNDEFINED_TIME or got == UNDEFINED_TIME:
+            mismatches += want != got
+            continue
+        difference = abs(_minutes(want) - _minutes(got)) % 1440
+        difference = min(difference, 1440 - difference)
+        worst = max(worst, difference)
+        total += difference
+        compared += 1
+    return worst, total, compared, mismatches
+
+
+def _path_results(method, grid):
+    """Yield (path, key, displayed times) of every path for one method"""
+    sites = benchmark_sites()
+    dates = benchmark_dates()
+    for city, lat, lng, zone in sites:
+        calculator = _calculator(method, lat, lng, zone)
+        for date_obj in dates:
+            formatted = calculator.get_prayer_times(date_obj).formatted()
+            yield 'scalar', _key(city, method, date_obj), [formatted[name] for name in TIME_NAMES]
+
+        start = dates[0]
+        times = calculator.get_times_range(start, dates[-1])
+        for date_obj in dates:
+            index = (date_obj - start).days
+            yield 'range', _key(city, method, date_obj), [str(format_many(times[name][index:index + 1])[0])
+                                                          for name in TIME_NAMES]
+
+        if grid is not None and method == GRID_METHOD:
+            calculator = _calculator(method, lat, lng, zone, grid)
+            for date_obj in dates:
+                formatted = calculator.get_prayer_times(date_obj).formatted()
+                yield 'grid', _key(city, method, date_obj), [formatted[name] for name in TIME_NAMES]
+
+    lats, lngs, zones = ([site[index] for site in sites] for index in (1, 2, 3))
+    batch = format_many(compute_batch(lats, lngs, zones, dates, method))
+    for date_index, date_obj in enumerate(dates):
+        for site_index, site in enumerate(sites):
+            yield 'batch', _key(site[0], method, date_obj), [str(value) for value in batch[date_index, site_index]]
+
+
+def measure_accuracy(reference, grid=None):
+    """Error of every path against the reference fixtures, in displayed minutes"""
+    totals = {}
+    for method in sorted(PrayerCalculator.METHODS):
+        for path, key, times in _path_results(method, grid):
+            worst, total, compared, mismatches = compare_times(reference[key], times)
+            entry = totals.setdefault(path, [0, 0, 0, 0])
+            entry[0] = max(entry[0], worst)
+            entry[1] += total
+            entry[2] += compared
+            entry[3] += mismatches
+    return {path: {'max_minutes': worst, 'mean_minutes': round(total / compared, 4) if compared else 0.0,
+                   'compared': compared, 'undefined_mismatches': mismatches}
+            for path, (worst, total, compared, mismatches) in totals.items()}
+
+
+def _best_rate(function, days, repeat):
+    """Best location-days per second of repeat runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return days / best
+
+
+def measure_throughput(grid=None, repeat=3, num_days=365):
+    """Location-days per second of every path, over num_days days of every benchmark city"""
+    sites = benchmark_sites()
+    start = datetime.date(2026, 1, 1)
+    end = start + datetime.timedelta(days=num_days - 1)
+    dates = [start + datetime.timedelta(days=index) for index in range(num_days)]
+    days = len(sites) * num_days
+
+    def scalar(calculator_grid=None):
+        for city, lat, lng, zone in sites:
+            calculator = _calculator(GRID_METHOD, lat, lng, zone, calculator_grid)
+            for date_obj in dates:
+                calculator.get_prayer_times(date_obj)
+
+    def range_path():
+        for city, lat, lng, zone in sites:
+            _calculator(GRID_METHOD, lat, lng, zone).get_times_range(start, end)
+
+    def batch():
+        compute_batch([site[1] for site in sites], [site[2] for site in sites], [site[3] for site in sites],
+                      dates, GRID_METHOD)
+
+    rates = {
+        'scalar': _best_rate(scalar, days, repeat),
+        'range': _best_rate(range_path, days, repeat),
+        'batch': _best_rate(batch, days, repeat)
+    }
+    if grid is not None:
+        rates['grid'] = _best_rate(lambda: scalar(grid), days, repeat)
+    return {path: round(rate, 1) for path, rate in rates.items()}
+
+
+def run(grid_path=None, grid_step=2.0, repeat=3, reference_path=REFERENCE_PATH):
+    """Run the benchmark, building a temporary grid unless one is given (grid_step None skips it)"""
+    grid = temporary = None
+    if grid_path:
+        from prayer_grid import PrayerGrid
+        grid = PrayerGrid(grid_path)
+    elif grid_step:
+        from prayer_grid import build_grid
+        handle, temporary = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        grid = build_grid(temporary, GRID_METHOD, grid_step)
+
+    try:
+        return {
+            'version': 1,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'grid': {'path': grid_path, 'step': grid.step} if grid is not None else None,
+            'throughput': measure_throughput(grid, repeat),
+            'accuracy': measure_accuracy(load_reference(reference_path), grid)
+        }
+    finally:
+        del grid
+        if temporary:
+            os.remove(temporary)
+
+
+def measure_startup(repeat=3):
+    """
+    Best import time of service and build time of PrayerTimeService in ms
+
+    Each run is a fresh interpreter with -X importtime, in a temporary
+    working directory since the service writes its config and logs there.
+    Also returns the deferred modules that were imported.
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [app_dir, os.environ.get('PYTHONPATH')])))
+    result = {'import_ms': float('inf'), 'build_ms': float('inf'), 'deferred_imported': []}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', _STARTUP_SCRIPT], cwd=workdir,
+                                     env=env, capture_output=True, text=True, check=True)
+        imported = {}
+        for line in process.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                imported[name.strip()] = int(cumulative)
+        result['import_ms'] = min(result['import_ms'], imported['service'] / 1000)
+        result['build_ms'] = min(result['build_ms'], float(process.stdout.split()[-1]))
+        result['deferred_imported'] = sorted({name.split('.')[0] for name in imported} & set(DEFERRED_MODULES))
+    return result
+
+
+def check_startup(result, budget=STARTUP_BUDGET_MS):
+    """Return a list of budget violations of a measure_startup result"""
+    problems = [f"{stage} took {result[stage + '_ms']:.1f} ms, budget {limit:.0f} ms"
+                for stage, limit in budget.items() if result[stage + '_ms'] > limit]
+    problems.extend(f"{name} is imported at startup" for name in result['deferred_imported'])
+    return problems
+
+
+def compare(baseline, results, slowdown=0.2):
+    """Return a list of regressions of results against baseline"""
+    regressions = []
+    for path, rate in baseline.get('throughput', {}).items():
+        current = results.get('throughput', {}).get(path)
+        if current is None:
+            continue
+        if current < rate * (1 - slowdown):
+            regressions.append(f"{path}: {current:.0f} days/s, baseline {rate:.0f} "
+                               f"({(1 - current / rate) * 100:.0f}% slower)")
+    for path, accuracy in baseline.get('accuracy', {}).items():
+        current = results.get('accuracy', {}).get(path)
+        if current is None:
+            continue
+        for measure in ('max_minutes', 'mean_minutes', 'undefined_mismatches'):
+            if current[measure] > accuracy[measure]:
+                regressions.append(f"{path}: {measure} {current[measure]}, baseline {accuracy[measure]}")
+    return regressions
+
+
+def _print_results(results):
+    for path in PATHS:
+        rate = results['throughput'].get(path)
+        accuracy = results['accuracy'].get(path)
+        if rate is None and accuracy is None:
+            continue
+        line = f"{path:>7}: {rate or 0:>12,.0f} days/s"
+        if accuracy:
+            line += (f"  max {accuracy['max_minutes']} min, mean {accuracy['mean_minutes']} min, "
+                     f"{accuracy['undefined_mismatches']} undefined mismatches of {accuracy['compared']}")
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the accuracy and throughput of the engines")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmark")
+    run_parser.add_argument('--output', '-o', help="Write the results as JSON (e.g. a new baseline)")
+    run_parser.add_argument('--grid', help="Grid file to measure (default: build a temporary one)")
+    run_parser.add_argument('--grid-step', type=float, default=2.0, help="Step of the temporary grid, 0 to skip")
+    run_parser.add_argument('--repeat', type=int, default=3, help="Timed runs per path (best is kept)")
+
+    compare_parser = commands.add_parser('compare', help="Flag regressions against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results', nargs='?', help="Results file (default: run the benchmark now)")
+    compare_parser.add_argument('--slowdown', type=float, default=0.2,
+                                help="Tolerated throughput loss as a fraction (default 0.2)")
+
+    commands.add_parser('reference', help="Rewrite the reference fixtures from the scalar engine")
+
+    startup_parser = commands.add_parser('startup', help="Check the startup time budget")
+    startup_parser.add_argument('--import-budget', type=float, default=STARTUP_BUDGET_MS['import'],
+                                help="Budget for importing service in ms")
+    startup_parser.add_argument('--build-budget', type=float, default=STARTUP_BUDGET_MS['build'],
+                                help="Budget for building PrayerTimeService in ms")
+    startup_parser.add_argument('--repeat', type=int, default=3, help="Runs (best is kept)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'startup':
+        result = measure_startup(max(1, args.repeat))
+        print(f"import service: {result['import_ms']:.1f} ms, PrayerTimeService(): {result['build_ms']:.1f} ms")
+        problems = check_startup(result, {'import': args.import_budget, 'build': args.build_budget})
+        for problem in problems:
+            print(f"OVER BUDGET {problem}")
+        return 1 if problems else 0
+
+    if args.command == 'reference':
+        write_reference()
+        print(f"Wrote {REFERENCE_PATH}")
+        return 0
+
+    if args.command == 'run':
+        results = run(args.grid, args.grid_step, max(1, args.repeat))
+        _print_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if args.results:
+        with open(args.results, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+    else:
+        results = run()
+        _print_results(results)
+    regressions = compare(baseline, results, args.slowdown)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import hashlib
+import math
+import re
+from enum import Enum
+
+# Prayer time names in calculation order
+TIME_NAMES = ('imsak', 'fajr', 'sunrise', 'dhuhr', 'asr', 'sunset', 'maghrib', 'isha', 'midnight')
+
+
+class AsrMethod(Enum):
+    """Juristic method used for the asr shadow factor"""
+    STANDARD = 'Standard'
+    HANAFI = 'Hanafi'
+    CUSTOM = 'Custom'  # Numeric shadow factor given directly
+
+
+class HighLatsMethod(Enum):
+    """Adjustment method for locations in higher latitudes"""
+    NONE = 'None'
+    NIGHT_MIDDLE = 'NightMiddle'
+    ONE_SEVENTH = 'OneSeventh'
+    ANGLE_BASED = 'AngleBased'
+
+
+class MidnightMethod(Enum):
+    """Method used to compute midnight"""
+    STANDARD = 'Standard'
+    JAFARI = 'Jafari'
+
+
+ASR_FACTORS = {
+    AsrMethod.STANDARD: 1.0,
+    AsrMethod.HANAFI: 2.0
+}
+
+
+def parse_value(st):
+    """Convert a setting such as 18, '10 min' or '1.5' into a number"""
+    if isinstance(st, (int, float)):
+        return float(st)
+
+    val = re.split('[^0-9.+-]', str(st), 1)[0]
+    return float(val) if val else 0
+
+
+def is_minutes(arg):
+    """Detect if a setting is given in minutes ('10 min') rather than degrees"""
+    return isinstance(arg, str) and 'min' in arg
+
+
+class CalculationParams:
+    """
+    Compiled, immutable numeric form of the calculator settings
+
+    Angles and minute offsets are floats and the asr/highLats/midnight
+    methods are enums, so the calculation never parses setting strings.
+    Instances are hashable and compare equal when the settings are equal.
+    """
+
+    __slots__ = (
+        'imsak', 'imsak_is_min',
+        'fajr',
+        'dhuhr',
+        'asr', 'asr_factor',
+        'maghrib', 'maghrib_is_min',
+        'isha', 'isha_is_min',
+        'high_lats',
+        'midnight',
+        'rise_set_angle',
+        'offsets',
+        '_hash'
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__[:-1]:
+            object.__setattr__(self, name, values[name])
+        object.__setattr__(self, '_hash', hash(self._key()))
+
+    @classmethod
+    def compile(cls, settings, elevation=0, offsets=None):
+        """Compile a settings dict (as built by PrayerCalculator) into parameters"""
+        asr = settings.get('asr', 'Standard')
+        if asr in ('Standard', 'Hanafi'):
+            asr_method = AsrMethod(asr)
+            asr_factor = ASR_FACTORS[asr_method]
+        else:
+            asr_method = AsrMethod.CUSTOM
+            asr_factor = parse_value(asr)
+
+        try:
+            high_lats = HighLatsMethod(settings.get('highLats', 'NightMiddle'))
+            midnight = MidnightMethod(settings.get('midnight', 'Standard'))
+        except ValueError as e:
+            raise ValueError(f"Invalid calculation setting: {e}")
+
+        elevation = 0 if elevation is None else elevation
+        offsets = offsets or {}
+
+        return cls(
+            imsak=parse_value(settings.get('imsak', '10 min')),
+            imsak_is_min=is_minutes(settings.get('imsak', '10 min')),
+            fajr=parse_value(settings.get('fajr', 18)),
+            dhuhr=parse_value(settings.get('dhuhr', '0 min')),
+            asr=asr_method,
+            asr_factor=asr_factor,
+            maghrib=parse_value(settings.get('maghrib', '0 min')),
+            maghrib_is_min=is_minutes(settings.get('maghrib', '0 min')),
+            isha=parse_value(settings.get('isha', 17)),
+            isha_is_min=is_minutes(settings.get('isha', 17)),
+            high_lats=high_lats,
+            midnight=midnight,
+            rise_set_angle=0.833 + 0.0347 * math.sqrt(elevation),
+            offsets=tuple(float(offsets.get(name, 0)) for name in TIME_NAMES)
+        )
+
+    def _key(self):
+        return tuple(getattr(self, name) for name in self.__slots__[:-1])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CalculationParams is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("CalculationParams is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, CalculationParams):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return self._hash
+
+    def fingerprint(self):
+        """Short digest of the parameters that is stable across processes"""
+        return hashlib.sha1(repr(self).encode()).hexdigest()[:16]
+
+    def __getstate__(self):
+        return self._key()
+
+    def __setstate__(self, state):
+        self.__init__(**dict(zip(self.__slots__[:-1], state)))
+
+    def __repr__(self):
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__[:-1])
+        return f"CalculationParams({values})"
@@ -0,0 +1,137 @@
+"""
+Reference table of major cities
+
+Each entry is (city, country, ISO country code, latitude, longitude, IANA
+timezone). Used to resolve /v1/timingsByCity requests offline.
+"""
+
+CITIES = (
+    ('Makkah', 'Saudi Arabia', 'SA', 21.4225, 39.8262, 'Asia/Riyadh'),
+    ('Madinah', 'Saudi Arabia', 'SA', 24.4672, 39.6112, 'Asia/Riyadh'),
+    ('Riyadh', 'Saudi Arabia', 'SA', 24.7136, 46.6753, 'Asia/Riyadh'),
+    ('Jeddah', 'Saudi Arabia', 'SA', 21.4858, 39.1925, 'Asia/Riyadh'),
+    ('Dubai', 'United Arab Emirates', 'AE', 25.2048, 55.2708, 'Asia/Dubai'),
+    ('Abu Dhabi', 'United Arab Emirates', 'AE', 24.4539, 54.3773, 'Asia/Dubai'),
+    ('Doha', 'Qatar', 'QA', 25.2854, 51.5310, 'Asia/Qatar'),
+    ('Kuwait City', 'Kuwait', 'KW', 29.3759, 47.9774, 'Asia/Kuwait'),
+    ('Manama', 'Bahrain', 'BH', 26.2285, 50.5860, 'Asia/Bahrain'),
+    ('Muscat', 'Oman', 'OM', 23.5880, 58.3829, 'Asia/Muscat'),
+    ("Sana'a", 'Yemen', 'YE', 15.3694, 44.1910, 'Asia/Aden'),
+    ('Amman', 'Jordan', 'JO', 31.9454, 35.9284, 'Asia/Amman'),
+    ('Jerusalem', 'Palestine', 'PS', 31.7683, 35.2137, 'Asia/Jerusalem'),
+    ('Beirut', 'Lebanon', 'LB', 33.8938, 35.5018, 'Asia/Beirut'),
+    ('Damascus', 'Syria', 'SY', 33.5138, 36.2765, 'Asia/Damascus'),
+    ('Baghdad', 'Iraq', 'IQ', 33.3152, 44.3661, 'Asia/Baghdad'),
+    ('Tehran', 'Iran', 'IR', 35.6892, 51.3890, 'Asia/Tehran'),
+    ('Mashhad', 'Iran', 'IR', 36.2605, 59.6168, 'Asia/Tehran'),
+    ('Istanbul', 'Turkey', 'TR', 41.0082, 28.9784, 'Europe/Istanbul'),
+    ('Ankara', 'Turkey', 'TR', 39.9334, 32.8597, 'Europe/Istanbul'),
+    ('Cairo', 'Egypt', 'EG', 30.0444, 31.2357, 'Africa/Cairo'),
+    ('Alexandria', 'Egypt', 'EG', 31.2001, 29.9187, 'Africa/Cairo'),
+    ('Khartoum', 'Sudan', 'SD', 15.5007, 32.5599, 'Africa/Khartoum'),
+    ('Tripoli', 'Libya', 'LY', 32.8872, 13.1913, 'Africa/Tripoli'),
+    ('Tunis', 'Tunisia', 'TN', 36.8065, 10.1815, 'Africa/Tunis'),
+    ('Algiers', 'Algeria', 'DZ', 36.7538, 3.0588, 'Africa/Algiers'),
+    ('Casablanca', 'Morocco', 'MA', 33.5731, -7.5898, 'Africa/Casablanca'),
+    ('Rabat', 'Morocco', 'MA', 34.0209, -6.8416, 'Africa/Casablanca'),
+    ('Dakar', 'Senegal', 'SN', 14.7167, -17.4677, 'Africa/Dakar'),
+    ('Lagos', 'Nigeria', 'NG', 6.5244, 3.3792, 'Africa/Lagos'),
+    ('Kano', 'Nigeria', 'NG', 12.0022, 8.5920, 'Africa/Lagos'),
+    ('Accra', 'Ghana', 'GH', 5.6037, -0.1870, 'Africa/Accra'),
+    ('Addis Ababa', 'Ethiopia', 'ET', 9.0300, 38.7400, 'Africa/Addis_Ababa'),
+    ('Mogadishu', 'Somalia', 'SO', 2.0469, 45.3182, 'Africa/Mogadishu'),
+    ('Nairobi', 'Kenya', 'KE', -1.2921, 36.8219, 'Africa/Nairobi'),
+    ('Dar es Salaam', 'Tanzania', 'TZ', -6.7924, 39.2083, 'Africa/Dar_es_Salaam'),
+    ('Johannesburg', 'South Africa', 'ZA', -26.2041, 28.0473, 'Africa/Johannesburg'),
+    ('Cape Town', 'South Africa', 'ZA', -33.9249, 18.4241, 'Africa/Johannesburg'),
+    ('Karachi', 'Pakistan', 'PK', 24.8607, 67.0011, 'Asia/Karachi'),
+    ('Lahore', 'Pakistan', 'PK', 31.5204, 74.3587, 'Asia/Karachi'),
+    ('Islamabad', 'Pakistan', 'PK', 33.6844, 73.0479, 'Asia/Karachi'),
+    ('Kabul', 'Afghanistan', 'AF', 34.5553, 69.2075, 'Asia/Kabul'),
+    ('Tashkent', 'Uzbekistan', 'UZ', 41.2995, 69.2401, 'Asia/Tashkent'),
+    ('Almaty', 'Kazakhstan', 'KZ', 43.2220, 76.8512, 'Asia/Almaty'),
+    ('Baku', 'Azerbaijan', 'AZ', 40.4093, 49.8671, 'Asia/Baku'),
+    ('Delhi', 'India', 'IN', 28.7041, 77.1025, 'Asia/Kolkata'),
+    ('Mumbai', 'India', 'IN', 19.0760, 72.8777, 'Asia/Kolkata'),
+    ('Hyderabad', 'India', 'IN', 17.3850, 78.4867, 'Asia/Kolkata'),
+    ('Dhaka', 'Bangladesh', 'BD', 23.8103, 90.4125, 'Asia/Dhaka'),
+    ('Colombo', 'Sri Lanka', 'LK', 6.9271, 79.8612, 'Asia/Colombo'),
+    ('Male', 'Maldives', 'MV', 4.1755, 73.5093, 'Indian/Maldives'),
+    ('Kuala Lumpur', 'Malaysia', 'MY', 3.1390, 101.6869, 'Asia/Kuala_Lumpur'),
+    ('Singapore', 'Singapore', 'SG', 1.3521, 103.8198, 'Asia/Singapore'),
+    ('Jakarta', 'Indonesia', 'ID', -6.2088, 106.8456, 'Asia/Jakarta'),
+    ('Surabaya', 'Indonesia', 'ID', -7.2575, 112.7521, 'Asia/Jakarta'),
+    ('Makassar', 'Indonesia', 'ID', -5.1477, 119.4327, 'Asia/Makassar'),
+    ('Bandar Seri Begawan', 'Brunei', 'BN', 4.9031, 114.9398, 'Asia/Brunei'),
+    ('Manila', 'Philippines', 'PH', 14.5995, 120.9842, 'Asia/Manila'),
+    ('Bangkok', 'Thailand', 'TH', 13.7563, 100.5018, 'Asia/Bangkok'),
+    ('Beijing', 'China', 'CN', 39.9042, 116.4074, 'Asia/Shanghai'),
+    ('Urumqi', 'China', 'CN', 43.8256, 87.6168, 'Asia/Urumqi'),
+    ('Tokyo', 'Japan', 'JP', 35.6895, 139.6917, 'Asia/Tokyo'),
+    ('Seoul', 'South Korea', 'KR', 37.5665, 126.9780, 'Asia/Seoul'),
+    ('Sydney', 'Australia', 'AU', -33.8688, 151.2093, 'Australia/Sydney'),
+    ('Melbourne', 'Australia', 'AU', -37.8136, 144.9631, 'Australia/Melbourne'),
+    ('Perth', 'Australia', 'AU', -31.9505, 115.8605, 'Australia/Perth'),
+    ('Auckland', 'New Zealand', 'NZ', -36.8485, 174.7633, 'Pacific/Auckland'),
+    ('London', 'United Kingdom', 'GB', 51.5074, -0.1278, 'Europe/London'),
+    ('Birmingham', 'United Kingdom', 'GB', 52.4862, -1.8904, 'Europe/London'),
+    ('Manchester', 'United Kingdom', 'GB', 53.4808, -2.2426, 'Europe/London'),
+    ('Dublin', 'Ireland', 'IE', 53.3498, -6.2603, 'Europe/Dublin'),
+    ('Paris', 'France', 'FR', 48.8566, 2.3522, 'Europe/Paris'),
+    ('Marseille', 'France', 'FR', 43.2965, 5.3698, 'Europe/Paris'),
+    ('Brussels', 'Belgium', 'BE', 50.8503, 4.3517, 'Europe/Brussels'),
+    ('Amsterdam', 'Netherlands', 'NL', 52.3676, 4.9041, 'Europe/Amsterdam'),
+    ('Berlin', 'Germany', 'DE', 52.5200, 13.4050, 'Europe/Berlin'),
+    ('Madrid', 'Spain', 'ES', 40.4168, -3.7038, 'Europe/Madrid'),
+    ('Rome', 'Italy', 'IT', 41.9028, 12.4964, 'Europe/Rome'),
+    ('Vienna', 'Austria', 'AT', 48.2082, 16.3738, 'Europe/Vienna'),
+    ('Stockholm', 'Sweden', 'SE', 59.3293, 18.0686, 'Europe/Stockholm'),
+    ('Oslo', 'Norway', 'NO', 59.9139, 10.7522, 'Europe/Oslo'),
+    ('Tromso', 'Norway', 'NO', 69.6492, 18.9553, 'Europe/Oslo'),
+    ('Helsinki', 'Finland', 'FI', 60.1699, 24.9384, 'Europe/Helsinki'),
+    ('Reykjavik', 'Iceland', 'IS', 64.1466, -21.9426, 'Atlantic/Reykjavik'),
+    ('Sarajevo', 'Bosnia and Herzegovina', 'BA', 43.8563, 18.4131, 'Europe/Sarajevo'),
+    ('Moscow', 'Russia', 'RU', 55.7558, 37.6173, 'Europe/Moscow'),
+    ('Kazan', 'Russia', 'RU', 55.7887, 49.1221, 'Europe/Moscow'),
+    ('New York', 'United States', 'US', 40.7128, -74.0060, 'America/New_York'),
+    ('Washington', 'United States', 'US', 38.9072, -77.0369, 'America/New_York'),
+    ('Chicago', 'United States', 'US', 41.8781, -87.6298, 'America/Chicago'),
+    ('Houston', 'United States', 'US', 29.7604, -95.3698, 'America/Chicago'),
+    ('Dearborn', 'United States', 'US', 42.3223, -83.1763, 'America/Detroit'),
+    ('Denver', 'United States', 'US', 39.7392, -104.9903, 'America/Denver'),
+    ('Los Angeles', 'United States', 'US', 34.0522, -118.2437, 'America/Los_Angeles'),
+    ('Toronto', 'Canada', 'CA', 43.6532, -79.3832, 'America/Toronto'),
+    ('Montreal', 'Canada', 'CA', 45.5017, -73.5673, 'America/Toronto'),
+    ('Vancouver', 'Canada', 'CA', 49.2827, -123.1207, 'America/Vancouver'),
+    ('Mexico City', 'Mexico', 'MX', 19.4326, -99.1332, 'America/Mexico_City'),
+    ('Sao Paulo', 'Brazil', 'BR', -23.5505, -46.6333, 'America/Sao_Paulo'),
+    ('Buenos Aires', 'Argentina', 'AR', -34.6037, -58.3816, 'America/Argentina/Buenos_Aires'),
+)
+
+
+# Common short country names -> ISO codes
+COUNTRY_ALIASES = {
+    'uk': 'gb',
+    'england': 'gb',
+    'usa': 'us',
+    'uae': 'ae',
+    'ksa': 'sa'
+}
+
+
+def find_city(city, country=None):
+    """
+    Look up a city by name, optionally restricted to a country
+
+    Names compare case-insensitively; the country may be given by name or
+    ISO code. Returns the CITIES entry or None.
+    """
+    city = city.strip().lower()
+    country = country.strip().lower() if country else None
+    country = COUNTRY_ALIASES.get(country, country)
+    for entry in CITIES:
+        if entry[0].lower() != city:
+            continue
+        if country in (None, entry[1].lower(), entry[2].lower()):
+            return entry
+    return None
@@ -0,0 +1,185 @@
+"""
+Injectable clocks
+
+The service, scheduler, lock manager and notification manager read time,
+sleep and start timers through a clock object. SystemClock is the real
+one; VirtualClock is simulated time that only moves when waited on, so
+simulation.py can replay a year in seconds and tests never sleep.
+"""
+import datetime
+import heapq
+import itertools
+import threading
+import time
+
+
+class SystemClock:
+    """The real wall and monotonic clocks, in the machine's timezone"""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def now(self):
+        """Naive local datetime"""
+        return datetime.datetime.now()
+
+    def today(self):
+        return datetime.date.today()
+
+    def fromtimestamp(self, timestamp):
+        """Naive local datetime of an epoch timestamp"""
+        return datetime.datetime.fromtimestamp(timestamp)
+
+    def timestamp(self, local):
+        """Epoch timestamp of a naive local datetime"""
+        return local.timestamp()
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) after delay seconds on a daemon thread; returns the timer (cancel())"""
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def wait(self, event, timeout=None):
+        """Wait for a threading.Event, like event.wait(timeout)"""
+        return event.wait(timeout)
+
+
+class VirtualTimer:
+    """Handle of a VirtualClock.call_later callback"""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_alive(self):
+        return not self.cancelled and self.callback is not None
+
+
+class VirtualClock:
+    """
+    Simulated time for one thread of control
+
+    Time starts at an epoch timestamp and only moves in sleep(), wait()
+    and advance(), running the call_later timers that fall due on the way
+    in order. Local times are in tz (a tzinfo, UTC by default), standing
+    in for the machine's timezone. jump() moves the wall clock without
+    the monotonic clock, like a sleeping laptop or an NTP correction.
+    """
+
+    def __init__(self, start, tz=None):
+        self.tz = tz or datetime.timezone.utc
+        if isinstance(start, datetime.datetime):
+            start = (start if start.tzinfo else start.replace(tzinfo=self.tz)).timestamp()
+        self._now = float(start)
+        self._monotonic_offset = 1000.0 - self._now  # Monotonic time starts at an arbitrary value
+        self._timers = []
+        self._counter = itertools.count()
+        self._day = (None, 0.0, 0.0)  # (date, start, end) of the last today()
+
+    def time(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now + self._monotonic_offset
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self._now, self.tz).replace(tzinfo=None)
+
+    def today(self):
+        day, start, end = self._day
+        if not start <= self._now < end:
+            day = self.now().date()
+            start = self.timestamp(datetime.datetime.combine(day, datetime.time.min))
+            end = self.timestamp(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+            self._day = (day, start, end)
+        return day
+
+    def fromtimestamp(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, self.tz).replace(tzinfo=None)
+
+    def timestamp(self, local):
+        return local.replace(tzinfo=self.tz).timestamp()
+
+    def call_later(self, delay, callback, *args):
+        timer = VirtualTimer(self._now + max(0.0, delay), callback, args)
+        heapq.heappush(self._timers, (timer.when, next(self._counter), timer))
+        return timer
+
+    def next_timer(self):
+        """Epoch time of the earliest pending timer, or None"""
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def advance_to(self, timestamp, event=None):
+        """
+        Move time forward to timestamp, running due timers in order
+
+        Stops early, at the time of the timer that set event, if one does.
+        Returns True in that case.
+        """
+        while True:
+            when = self.next_timer()
+            if when is None or when > timestamp:
+                break
+            _, _, timer = heapq.heappop(self._timers)
+            self._now = max(self._now, when)
+            callback, timer.callback = timer.callback, None
+            callback(*timer.args)
+            if event is not None and event.is_set():
+                return True
+        self._now = max(self._now, timestamp)
+        return False
+
+    def advance(self, seconds):
+        self.advance_to(self._now + seconds)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def wait(self, event, timeout=None):
+        """
+        Like event.wait(timeout), in virtual time
+
+        Without a timeout, time runs to the next timer that sets the event;
+        if no timer is left it would block forever, which raises
+        RuntimeError instead.
+        """
+        if event.is_set():
+            return True
+        if timeout is None:
+            while self.next_timer() is not None:
+                if self.advance_to(self.next_timer(), event):
+                    return True
+            raise RuntimeError("wait() without timeout would never return in virtual time")
+        return self.advance_to(self._now + timeout, event)
+
+    def jump(self, seconds):
+        """
+        Move the wall clock by seconds (negative: back) without monotonic time
+
+        Seen from the program, a suspend/resume and a clock correction are
+        the same: wall time moves, monotonic time and the timers waiting
+        on it do not.
+        """
+        self._now += seconds
+        self._monotonic_offset -= seconds
+        for _, _, timer in self._timers:
+            timer.when += seconds
+        self._timers = [(timer.when, count, timer) for _, count, timer in self._timers]
+        heapq.heapify(self._timers)
@@ -5,12 +5,30 @@ from datetime import datetime
 class ConfigManager:
     """
     Manages application configuration and user preferences
+    
+    config_file None keeps the configuration in memory only (simulations).
     """
     
     def __init__(self, config_file="prayer_app_config.json"):
         self.config_file = config_file
+        self._listeners = []
         self.config = self._load_config()
     
+    def subscribe(self, callback):
+        """Call callback(section) after a setting changes (section None after a reset)"""
+        self._listeners.append(callback)
+    
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    def _changed(self, section):
+        for callback in list(self._listeners):
+            try:
+                callback(section)
+            except Exception as e:
+                print(f"Error in config listener: {e}")
+    
     def _load_config(self):
         """Load configuration from file or create default"""
         default_config = {
@@ -32,17 +50,24 @@ class ConfigManager:
                 "volume": 0.7,
                 "show_visual_notifications": True,
                 "play_adhan": True,
-                "adhan_volume": 0.8
+                "adhan_volume": 0.8,
+                "event_types": ["fajr", "dhuhr", "asr", "maghrib", "isha"],  # Events that notify
+                "catch_up_policy": "fire_late",  # Events missed while asleep: "fire_late", "notify_only" or "skip"
+                "catch_up_minutes": 15  # Only catch up events at most this late
             },
             "app_settings": {
                 "start_with_windows": True,
                 "minimize_to_tray": True,
-                "check_for_updates": True
+                "check_for_updates": True,
+                "timetable_store": "prayer_times.db",  # SQLite file, "" to disable
+                "event_ledger": "prayer_events.db",  # Fired events, "" to keep them in memory only
+                "precompute_days": 2,  # Days ahead computed or fetched before the midnight rollover
+                "api_url": "http://api.aladhan.com"  # Or a local timetable_server.py node
             },
             "last_updated": datetime.now().isoformat()
         }
         
-        if os.path.exists(self.config_file):
+        if self.config_file and os.path.exists(self.config_file):
             try:
                 with open(self.config_file, 'r') as f:
                     loaded_config = json.load(f)
@@ -69,6 +94,8 @@ class ConfigManager:
         """Save current configuration to file"""
         try:
             self.config["last_updated"] = datetime.now().isoformat()
+            if not self.config_file:
+                return True
             with open(self.config_file, 'w') as f:
                 json.dump(self.config, f, indent=2)
             return True
@@ -88,6 +115,7 @@ class ConfigManager:
             "city": city,
             "country": country
         }
+        self._changed("location")
     
     def get_calculation_method(self):
         """Get the prayer time calculation method"""
@@ -96,6 +124,7 @@ class ConfigManager:
     def set_calculation_method(self, method):
         """Set the prayer time calculation method"""
         self.config["calculation_method"] = method
+        self._changed("calculation_method")
     
     def get_lock_settings(self):
         """Get lock settings"""
@@ -104,6 +133,7 @@ class ConfigManager:
     def set_lock_setting(self, key, value):
         """Set a specific lock setting"""
         self.config["lock_settings"][key] = value
+        self._changed("lock_settings")
     
     def get_notification_settings(self):
         """Get notification settings"""
@@ -112,6 +142,7 @@ class ConfigManager:
     def set_notification_setting(self, key, value):
         """Set a specific notification setting"""
         self.config["notification_settings"][key] = value
+        self._changed("notification_settings")
     
     def get_app_settings(self):
         """Get application settings"""
@@ -120,6 +151,7 @@ class ConfigManager:
     def set_app_setting(self, key, value):
         """Set a specific app setting"""
         self.config["app_settings"][key] = value
+        self._changed("app_settings")
     
     def get_time_format(self):
         """Get time format setting"""
@@ -128,6 +160,7 @@ class ConfigManager:
     def set_time_format(self, time_format):
         """Set time format setting"""
         self.config["time_format"] = time_format
+        self._changed("time_format")
     
     def update_last_used(self):
         """Update the last used timestamp"""
@@ -154,16 +187,24 @@ class ConfigManager:
                 "volume": 0.7,
                 "show_visual_notifications": True,
                 "play_adhan": True,
-                "adhan_volume": 0.8
+                "adhan_volume": 0.8,
+                "event_types": ["fajr", "dhuhr", "asr", "maghrib", "isha"],  # Events that notify
+                "catch_up_policy": "fire_late",  # Events missed while asleep: "fire_late", "notify_only" or "skip"
+                "catch_up_minutes": 15  # Only catch up events at most this late
             },
             "app_settings": {
                 "start_with_windows": True,
                 "minimize_to_tray": True,
-                "check_for_updates": True
+                "check_for_updates": True,
+                "timetable_store": "prayer_times.db",  # SQLite file, "" to disable
+                "event_ledger": "prayer_events.db",  # Fired events, "" to keep them in memory only
+                "precompute_days": 2,  # Days ahead computed or fetched before the midnight rollover
+                "api_url": "http://api.aladhan.com"  # Or a local timetable_server.py node
             },
             "last_updated": datetime.now().isoformat()
         }
         self.config = default_config
+        self._changed(None)
         return self.save_config()
 
 
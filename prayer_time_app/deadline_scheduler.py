@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import threading
+
+from clock import SystemClock
+
+
+class DeadlineScheduler:
+    """
+    Heap of timed events that sleeps until the earliest deadline
+
+    Events are given as epoch timestamps and kept as monotonic deadlines,
+    so a sleep is neither cut short nor stretched by wall clock changes.
+    wait() blocks on a threading.Event until the next deadline, until
+    rearm() is called (new times, settings or date) or until max_wait.
+    Lateness of fired events is kept in stats as scheduling jitter.
+    Time is read and waited on through clock (see clock.py).
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self._heap = []
+        self._counter = itertools.count()  # Tie breaker, keeps equal deadlines in scheduling order
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.stats = {
+            'scheduled': 0,
+            'fired': 0,
+            'wakeups': 0,
+            'rearms': 0,
+            'last_jitter_ms': None,
+            'mean_jitter_ms': 0.0,
+            'max_jitter_ms': 0.0
+        }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def schedule(self, timestamp, name, payload=None):
+        """Add an event due at epoch timestamp; returns its monotonic deadline"""
+        deadline = self.clock.monotonic() + (timestamp - self.clock.time())
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, next(self._counter), timestamp, name, payload))
+            self.stats['scheduled'] += 1
+        return deadline
+
+    def replace(self, events):
+        """Drop all events, schedule (timestamp, name[, payload]) events and wake the waiting thread"""
+        offset = self.clock.monotonic() - self.clock.time()
+        entries = []
+        for event in events:
+            timestamp, name, payload = (tuple(event) + (None,))[:3]
+            entries.append((timestamp + offset, next(self._counter), timestamp, name, payload))
+        heapq.heapify(entries)
+        with self._lock:
+            self._heap = entries
+            self.stats['scheduled'] += len(entries)
+        self.rearm()
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+        self.rearm()
+
+    def rearm(self):
+        """Wake the waiting thread so it recomputes its deadline"""
+        self.stats['rearms'] += 1
+        self._wake.set()
+
+    def next_event(self):
+        """(epoch timestamp, name, seconds until due) of the earliest event, or None"""
+        with self._lock:
+            if not self._heap:
+                return None
+            deadline, _, timestamp, name, _ = self._heap[0]
+        return timestamp, name, deadline - self.clock.monotonic()
+
+    def pop_due(self):
+        """Remove and return the (timestamp, name, payload) events that are due, in deadline order"""
+        now = self.clock.monotonic()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, timestamp, name, payload = heapq.heappop(self._heap)
+                self._record_jitter((now - deadline) * 1000)
+                due.append((timestamp, name, payload))
+        return due
+
+    def _record_jitter(self, jitter_ms):
+        stats = self.stats
+        stats['fired'] += 1
+        stats['last_jitter_ms'] = round(jitter_ms, 3)
+        stats['mean_jitter_ms'] += (jitter_ms - stats['mean_jitter_ms']) / stats['fired']
+        stats['max_jitter_ms'] = max(stats['max_jitter_ms'], jitter_ms)
+
+    def wait(self, max_wait=None):
+        """
+        Sleep until the next deadline, a rearm() or max_wait seconds
+
+        Returns True if woken by rearm().
+        """
+        upcoming = self.next_event()
+        timeout = max_wait
+        if upcoming is not None:
+            timeout = max(0.0, upcoming[2]) if max_wait is None else max(0.0, min(upcoming[2], max_wait))
+        woken = self.clock.wait(self._wake, timeout)
+        self._wake.clear()
+        self.stats['wakeups'] += 1
+        return woken
+
+    def get_stats(self):
+        """Counters and jitter in milliseconds"""
+        stats = dict(self.stats)
+        stats['mean_jitter_ms'] = round(stats['mean_jitter_ms'], 3)
+        stats['max_jitter_ms'] = round(stats['max_jitter_ms'], 3)
+        return stats
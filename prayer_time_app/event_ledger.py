@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+
+class EventLedger:
+    """
+    Persistent ledger of fired prayer events
+
+    Each event is keyed by (date, prayer, source): the date of the
+    timetable the prayer belongs to, its name and the pipeline that fires
+    it (the service uses 'prayer' for the Adhan, notification and lock).
+    claim() records the key and returns True for the first caller only,
+    so an event fires exactly once across re-armed schedules, replaced
+    times, clock slews and restarts. Whether the times came from the
+    offline engine or the API is deliberately not part of the key.
+
+    Rows older than KEEP_DAYS before today (the caller's clock's, or the
+    system date) are pruned when the ledger is opened. Use
+    path ':memory:' for a ledger that only lives as long as the process.
+    The keys are mirrored in memory, so has_fired() never queries; it may
+    miss a claim made by another process, but claim() still refuses it.
+    """
+
+    KEEP_DAYS = 30
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fired_events (
+            date TEXT NOT NULL,
+            prayer TEXT NOT NULL,
+            source TEXT NOT NULL,
+            scheduled_at INTEGER NOT NULL,
+            fired_at REAL NOT NULL,
+            PRIMARY KEY (date, prayer, source)
+        )
+    """
+
+    def __init__(self, path="prayer_events.db", today=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(self.SCHEMA)
+        self._fired = set()  # (date ISO string, prayer, source) keys
+        self.prune((today or date.today()) - timedelta(days=self.KEEP_DAYS))
+        self._fired.update(self._conn.execute("SELECT date, prayer, source FROM fired_events"))
+
+    def claim(self, date_obj, prayer, source, scheduled_at, fired_at=None):
+        """Record an event as fired; True if it had not fired before"""
+        fired_at = time.time() if fired_at is None else fired_at
+        key = (date_obj.isoformat(), prayer, source)
+        with self._lock, self._conn:
+            if key in self._fired:
+                return False
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO fired_events (date, prayer, source, scheduled_at, fired_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                key + (int(scheduled_at), fired_at))
+            self._fired.add(key)
+            return cursor.rowcount == 1
+
+    def has_fired(self, date_obj, prayer, source):
+        return (date_obj.isoformat(), prayer, source) in self._fired
+
+    def fired(self, date_obj, source=None):
+        """Return the (prayer, source, scheduled_at, fired_at) rows of a date in firing order"""
+        query = "SELECT prayer, source, scheduled_at, fired_at FROM fired_events WHERE date = ?"
+        args = [date_obj.isoformat()]
+        if source is not None:
+            query += " AND source = ?"
+            args.append(source)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY fired_at", args).fetchall()
+
+    def prune(self, before):
+        """Delete the events of dates before a date"""
+        before = before.isoformat()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fired_events WHERE date < ?", (before,))
+            self._fired = {key for key in self._fired if key[0] >= before}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
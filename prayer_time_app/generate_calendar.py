@@ -0,0 +1,228 @@
+"""
+Bulk prayer timetable generator
+
+Reads a list of sites from a CSV or JSON file and writes the offline prayer
+times of every day in a year range, spreading the sites across worker
+processes. Results are streamed to the output in site order, so memory use
+stays bounded by the number of chunks in flight.
+
+Sites:
+    CSV with a header row containing lat, lng, tz and optionally method and
+    name columns, or a JSON list of objects with the same keys. tz is a UTC
+    offset in hours or an IANA zone name (e.g. Europe/London), which
+    applies each day's DST offset.
+
+Output formats:
+    csv    - one row per site and date: site, name, date, then every prayer
+             time formatted as HH:MM (or 12h with --time-format 12h)
+    jsonl  - one JSON object per site and date with the same fields
+    binary - the BINARY_MAGIC header followed by fixed size records of
+             BINARY_RECORD: site index (uint32), days since 1970-01-01
+             (int32) and the nine prayer times as float32 hours, NaN when
+             a time is undefined
+
+Example:
+    python generate_calendar.py sites.csv --start-year 2027 --end-year 2028 \\
+        --workers 8 --format csv --output timetables.csv
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import math
+import os
+import struct
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from calculation_params import TIME_NAMES
+from prayer_calculator import PrayerCalculator
+from prayer_times import EPOCH_DATE, format_many
+
+OUTPUT_FORMATS = ('csv', 'jsonl', 'binary')
+
+BINARY_MAGIC = b'PRAYTT1\n'
+BINARY_RECORD = struct.Struct('<Ii' + 'f' * len(TIME_NAMES))
+
+
+def parse_timezone(value):
+    """A UTC offset in hours as a float, or a validated IANA zone name as a str"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"invalid timezone {value!r}")
+    try:
+        ZoneInfo(value.strip())
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone {value!r}")
+    return value.strip()
+
+
+def load_sites(path):
+    """
+    Load sites from a .csv or .json file
+
+    Returns a list of dicts with name, lat, lng, tz and method. Raises
+    ValueError for missing columns, bad numbers, unknown zones or methods.
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError(f"{path}: expected a JSON list of sites")
+        else:
+            rows = list(csv.DictReader(f))
+
+    sites = []
+    for index, row in enumerate(rows):
+        try:
+            method = row.get('method') or 'MWL'
+            if method not in PrayerCalculator.METHODS:
+                raise ValueError(f"unknown method {method!r}")
+            sites.append({
+                'name': str(row.get('name') or index),
+                'lat': float(row['lat']),
+                'lng': float(row['lng']),
+                'tz': parse_timezone(row['tz']),
+                'method': method
+            })
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path}: invalid site {index + 1}: {e}")
+    return sites
+
+
+def compute_chunk(first_index, sites, start_year, end_year, output_format, time_format='24h',
+                  convergence_seconds=None):
+    """
+    Compute and serialize the timetables of a chunk of sites
+
+    Runs in a worker process. Returns the encoded output (str for csv/jsonl,
+    bytes for binary) so formatting is done in parallel too.
+    """
+    start = datetime.date(start_year, 1, 1)
+    end = datetime.date(end_year, 12, 31)
+    text = io.StringIO()
+    binary = bytearray()
+    writer = csv.writer(text, lineterminator='\n') if output_format == 'csv' else None
+
+    for site_index, site in enumerate(sites, first_index):
+        calculator = PrayerCalculator(method=site['method'], coordinates=(site['lat'], site['lng']),
+                                      timezone=site['tz'])
+        calculator.convergence_seconds = convergence_seconds
+        times = calculator.get_times_range(start, end)
+        if output_format == 'binary':
+            columns = [[float(value) for value in times[name]] for name in TIME_NAMES]
+        else:
+            columns = [format_many(times[name], time_format) for name in TIME_NAMES]
+        for day in range((end - start).days + 1):
+            date_obj = start + datetime.timedelta(days=day)
+            values = [column[day] for column in columns]
+            if output_format == 'binary':
+                binary += BINARY_RECORD.pack(site_index, (date_obj - EPOCH_DATE).days, *values)
+                continue
+            formatted = [str(value) for value in values]
+            if output_format == 'csv':
+                writer.writerow([site_index, site['name'], date_obj.isoformat()] + formatted)
+            else:
+                record = {'site': site_index, 'name': site['name'], 'date': date_obj.isoformat()}
+                record.update(zip(TIME_NAMES, formatted))
+                text.write(json.dumps(record) + '\n')
+
+    return bytes(binary) if output_format == 'binary' else text.getvalue()
+
+
+def generate(sites, start_year, end_year, output, output_format='csv', workers=None,
+             chunk_size=16, time_format='24h', convergence_seconds=None):
+    """
+    Write the timetables of all sites to an open output stream
+
+    output is a text stream for csv/jsonl and a binary stream for binary.
+    workers=0 computes in the current process. At most two chunks per
+    worker are in flight, so results are written as they complete.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if end_year < start_year:
+        raise ValueError("end year must not be before start year")
+
+    if output_format == 'csv':
+        output.write(','.join(['site', 'name', 'date'] + list(TIME_NAMES)) + '\n')
+    elif output_format == 'binary':
+        output.write(BINARY_MAGIC)
+
+    chunks = [(first, sites[first:first + chunk_size], start_year, end_year, output_format, time_format,
+               convergence_seconds)
+              for first in range(0, len(sites), chunk_size)]
+
+    if workers == 0:
+        for chunk in chunks:
+            output.write(compute_chunk(*chunk))
+        return len(sites)
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(compute_chunk, *chunk))
+            if len(pending) >= workers * 2:
+                output.write(pending.popleft().result())
+        while pending:
+            output.write(pending.popleft().result())
+    return len(sites)
+
+
+def read_binary(stream):
+    """Yield (site index, date, times dict) records from a binary output stream"""
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a prayer timetable file")
+    while True:
+        record = stream.read(BINARY_RECORD.size)
+        if len(record) < BINARY_RECORD.size:
+            return
+        site_index, days, *values = BINARY_RECORD.unpack(record)
+        yield (site_index, EPOCH_DATE + datetime.timedelta(days=days),
+               {name: value for name, value in zip(TIME_NAMES, values) if not math.isnan(value)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate prayer timetables for many sites")
+    parser.add_argument('sites', help="CSV or JSON file with lat, lng, tz and method per site")
+    parser.add_argument('--start-year', type=int, default=datetime.date.today().year)
+    parser.add_argument('--end-year', type=int, help="Last year to generate (default: start year)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', dest='output_format')
+    parser.add_argument('--output', '-o', default='-', help="Output file (default: stdout)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: CPU count, 0 to run in-process)")
+    parser.add_argument('--chunk-size', type=int, default=16, help="Sites per worker task")
+    parser.add_argument('--time-format', choices=('24h', '12h'), default='24h')
+    parser.add_argument('--convergence-seconds', type=float, default=None,
+                        help="Iterate each calculation until times change by less than this")
+    args = parser.parse_args(argv)
+
+    try:
+        sites = load_sites(args.sites)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    end_year = args.end_year if args.end_year is not None else args.start_year
+    binary = args.output_format == 'binary'
+
+    if args.output == '-':
+        output = sys.stdout.buffer if binary else sys.stdout
+        generate(sites, args.start_year, end_year, output, args.output_format,
+                 args.workers, max(1, args.chunk_size), args.time_format, args.convergence_seconds)
+    else:
+        with open(args.output, 'wb' if binary else 'w', newline='' if not binary else None,
+                  encoding=None if binary else 'utf-8') as output:
+            generate(sites, args.start_year, end_year, output, args.output_format,
+                     args.workers, max(1, args.chunk_size), args.time_format, args.convergence_seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
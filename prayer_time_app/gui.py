@@ -6,11 +6,13 @@ import threading
 from datetime import datetime
 from service import PrayerTimeService
 from config_manager import ConfigManager
+from lazy_import import lazy_import
 
+# The tray icon is only built when the window is closed, so load its libraries then
 try:
-    import pystray
-    from pystray import MenuItem as item
-    from PIL import Image, ImageDraw
+    pystray = lazy_import('pystray')
+    Image = lazy_import('PIL.Image')
+    ImageDraw = lazy_import('PIL.ImageDraw')
     PYSTRAY_AVAILABLE = True
 except ImportError:
     PYSTRAY_AVAILABLE = False
@@ -304,6 +306,7 @@ Version: 1.0
         dc = ImageDraw.Draw(image)
         dc.text((10, 20), 'PT', fill=(255, 255, 255))
         
+        item = pystray.MenuItem
         menu = (item('Show', self.show_from_tray), 
                 item('Emergency Unlock', self.emergency_unlock_from_tray),
                 item('Exit', self.exit_from_tray))
@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from lazy_import import lazy_import
+
+# Imported on the first request, not at startup
+requests = lazy_import('requests')
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the host's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one remote host
+
+    After failure_threshold consecutive failures the breaker opens and
+    requests are refused for reset_timeout seconds. Then a single trial
+    request is let through (half-open): success closes the breaker, failure
+    opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=300, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """Return True if a request may be sent now"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+
+class HttpClient:
+    """
+    Shared HTTP client with connection pooling, timeouts, retries and
+    per-host circuit breakers
+
+    Connection errors, timeouts, 429 and 5xx responses are retried with
+    jittered exponential backoff. A request that still fails counts as one
+    failure for the host's circuit breaker; while the breaker is open, get()
+    raises CircuitOpenError immediately instead of touching the network.
+    """
+
+    RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff_factor=0.5,
+                 max_backoff=5, failure_threshold=3, reset_timeout=300, pool_size=4):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.pool_size = pool_size
+        self._session = None
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._sleep = time.sleep
+
+    @property
+    def session(self):
+        """Pooled requests session, created on first use"""
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                        pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def breaker(self, url):
+        """Return the circuit breaker of the host serving url"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._breakers[host] = breaker
+            return breaker
+
+    def is_available(self, url):
+        """Return False while the breaker of url's host is open"""
+        return self.breaker(url).state != CircuitBreaker.OPEN
+
+    def get(self, url, params=None, **kwargs):
+        """
+        GET url with retries, returning the response
+
+        Raises CircuitOpenError when the host's breaker is open and the last
+        requests exception when every attempt failed to connect.
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep(self._backoff(attempt))
+            try:
+                response = self.session.get(url, params=params, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    breaker.record_failure()
+                    raise
+                continue
+            except Exception:
+                breaker.record_failure()
+                raise
+
+            if response.status_code not in self.RETRY_STATUS:
+                breaker.record_success()
+                return response
+            if attempt == self.retries:
+                breaker.record_failure()
+                return response
+            response.close()
+
+    def _backoff(self, attempt):
+        """Full jitter: a random delay up to the exponential backoff"""
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide shared HttpClient"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
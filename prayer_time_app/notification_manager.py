@@ -1,13 +1,13 @@
-import threading
 import time
-from datetime import datetime
 import os
-import requests
+from clock import SystemClock
+from http_client import get_client
+from lazy_import import lazy_import
 import tempfile
 
-# Try to import pygame, but make it optional
+# Try to import pygame, but make it optional (and load it on first playback)
 try:
-    import pygame
+    pygame = lazy_import('pygame')
     PYGAME_AVAILABLE = True
 except ImportError:
     PYGAME_AVAILABLE = False
@@ -18,15 +18,21 @@ class NotificationManager:
     Manages notifications and Adhan audio playback
     """
 
-    def __init__(self):
-        if PYGAME_AVAILABLE:
-            pygame.mixer.init()
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self.mixer_ready = False  # The mixer is initialised on first playback
         self.current_sound = None
         self.is_playing = False
         self.volume = 0.7  # Default volume (0.0 to 1.0)
         self.adhan_files = {}
         self.notification_callback = None
     
+    def _init_mixer(self):
+        """Initialise the pygame mixer once, on first use"""
+        if not self.mixer_ready:
+            pygame.mixer.init()
+            self.mixer_ready = True
+
     def set_volume(self, volume):
         """Set the volume for audio playback (0.0 to 1.0)"""
         self.volume = max(0.0, min(1.0, volume))  # Clamp between 0.0 and 1.0
@@ -46,6 +52,7 @@ class NotificationManager:
             return False
 
         try:
+            self._init_mixer()
             if self.is_playing and pygame:
                 pygame.mixer.music.stop()
 
@@ -70,7 +77,7 @@ class NotificationManager:
 
                 # Clean up downloaded file if it was temporary
                 if adhan_url.startswith(('http://', 'https://')):
-                    threading.Timer(10, lambda: self._cleanup_temp_file(audio_file)).start()
+                    self.clock.call_later(10, self._cleanup_temp_file, audio_file)
 
                 return True
         except Exception as e:
@@ -97,7 +104,7 @@ class NotificationManager:
         Download audio file from URL to a temporary location
         """
         try:
-            response = requests.get(url)
+            response = get_client().get(url)
             if response.status_code == 200:
                 # Create a temporary file
                 temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
@@ -133,7 +140,7 @@ class NotificationManager:
             # For now, we'll just print the notification
             print(f"NOTIFICATION: {title}")
             print(f"Message: {message}")
-            print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f"Time: {self.clock.now().strftime('%Y-%m-%d %H:%M:%S')}")
             
             # Call the notification callback if set
             if self.notification_callback:
@@ -151,6 +158,7 @@ class NotificationManager:
             return False
 
         try:
+            self._init_mixer()
             if self.is_playing and pygame:
                 pygame.mixer.music.stop()
 
@@ -191,8 +199,9 @@ class NotificationManager:
         Clean up resources
         """
         self.stop_adhan()
-        if PYGAME_AVAILABLE and pygame:
+        if self.mixer_ready:
             pygame.mixer.quit()
+            self.mixer_ready = False
 
 
 # Example usage and testing
@@ -0,0 +1,232 @@
+"""
+Asyncio fetcher for the online (Aladhan) times of many locations
+
+Requests run concurrently up to a semaphore limit, every host is rate
+limited with a token bucket and every request has its own deadline. A
+location whose request fails or times out gets the offline calculation
+instead, so fetch_many always returns one PrayerTimes per site (check the
+result's source).
+
+The HTTP client is a minimal HTTP/1.1 GET over asyncio streams, so no
+extra dependency is needed.
+
+Benchmark against the local stand-in server:
+    python online_fetcher.py --benchmark --sites 2000 --delay 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import ssl
+import time
+from collections import namedtuple
+from urllib.parse import urlencode, urlsplit
+
+import prayer_core
+import timezone_resolver
+from prayer_calculator import PrayerCalculator
+from prayer_times import PrayerTimes
+
+HttpResponse = namedtuple('HttpResponse', ['status', 'headers', 'body'])
+
+
+class RateLimiter:
+    """Token bucket allowing rate requests per second with bursts of up to burst"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def http_get(url, params=None, headers=None):
+    """GET a URL over a new connection, returning an HttpResponse"""
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+    query = '&'.join(filter(None, [parts.query, urlencode(params or {})]))
+    if query:
+        path += '?' + query
+
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, port, ssl=ssl.create_default_context() if secure else None)
+    try:
+        lines = [f"GET {path} HTTP/1.1", f"Host: {parts.netloc}", "Accept: application/json",
+                 "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    break
+                body += await reader.readexactly(size)
+                await reader.readline()
+            body = bytes(body)
+        elif 'content-length' in response_headers:
+            body = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            body = await reader.read()
+        return HttpResponse(status, response_headers, body)
+    finally:
+        writer.close()
+
+
+class AsyncOnlineFetcher:
+    """
+    Fetch online times for many locations concurrently
+
+    Sites are dicts with lat, lng, tz and optionally method (as read by
+    generate_calendar.load_sites); tz is a UTC offset in hours or an IANA
+    zone name, resolved to its offset on the fetched date. Sites sharing a
+    location and method share one calendar request.
+    """
+
+    def __init__(self, api_url=None, concurrency=20, rate_per_host=10.0, burst=None, timeout=10.0):
+        self.api_url = api_url or PrayerCalculator.API_URL
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.stats = {'requests': 0, 'failures': 0, 'timeouts': 0, 'fallbacks': 0}
+        self._calculators = {}
+
+    def _calculator(self, method):
+        """One calculator per method, used for the API mapping and offline fallback"""
+        calculator = self._calculators.get(method)
+        if calculator is None:
+            calculator = PrayerCalculator(method=method, cache_size=0)
+            calculator.API_URL = self.api_url
+            self._calculators[method] = calculator
+        return calculator
+
+    async def fetch_many(self, sites, date_obj):
+        """Return a PrayerTimes for every site on date_obj, in site order"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiters = {}
+        months = {}
+
+        async def fetch_month(calculator, method, lat, lng):
+            key = (round(lat, PrayerCalculator.CACHE_COORD_PRECISION),
+                   round(lng, PrayerCalculator.CACHE_COORD_PRECISION), method)
+            if key not in months:
+                months[key] = asyncio.ensure_future(self._fetch_month(
+                    calculator, method, (lat, lng), date_obj, semaphore, limiters))
+            return await months[key]
+
+        async def fetch_site(site, offset):
+            method = site.get('method') or 'MWL'
+            calculator = self._calculator(method)
+            days = await fetch_month(calculator, method, site['lat'], site['lng'])
+            if days and date_obj.day in days:
+                return PrayerTimes(date_obj, days[date_obj.day], offset, 'online')
+            self.stats['fallbacks'] += 1
+            return self._offline(calculator, site, offset, date_obj)
+
+        # Resolved before any request, so a bad zone fails fast instead of mid-fetch
+        offsets = [self._utc_offset(site, date_obj) for site in sites]
+        return await asyncio.gather(*(fetch_site(site, offset) for site, offset in zip(sites, offsets)))
+
+    async def _fetch_month(self, calculator, method, location, date_obj, semaphore, limiters):
+        """Fetch and parse one calendar month, None on failure or deadline"""
+        url, params = calculator._calendar_request(date_obj.year, date_obj.month, location, method)
+        host = urlsplit(url).netloc
+        if host not in limiters:
+            limiters[host] = RateLimiter(self.rate_per_host, self.burst)
+
+        async with semaphore:
+            await limiters[host].acquire()
+            self.stats['requests'] += 1
+            try:
+                response = await asyncio.wait_for(http_get(url, params), self.timeout)
+                if response.status == 200:
+                    return calculator._parse_month(json.loads(response.body))
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                return None
+            except Exception as e:
+                print(f"Online API failed: {e}")
+        self.stats['failures'] += 1
+        return None
+
+    @staticmethod
+    def _utc_offset(site, date_obj):
+        """UTC offset in hours of a site on date_obj"""
+        if isinstance(site['tz'], str):
+            return timezone_resolver.utc_offset(site['tz'], date_obj)
+        return site['tz']
+
+    def _offline(self, calculator, site, offset, date_obj):
+        jd = prayer_core.julian(date_obj.year, date_obj.month, date_obj.day)
+        hours = prayer_core.compute_day(calculator.params, site['lat'], site['lng'], offset, jd)
+        return PrayerTimes(date_obj, hours, offset, 'offline')
+
+    def run(self, sites, date_obj):
+        """Synchronous wrapper around fetch_many"""
+        return asyncio.run(self.fetch_many(sites, date_obj))
+
+
+def benchmark(num_sites=1000, delay=0.05, concurrency=50, rate_per_host=1000.0):
+    """Fetch random sites from a local stand-in server, returns (sites per second, stats)"""
+    import datetime
+    from timetable_server import TimetableServer
+
+    rng = random.Random(0)
+    sites = [{'lat': rng.uniform(-60, 60), 'lng': rng.uniform(-180, 180), 'tz': 0, 'method': 'MWL'}
+             for _ in range(num_sites)]
+    server = TimetableServer(delay=delay).start()
+    try:
+        fetcher = AsyncOnlineFetcher(server.url, concurrency=concurrency, rate_per_host=rate_per_host)
+        start = time.perf_counter()
+        fetcher.run(sites, datetime.date.today())
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+    return num_sites / elapsed, fetcher.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent online prayer time fetcher")
+    parser.add_argument('--benchmark', action='store_true', help="Measure throughput against a local server")
+    parser.add_argument('--sites', type=int, default=1000)
+    parser.add_argument('--delay', type=float, default=0.05, help="Simulated API latency in seconds")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=1000.0, help="Requests per second per host")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        rate, stats = benchmark(args.sites, args.delay, args.concurrency, args.rate)
+        print(f"{rate:.0f} sites/s {stats}")
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
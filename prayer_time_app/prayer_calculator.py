@@ -1,9 +1,62 @@
 import math
 import json
-import requests
 import datetime
 from datetime import date
-import re
+import threading
+from collections import OrderedDict
+from calculation_params import (CalculationParams,
+                                parse_value, is_minutes)
+from prayer_times import PrayerTimes, format_time
+import prayer_core
+import timezone_resolver
+from http_client import get_client
+from lazy_import import lazy_import
+
+# The vectorized range engine needs numpy, but keep it optional (and out of startup)
+try:
+    np = lazy_import('numpy')
+    prayer_engine = lazy_import('prayer_engine')
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+    prayer_engine = None
+
+class SettingsDict(dict):
+    """
+    Dict that reports in-place changes, so compiled parameters can be rebuilt
+    """
+    
+    def __init__(self, values, on_change):
+        super().__init__(values)
+        self._on_change = on_change
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._on_change()
+    
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._on_change()
+    
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._on_change()
+    
+    def setdefault(self, key, default=None):
+        result = super().setdefault(key, default)
+        self._on_change()
+        return result
+    
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._on_change()
+        return result
+    
+    def clear(self):
+        super().clear()
+        self._on_change()
+
 
 class PrayerCalculator:
     """
@@ -48,17 +101,211 @@ class PrayerCalculator:
         'midnight': 'Standard'
     }
     
-    def __init__(self, method='MWL', coordinates=None, timezone=None):
-        self.method = method
-        self.coordinates = coordinates or (0, 0)  # (latitude, longitude)
-        self.timezone = timezone or 0
-        self.lat = coordinates[0] if coordinates else 0
-        self.lng = coordinates[1] if coordinates else 0
+    # Coordinates are rounded to this many decimals (about 11 m) in cache keys
+    CACHE_COORD_PRECISION = 4
+    
+    # Base URL of the Aladhan API (or a compatible local timetable server)
+    API_URL = "http://api.aladhan.com"
+    
+    # Our methods mapped to Aladhan API method numbers
+    API_METHODS = {
+        'MWL': 3,      # Muslim World League
+        'ISNA': 2,     # ISNA
+        'Egypt': 5,    # Egyptian
+        'Makkah': 4,   # Umm Al-Qura
+        'Karachi': 6,  # University of Islamic Sciences, Karachi
+        'Tehran': 7,   # Institute of Geophysics, University of Tehran
+        'Jafari': 0    # Shia Ithna-Ashari
+    }
+    
+    # Parsed months of the Aladhan calendar kept in memory
+    MONTH_CACHE_SIZE = 6
+    
+    # Prefetch the next month once this many days or fewer are left in the month
+    PREFETCH_DAYS = 3
+    
+    # Offline-first results are replaced when online times differ by more than this many minutes
+    RECONCILE_MINUTES = 2
+    
+    def __init__(self, method='MWL', coordinates=None, timezone=None, cache_size=128, http_client=None,
+                 store=None):
+        self._params = None  # Compiled settings, rebuilt on demand
+        self.http_client = http_client or get_client()  # Shared pooled client for the online API
+        
+        # LRU cache of computed/fetched days shared by all callers
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_size = cache_size
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'month_hits': 0, 'api_requests': 0}
+        
+        # Whole months returned by the calendar API: key -> {day: hours}
+        self._month_cache = OrderedDict()
+        self._prefetching = {}  # Month key -> prefetch thread
+        
+        # Optional persistent TimetableStore, read before computing or fetching
+        self.store = store
+        
+        # Optional precomputed PrayerGrid, used for offline times when it matches
+        self.grid = None
+        
+        # Offline-first mode: change subscribers and days being reconciled online
+        self.reconcile_minutes = self.RECONCILE_MINUTES
+        self._subscribers = []
+        self._reconciling = {}  # Cache key -> reconcile thread
+        
+        self._method = method
+        # (latitude, longitude, timezone), replaced as a whole so every
+        # calculation reads a consistent location without locking
+        self._location = (coordinates[0] if coordinates else 0,
+                          coordinates[1] if coordinates else 0,
+                          timezone or 0)
         self.elv = 0  # Elevation
         self.settings = self._init_settings()
         self.time_format = '24h'
         self.num_iterations = 1
+        # Iterate until times change by less than this many seconds (None: num_iterations passes),
+        # starting from the previous day's solution when computing consecutive days
+        self.convergence_seconds = None
+        self.warm_start = True
+        # Per thread (params, lat, lng, date, solution, previous day's solution) of the
+        # last computed day, so concurrent callers never share a warm start
+        self._warm = threading.local()
+        self.iterations = 0  # Number of main iterations, for benchmarking
         self.offset = {name: 0 for name in self.get_time_names()}
+        self.sun_position_evaluations = 0  # Number of sun position evaluations, for benchmarking
+    
+    @property
+    def lat(self):
+        return self._location[0]
+    
+    @lat.setter
+    def lat(self, lat):
+        self._location = (lat,) + self._location[1:]
+    
+    @property
+    def lng(self):
+        return self._location[1]
+    
+    @lng.setter
+    def lng(self, lng):
+        self._location = (self._location[0], lng, self._location[2])
+    
+    @property
+    def timezone(self):
+        return self._location[2]
+    
+    @timezone.setter
+    def timezone(self, timezone):
+        self._location = self._location[:2] + (timezone,)
+    
+    @property
+    def coordinates(self):
+        """(latitude, longitude)"""
+        return self._location[:2]
+    
+    @property
+    def method(self):
+        return self._method
+    
+    @method.setter
+    def method(self, method):
+        """Change the calculation method and reload its settings"""
+        self._method = method
+        self.settings = self._init_settings()
+        self.clear_cache()
+    
+    @property
+    def settings(self):
+        return self._settings
+    
+    @settings.setter
+    def settings(self, settings):
+        self._settings = SettingsDict(settings, self._invalidate_params)
+        self._invalidate_params()
+    
+    @property
+    def offset(self):
+        return self._offset
+    
+    @offset.setter
+    def offset(self, offset):
+        self._offset = SettingsDict(offset, self._invalidate_params)
+        self._invalidate_params()
+    
+    @property
+    def elv(self):
+        return self._elv
+    
+    @elv.setter
+    def elv(self, elevation):
+        self._elv = elevation
+        self._invalidate_params()
+    
+    @property
+    def params(self):
+        """Numeric parameters compiled from the settings, rebuilt only after a change"""
+        params = self._params
+        if params is None:
+            params = CalculationParams.compile(self._settings, self._elv, self._offset)
+            self._params = params
+        return params
+    
+    def _invalidate_params(self):
+        """Drop the compiled parameters after the method or settings change"""
+        self._params = None
+    
+    def _cache_key(self, source, date_obj, params, location):
+        """Key covering everything a cached day depends on"""
+        lat, lng, timezone = location
+        return (source, self._method, params,
+                round(lat, self.CACHE_COORD_PRECISION), round(lng, self.CACHE_COORD_PRECISION),
+                self._elv, timezone, date_obj, self.time_format, self.num_iterations,
+                self.convergence_seconds)
+    
+    def _cache_get(self, key):
+        """Return a cached PrayerTimes, or None"""
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is None:
+                self.cache_stats['misses'] += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_stats['hits'] += 1
+        return result
+    
+    def _cache_put(self, key, result):
+        """Store a PrayerTimes, evicting the least recently used entries"""
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.cache_stats['evictions'] += 1
+    
+    def clear_cache(self):
+        """Invalidate all cached prayer times"""
+        with self._cache_lock:
+            self._cache.clear()
+            self._month_cache.clear()
+    
+    def cache_info(self):
+        """Return cache hit/miss/eviction counters and current size"""
+        with self._cache_lock:
+            info = dict(self.cache_stats)
+            info['size'] = len(self._cache)
+            info['max_size'] = self.cache_size
+            info['months'] = len(self._month_cache)
+        return info
+    
+    def adjust(self, **settings):
+        """Override calculation settings, e.g. adjust(asr='Hanafi', highLats='AngleBased')"""
+        self.settings.update(settings)
+    
+    def tune(self, **offsets):
+        """Set per-prayer offsets in minutes, e.g. tune(fajr=2, isha=-1)"""
+        self.offset.update(offsets)
         
     def _init_settings(self):
         """Initialize settings based on the selected method"""
@@ -97,72 +344,366 @@ class PrayerCalculator:
         }
     
     def set_location(self, coordinates, timezone):
-        """Set the location and timezone"""
-        self.coordinates = coordinates
-        self.lat = coordinates[0]
-        self.lng = coordinates[1]
-        self.timezone = timezone
+        """
+        Set the location and timezone
+        
+        timezone is a fixed UTC offset in hours or an IANA zone name such as
+        'Europe/London', whose offset (including DST) is applied per date.
+        """
+        self._location = (coordinates[0], coordinates[1], timezone)
+        self.clear_cache()
+    
+    @staticmethod
+    def _local_location(location, date_obj):
+        """location with an IANA zone replaced by its UTC offset on date_obj"""
+        timezone = location[2]
+        if isinstance(timezone, str):
+            return location[:2] + (timezone_resolver.utc_offset(timezone, date_obj),)
+        return location
+    
+    @staticmethod
+    def _day_offsets(location, start, num_days):
+        """UTC offset of every date from start, a list for IANA zones, else the fixed offset"""
+        timezone = location[2]
+        if isinstance(timezone, str):
+            return timezone_resolver.day_offsets(timezone, start, num_days)
+        return timezone
+    
+    def get_prayer_times(self, date_obj=None, source='offline'):
+        """
+        Get the prayer times of a day as a PrayerTimes result
+        
+        source is 'offline' or 'online'; an online request that fails falls
+        back to the offline calculation (check the result's source).
+        'offline-first' never waits for the network, see _get_offline_first.
+        """
+        if date_obj is None:
+            date_obj = datetime.date.today()
+        
+        # Read the settings and location once so concurrent changes cannot mix
+        params, location = self.params, self._local_location(self._location, date_obj)
+        
+        key = self._cache_key(source, date_obj, params, location)
+        result = self._cache_get(key)
+        if result is not None:
+            return result
+        
+        if source == 'offline-first':
+            return self._get_offline_first(key, date_obj, params, location)
+        
+        result = self._store_get(date_obj, date_obj, params, location, source)
+        if result:
+            result = result[0]
+            self._cache_put(key, result)
+            return result
+        
+        if source == 'online':
+            hours = self._fetch_online(date_obj, location)
+            if hours is None:
+                # If online fails, fall back to offline calculation
+                return self.get_prayer_times(date_obj, 'offline')
+        else:
+            hours = self._compute_raw_times(date_obj, params, location)
+        
+        result = PrayerTimes(date_obj, hours, location[2], source)
+        self._cache_put(key, result)
+        self._store_put([result], params, location)
+        return result
+    
+    def _get_offline_first(self, key, date_obj, params, location):
+        """
+        Return known online times or the offline calculation immediately
+        
+        Without online times for the day, the offline result is returned and
+        the online times are fetched in the background. If they differ by more
+        than reconcile_minutes, they replace the cached result and subscribers
+        are called with (date, old PrayerTimes, new PrayerTimes).
+        """
+        online = self._store_get(date_obj, date_obj, params, location, 'online')
+        if online:
+            self._cache_put(key, online[0])
+            return online[0]
+        
+        # A month already fetched or prefetched answers without the network
+        with self._cache_lock:
+            month = self._month_cache.get(self._month_key(date_obj.year, date_obj.month, location))
+        if month and date_obj.day in month:
+            result = PrayerTimes(date_obj, month[date_obj.day], location[2], 'online')
+            self._cache_put(key, result)
+            return result
+        
+        result = self.get_prayer_times(date_obj, 'offline')
+        self._cache_put(key, result)
+        
+        with self._cache_lock:
+            if key in self._reconciling:
+                return result
+            thread = threading.Thread(target=self._reconcile, args=(key, date_obj, params, location, result),
+                                      daemon=True)
+            self._reconciling[key] = thread
+        thread.start()
+        return result
+    
+    def _reconcile(self, key, date_obj, params, location, offline):
+        """Background part of offline-first: fetch online times and replace differing results"""
+        try:
+            online = self.get_prayer_times(date_obj, 'online')
+            current = self._local_location(self._location, date_obj)
+            if online.source != 'online' or (params, location) != (self.params, current):
+                return
+            if self.max_difference(offline, online) <= self.reconcile_minutes:
+                return
+            self._cache_put(key, online)
+            for callback in list(self._subscribers):
+                try:
+                    callback(date_obj, offline, online)
+                except Exception as e:
+                    print(f"Error in prayer times subscriber: {e}")
+        finally:
+            with self._cache_lock:
+                self._reconciling.pop(key, None)
+    
+    @staticmethod
+    def max_difference(times1, times2):
+        """Largest difference in minutes between the prayers two PrayerTimes share"""
+        difference = 0
+        for name, time1 in times1.hours.items():
+            time2 = times2.hours.get(name)
+            if time2 is None or math.isnan(time1) or math.isnan(time2):
+                continue
+            minutes = abs(time1 - time2) * 60 % 1440
+            difference = max(difference, min(minutes, 1440 - minutes))
+        return difference
+    
+    def subscribe(self, callback):
+        """Call callback(date, old, new) when offline-first times are replaced by online ones"""
+        self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+    
+    def set_grid(self, grid):
+        """
+        Answer offline times from a precomputed PrayerGrid (or grid file path)
+        
+        The grid is only used while the settings match the ones it was built
+        with; days it cannot interpolate within tolerance are computed
+        exactly. Pass None to compute every day exactly again.
+        """
+        if isinstance(grid, str):
+            from prayer_grid import PrayerGrid
+            grid = PrayerGrid(grid)
+        self.grid = grid
+        self.clear_cache()
+    
+    def _grid_for(self, params):
+        """The grid if it was built for these parameters, else None"""
+        grid = self.grid
+        if grid is not None and self.convergence_seconds is None and grid.matches(params, self.num_iterations):
+            return grid
+        return None
+    
+    def _store_settings(self, params):
+        """Fingerprint of everything offline times depend on besides location and date"""
+        settings = f"{params.fingerprint()}:{self.num_iterations}"
+        if self.convergence_seconds is not None:
+            settings += f":{self.convergence_seconds}s"
+        if self._grid_for(params) is not None:
+            settings += ":grid"
+        return settings
+    
+    def _store_get(self, start, end, params, location, source):
+        """Read matching days from the persistent store, [] without a store"""
+        if self.store is None:
+            return []
+        try:
+            return self.store.get_range(location[0], location[1], self._method, start, end,
+                                        timezone=location[2], source=source,
+                                        settings=self._store_settings(params))
+        except Exception as e:
+            print(f"Timetable store read failed: {e}")
+            return []
+    
+    def _store_put(self, results, params, location):
+        """Write PrayerTimes results to the persistent store, if any"""
+        if self.store is None:
+            return
+        try:
+            self.store.put_many(location[0], location[1], self._method, results,
+                                self._store_settings(params))
+        except Exception as e:
+            print(f"Timetable store write failed: {e}")
     
+    def get_stored_range(self, start, end):
+        """
+        Get offline PrayerTimes for every date from start to end (inclusive)
+        
+        Days already in the store are read in one query; the missing ones are
+        computed with get_times_range and written back in one transaction.
+        """
+        if end < start:
+            raise ValueError("end date must not be before start date")
+        params, location = self.params, self._location
+        offsets = self._day_offsets(location, start, (end - start).days + 1)
+        if isinstance(offsets, list):
+            # Offsets vary by date: read every row and keep those with the day's offset
+            stored = {times.date: times
+                      for times in self._store_get(start, end, params, location[:2] + (None,), 'offline')
+                      if times.timezone == offsets[(times.date - start).days]}
+        else:
+            stored = {times.date: times for times in self._store_get(start, end, params, location, 'offline')}
+        
+        missing = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)
+                   if start + datetime.timedelta(days=i) not in stored]
+        if missing:
+            times = self.get_times_range(missing[0], missing[-1])
+            names = self.get_time_names()
+            computed = []
+            for index in range((missing[-1] - missing[0]).days + 1):
+                date_obj = missing[0] + datetime.timedelta(days=index)
+                if date_obj not in stored:
+                    hours = {name: float(times[name][index]) for name in names}
+                    timezone = self._local_location(location, date_obj)[2]
+                    stored[date_obj] = PrayerTimes(date_obj, hours, timezone, 'offline')
+                    computed.append(stored[date_obj])
+            self._store_put(computed, params, location)
+        
+        return [stored[date_obj] for date_obj in sorted(stored)]
+
+    def precompute(self, start, end):
+        """
+        Compute the offline times from start to end (inclusive) in one pass
+        and put them in the cache, so get_prayer_times(date, 'offline')
+        answers them without computing; returns the PrayerTimes
+
+        The cache is grown to hold the whole range.
+        """
+        results = self.get_stored_range(start, end)
+        params, location = self.params, self._location
+        self.cache_size = max(self.cache_size, len(results))
+        for times in results:
+            key = self._cache_key('offline', times.date, params, location[:2] + (times.timezone,))
+            self._cache_put(key, times)
+        return results
+
     def get_times_online(self, date_obj=None):
         """
         Get prayer times using online API (Aladhan)
         """
-        if date_obj is None:
-            date_obj = datetime.date.today()
-            
+        times = self.get_prayer_times(date_obj, 'online')
+        if times.source == 'online':
+            return dict(times.hours)
+        return times.formatted(self.time_format)
+    
+    def _fetch_online(self, date_obj, location):
+        """Return one day of online times from its cached month, None on failure"""
+        month = self._get_online_month(date_obj.year, date_obj.month, location)
+        
+        # Near the end of the month, fetch the next one in the background
+        next_month = (date_obj.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        if (next_month - date_obj).days <= self.PREFETCH_DAYS:
+            self.prefetch_month(next_month.year, next_month.month, location)
+        
+        return dict(month[date_obj.day]) if month and date_obj.day in month else None
+    
+    def _month_key(self, year, month, location):
+        return (round(location[0], self.CACHE_COORD_PRECISION), round(location[1], self.CACHE_COORD_PRECISION),
+                self._get_api_method(), year, month)
+    
+    def _get_online_month(self, year, month, location):
+        """Return the parsed month {day: hours}, fetching it once, or None on failure"""
+        key = self._month_key(year, month, location)
+        with self._cache_lock:
+            days = self._month_cache.get(key)
+            if days is not None:
+                self._month_cache.move_to_end(key)
+                self.cache_stats['month_hits'] += 1
+                return days
+        
+        days = self._fetch_online_month(year, month, location)
+        if days:
+            with self._cache_lock:
+                self._month_cache[key] = days
+                while len(self._month_cache) > self.MONTH_CACHE_SIZE:
+                    self._month_cache.popitem(last=False)
+        return days
+    
+    def prefetch_month(self, year, month, location=None):
+        """Fetch a month of online times in a background thread if not cached yet"""
+        location = location or self._location
+        key = self._month_key(year, month, location)
+        with self._cache_lock:
+            if key in self._month_cache or key in self._prefetching:
+                return self._prefetching.get(key)
+            thread = threading.Thread(target=self._prefetch, args=(key, year, month, location), daemon=True)
+            self._prefetching[key] = thread
+        thread.start()
+        return thread
+    
+    def _prefetch(self, key, year, month, location):
         try:
-            # Using Aladhan API
-            url = f"http://api.aladhan.com/v1/calendar/{date_obj.day}/{date_obj.month}/{date_obj.year}"
-            params = {
-                'latitude': self.lat,
-                'longitude': self.lng,
-                'method': self._get_api_method()
-            }
+            self._get_online_month(year, month, location)
+        finally:
+            with self._cache_lock:
+                self._prefetching.pop(key, None)
+    
+    def _fetch_online_month(self, year, month, location):
+        """Fetch a whole month from the Aladhan calendar API, returns None on failure"""
+        try:
+            url, params = self._calendar_request(year, month, location)
             
-            response = requests.get(url, params=params)
+            if not self.http_client.is_available(url):
+                # API failed repeatedly, use the offline engine until the breaker resets
+                return None
+            
+            with self._cache_lock:
+                self.cache_stats['api_requests'] += 1
+            response = self.http_client.get(url, params=params)
             if response.status_code == 200:
-                data = response.json()
-                if data.get('code') == 200:
-                    # Extract today's prayer times
-                    for item in data['data']:
-                        if item['date']['gregorian']['day'] == str(date_obj.day):
-                            times = item['timings']
-                            # Format to our standard
-                            result = {
-                                'fajr': self._parse_time(times['Fajr']),
-                                'sunrise': self._parse_time(times['Sunrise']),
-                                'dhuhr': self._parse_time(times['Dhuhr']),
-                                'asr': self._parse_time(times['Asr']),
-                                'maghrib': self._parse_time(times['Maghrib']),
-                                'isha': self._parse_time(times['Isha']),
-                            }
-                            return result
+                return self._parse_month(response.json())
         except Exception as e:
             print(f"Online API failed: {e}")
-            # Fall back to offline calculation
-            return self.get_times_offline(date_obj)
-        
-        # If online fails, fall back to offline calculation
-        return self.get_times_offline(date_obj)
-    
-    def _get_api_method(self):
-        """Map our method to Aladhan API method numbers"""
-        method_map = {
-            'MWL': 3,      # Muslim World League
-            'ISNA': 2,     # ISNA
-            'Egypt': 5,    # Egyptian
-            'Makkah': 4,   # Umm Al-Qura
-            'Karachi': 6,  # University of Islamic Sciences, Karachi
-            'Tehran': 7,   # Institute of Geophysics, University of Tehran
-            'Jafari': 0    # Shia Ithna-Ashari
+        
+        return None
+    
+    def _calendar_request(self, year, month, location, method=None):
+        """URL and query parameters of the Aladhan calendar request for a month"""
+        url = f"{self.API_URL}/v1/calendar/{year}/{month}"
+        params = {
+            'latitude': location[0],
+            'longitude': location[1],
+            'method': self._get_api_method(method)
         }
-        return method_map.get(self.method, 3)  # Default to MWL
+        return url, params
+    
+    def _parse_month(self, data):
+        """Parse a calendar response into {day: hours}, None if it is an error response"""
+        if data.get('code') != 200:
+            return None
+        days = {}
+        for item in data['data']:
+            times = item['timings']
+            # Gregorian day is zero padded ("01")
+            days[int(item['date']['gregorian']['day'])] = {
+                'fajr': self._parse_time(times['Fajr']),
+                'sunrise': self._parse_time(times['Sunrise']),
+                'dhuhr': self._parse_time(times['Dhuhr']),
+                'asr': self._parse_time(times['Asr']),
+                'maghrib': self._parse_time(times['Maghrib']),
+                'isha': self._parse_time(times['Isha']),
+            }
+        return days
+    
+    def _get_api_method(self, method=None):
+        """Map our method (default: the calculator's) to Aladhan API method numbers"""
+        return self.API_METHODS.get(method or self.method, 3)  # Default to MWL
     
     def _parse_time(self, time_str):
         """Parse time string from API to float hour"""
         try:
-            # Format is "HH:MM" or "HH:MM:SS"
-            parts = time_str.split(':')
+            # Format is "HH:MM", "HH:MM:SS" or "HH:MM (TZ)"
+            parts = time_str.split()[0].split(':')
             hour = int(parts[0])
             minute = int(parts[1])
             return hour + minute/60.0
@@ -174,195 +715,82 @@ class PrayerCalculator:
         Get prayer times using offline astronomical calculations
         Based on the praytimes.js algorithm
         """
-        if date_obj is None:
-            date_obj = datetime.date.today()
-            
-        year, month, day = date_obj.year, date_obj.month, date_obj.day
-        
-        # Calculate Julian date
-        self.j_date = self.julian(year, month, day) - self.lng / (15 * 24.0)
-        
-        # Initial prayer times
-        times = {
-            'imsak': 5,
-            'fajr': 5,
-            'sunrise': 6,
-            'dhuhr': 12,
-            'asr': 13,
-            'sunset': 18,
-            'maghrib': 18,
-            'isha': 18
-        }
-        
-        # Main iterations
-        for i in range(self.num_iterations):
-            times = self._compute_prayer_times(times)
-        
-        times = self._adjust_times(times)
-        
-        # Add midnight time
-        if self.settings['midnight'] == 'Jafari':
-            times['midnight'] = times['sunset'] + self._time_diff(times['sunset'], times['fajr']) / 2
-        else:
-            times['midnight'] = times['sunset'] + self._time_diff(times['sunset'], times['sunrise']) / 2
-        
-        times = self._tune_times(times)
-        
-        # Convert to formatted time strings
-        formatted_times = {}
-        for name, value in times.items():
-            formatted_times[name] = self._get_formatted_time(value, self.time_format)
-        
-        return formatted_times
-    
-    def _compute_prayer_times(self, times):
-        """Compute prayer times at given julian date"""
-        params = self.settings
-        imsak = self._sun_angle_time(self._eval(params.get('imsak', '10 min')), times['imsak'], 'ccw')
-        fajr = self._sun_angle_time(self._eval(params.get('fajr', 18)), times['fajr'], 'ccw')
-        sunrise = self._sun_angle_time(self._rise_set_angle(self.elv), times['sunrise'], 'ccw')
-        dhuhr = self._mid_day(times['dhuhr'])
-        asr = self._asr_time(self._asr_factor(params.get('asr', 'Standard')), times['asr'])
-        sunset = self._sun_angle_time(self._rise_set_angle(self.elv), times['sunset'])
-        maghrib = self._sun_angle_time(self._eval(params.get('maghrib', '0 min')), times['maghrib'])
-        isha = self._sun_angle_time(self._eval(params.get('isha', 17)), times['isha'])
-
-        return {
-            'imsak': imsak,
-            'fajr': fajr,
-            'sunrise': sunrise,
-            'dhuhr': dhuhr,
-            'asr': asr,
-            'sunset': sunset,
-            'maghrib': maghrib,
-            'isha': isha
-        }
+        return self.get_prayer_times(date_obj, 'offline').formatted(self.time_format)
     
-    def _adjust_times(self, times):
-        """Adjust times in a prayer time array"""
-        params = self.settings
-        tz_adjust = self.timezone - self.lng / 15.0
-        
-        for t, v in times.items():
-            times[t] += tz_adjust
-        
-        if params['highLats'] != 'None':
-            times = self._adjust_high_lats(times)
-        
-        if self._is_min(params['imsak']):
-            times['imsak'] = times['fajr'] - self._eval(params['imsak']) / 60.0
+    def get_times_range(self, start, end):
+        """
+        Get offline prayer times for every date from start to end (inclusive)
         
-        if self._is_min(params['maghrib']):
-            times['maghrib'] = times['sunset'] - self._eval(params['maghrib']) / 60.0
+        Returns a columnar dict: 'date' holds the dates and every prayer name
+        holds the float hours for those dates, as computed by get_times_offline
+        before formatting. Uses the vectorized numpy engine when available.
+        """
+        num_days = (end - start).days + 1
+        if num_days <= 0:
+            raise ValueError("end date must not be before start date")
         
-        if self._is_min(params['isha']):
-            times['isha'] = times['maghrib'] - self._eval(params['isha']) / 60.0
+        if not NUMPY_AVAILABLE:
+            # Fall back to one scalar calculation per day
+            dates = [start + datetime.timedelta(days=i) for i in range(num_days)]
+            result = {'date': dates}
+            for name in self.get_time_names():
+                result[name] = []
+            params, location = self.params, self._location
+            for date_obj in dates:
+                local = self._local_location(location, date_obj)
+                for name, value in self._compute_raw_times(date_obj, params, local).items():
+                    result[name].append(value)
+            return result
         
-        times['dhuhr'] += self._eval(params['dhuhr']) / 60.0
-        return times
-    
-    def _adjust_high_lats(self, times):
-        """Adjust times for locations in higher latitudes"""
-        params = self.settings
-        night_time = self._time_diff(times['sunset'], times['sunrise'])
-        
-        times['imsak'] = self._adjust_hl_time(times['imsak'], times['sunrise'], 
-                                             self._eval(params['imsak']), night_time, 'ccw')
-        times['fajr'] = self._adjust_hl_time(times['fajr'], times['sunrise'], 
-                                            self._eval(params['fajr']), night_time, 'ccw')
-        times['isha'] = self._adjust_hl_time(times['isha'], times['sunset'], 
-                                            self._eval(params['isha']), night_time)
-        times['maghrib'] = self._adjust_hl_time(times['maghrib'], times['sunset'], 
-                                               self._eval(params['maghrib']), night_time)
-        return times
-    
-    def _adjust_hl_time(self, time, base, angle, night, direction=None):
-        """Adjust a time for higher latitudes"""
-        portion = self._night_portion(angle, night)
-        diff = self._time_diff(time, base) if direction == 'ccw' else self._time_diff(base, time)
+        lat, lng = self._location[:2]
+        timezone = np.asarray(self._day_offsets(self._location, start, num_days), dtype=np.float64)
+        jd = prayer_engine.julian_days(self.julian(start.year, start.month, start.day), num_days)
+        result = {'date': np.arange(start, end + datetime.timedelta(days=1), dtype='datetime64[D]')}
+        stats = {}
+        result.update(prayer_engine.compute_times(self.params, lat, lng, timezone, jd,
+                                                  self.num_iterations, self.convergence_seconds, stats))
+        with self._cache_lock:
+            self.iterations += stats['iterations']
+        return result
+    
+    def _compute_raw_times(self, date_obj, params, location):
+        """Compute the prayer times of a date as float hours"""
+        lat, lng, timezone = location
+        grid = self._grid_for(params)
+        if grid is not None:
+            times = grid.lookup(lat, lng, timezone, date_obj)
+            if not any(math.isnan(value) for value in times.values()):
+                return times
         
-        if math.isnan(time) or diff > portion:
-            time = base + (-portion if direction == 'ccw' else portion)
-        return time
-    
-    def _night_portion(self, angle, night):
-        """The night portion used for adjusting times in higher latitudes"""
-        method = self.settings['highLats']
-        portion = 1/2.0  # midnight
+        tolerance = self.convergence_seconds
+        initial = previous = None
+        last = getattr(self._warm, 'last_solution', None)
+        if tolerance is not None and last is not None and last[:3] == (params, lat, lng) and \
+                last[3] == date_obj - datetime.timedelta(days=1):
+            # The day after the last computed one: warm start from the last two solutions
+            previous = last[4]
+            if self.warm_start:
+                initial = prayer_core.extrapolate(last[4], last[5])
         
-        if method == 'AngleBased':
-            portion = 1/60.0 * angle
-        elif method == 'OneSeventh':
-            portion = 1/7.0
+        stats = {}
+        jd = prayer_core.julian(date_obj.year, date_obj.month, date_obj.day)
+        times = prayer_core.compute_day(params, lat, lng, timezone, jd, self.num_iterations, stats,
+                                        tolerance, initial)
+        if tolerance is not None:
+            self._warm.last_solution = (params, lat, lng, date_obj, stats['solution'], previous)
         
-        return portion * night
-    
-    def _tune_times(self, times):
-        """Apply offsets to the times"""
-        for name, value in times.items():
-            times[name] += self.offset[name] / 60.0
+        with self._cache_lock:
+            self.sun_position_evaluations += stats['sun_position_evaluations']
+            self.iterations += stats['iterations']
         return times
     
     def _get_formatted_time(self, time, format_type):
         """Convert float time to the given format"""
-        if math.isnan(time):
-            return '-----'
-        
-        time = self._fixhour(time + 0.5/60)  # Add 0.5 minutes to round
-        hours = int(time)
-        minutes = int((time - hours) * 60)
-        
-        if format_type == "24h":
-            return f"{hours:02d}:{minutes:02d}"
-        else:  # 12h format
-            suffix = 'AM' if hours < 12 else 'PM'
-            display_hour = hours % 12
-            if display_hour == 0:
-                display_hour = 12
-            return f"{display_hour}:{minutes:02d} {suffix}"
-    
-    def _mid_day(self, time):
-        """Compute mid-day time"""
-        eqt = self._sun_position(self.j_date + time)[1]
-        return self._fixhour(12 - eqt)
-    
-    def _sun_angle_time(self, angle, time, direction=None):
-        """Compute the time at which sun reaches a specific angle below horizon"""
-        try:
-            decl = self._sun_position(self.j_date + time)[0]
-            noon = self._mid_day(time)
-            t = 1/15.0 * self._arccos((-self._sin(angle) - self._sin(decl) * self._sin(self.lat)) / 
-                                     (self._cos(decl) * self._cos(self.lat)))
-            return noon + (-t if direction == 'ccw' else t)
-        except ValueError:
-            return float('nan')
-    
-    def _asr_time(self, factor, time):
-        """Compute asr time"""
-        decl = self._sun_position(self.j_date + time)[0]
-        angle = -self._arccot(factor + self._tan(abs(self.lat - decl)))
-        return self._sun_angle_time(angle, time)
-    
-    def _sun_position(self, jd):
-        """Compute declination angle of sun and equation of time"""
-        D = jd - 2451545.0
-        g = self._fixangle(357.529 + 0.98560028 * D)
-        q = self._fixangle(280.459 + 0.98564736 * D)
-        L = self._fixangle(q + 1.915 * self._sin(g) + 0.020 * self._sin(2*g))
-        e = 23.439 - 0.00000036 * D
-        RA = self._arctan2(self._cos(e) * self._sin(L), self._cos(L)) / 15.0
-        eqt = q/15.0 - self._fixhour(RA)
-        decl = self._arcsin(self._sin(e) * self._sin(L))
-        return (decl, eqt)
+        return format_time(time, format_type)
     
     def julian(self, year, month, day):
         """Convert Gregorian date to Julian day"""
-        if month <= 2:
-            year -= 1
-            month += 12
-        A = int(year / 100)
-        B = 2 - A + int(A / 4)
-        return int(365.25 * (year + 4716)) + int(30.6001 * (month + 1)) + day + B - 1524.5
+        return prayer_core.julian(year, month, day)
     
     def _asr_factor(self, asr_param):
         """Get asr shadow factor"""
@@ -376,58 +804,57 @@ class PrayerCalculator:
         elevation = 0 if elevation is None else elevation
         return 0.833 + 0.0347 * math.sqrt(elevation)
     
-    def _time_diff(self, time1, time2):
-        """Compute the difference between two times"""
-        return self._fixhour(time2 - time1)
-    
     def _eval(self, st):
         """Convert given string into a number"""
-        if isinstance(st, (int, float)):
-            return float(st)
-        
-        val = re.split('[^0-9.+-]', str(st), 1)[0]
-        return float(val) if val else 0
+        return parse_value(st)
     
     def _is_min(self, arg):
         """Detect if input contains 'min'"""
-        return isinstance(arg, str) and 'min' in arg
-    
-    #----------------- Degree-Based Math Functions -------------------
-    def _sin(self, d):
-        return math.sin(math.radians(d))
-    
-    def _cos(self, d):
-        return math.cos(math.radians(d))
-    
-    def _tan(self, d):
-        return math.tan(math.radians(d))
-    
-    def _arcsin(self, x):
-        return math.degrees(math.asin(x))
-    
-    def _arccos(self, x):
-        return math.degrees(math.acos(x))
-    
-    def _arctan(self, x):
-        return math.degrees(math.atan(x))
-    
-    def _arccot(self, x):
-        return math.degrees(math.atan(1.0/x))
-    
-    def _arctan2(self, y, x):
-        return math.degrees(math.atan2(y, x))
-    
-    def _fixangle(self, angle):
-        return self._fix(angle, 360.0)
-    
-    def _fixhour(self, hour):
-        return self._fix(hour, 24.0)
-    
-    def _fix(self, a, mode):
-        if math.isnan(a):
-            return a
-        a = a - mode * (math.floor(a / mode))
-        return a + mode if a < 0 else a
+        return is_minutes(arg)
+
+
+def compute_batch(latitudes, longitudes, timezones, date_obj=None, method='MWL'):
+    """
+    Compute offline prayer times for many locations at once
+    
+    latitudes, longitudes and timezones are broadcast against each other;
+    timezones are UTC offsets in hours or IANA zone names, whose offsets are
+    applied per date. date_obj is a single date or a sequence of dates. Returns float hours as
+    an array of shape (locations, events) for a single date, or
+    (dates, locations, events) for a sequence; events are ordered as
+    prayer_engine.TIME_NAMES.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy is required for batch computation")
+    
+    if date_obj is None:
+        date_obj = datetime.date.today()
+    
+    calculator = PrayerCalculator(method=method)
+    
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    timezones = np.asarray(timezones)
+    
+    single_date = isinstance(date_obj, datetime.date)
+    dates = [date_obj] if single_date else list(date_obj)
+    jd = np.array([calculator.julian(d.year, d.month, d.day) for d in dates], dtype=np.float64)
+    ndim = max(latitudes.ndim, longitudes.ndim, timezones.ndim)
+    jd = jd.reshape((len(dates),) + (1,) * ndim)
+    
+    if timezones.dtype.kind in 'UO':
+        # Offsets of every distinct zone on every date, from the cached transitions
+        zones, inverse = np.unique(timezones, return_inverse=True)
+        table = np.array([[timezone_resolver.utc_offset(zone, d) for zone in zones] for d in dates])
+        timezones = table[:, inverse.ravel()].reshape((len(dates),) + (1,) * (ndim - timezones.ndim) +
+                                                      timezones.shape)
+    else:
+        timezones = timezones.astype(np.float64)
+    
+    times = prayer_engine.compute_times(calculator.params, latitudes, longitudes, timezones, jd,
+                                        calculator.num_iterations)
+    result = np.stack([times[name] for name in prayer_engine.TIME_NAMES], axis=-1)
+    return result[0] if single_date else result
 
 
 # Example usage and testing
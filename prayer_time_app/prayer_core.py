@@ -0,0 +1,325 @@
+import math
+
+from calculation_params import HighLatsMethod, MidnightMethod
+
+# Initial guesses for the main iterations
+INITIAL_TIMES = {
+    'imsak': 5,
+    'fajr': 5,
+    'sunrise': 6,
+    'dhuhr': 12,
+    'asr': 13,
+    'sunset': 18,
+    'maghrib': 18,
+    'isha': 18
+}
+
+# Upper bound on the main iterations when iterating to a tolerance
+MAX_ITERATIONS = 10
+
+# Warm start guesses closer than this many hours to solar midnight or noon are not used
+WARM_START_MARGIN = 3.0
+
+
+class SolarState:
+    """
+    Per-day solar state shared by all prayers of one offline calculation
+
+    Declination and equation of time only depend on the Julian date, and the
+    prayers of a day are computed from a handful of distinct time guesses.
+    Each distinct guess is evaluated once and reused by every prayer.
+    """
+
+    def __init__(self, j_date):
+        self.j_date = j_date
+        self.positions = {}
+        self.evaluations = 0  # Number of sun_position evaluations, for benchmarking
+
+    def sun_position(self, time):
+        """Return (declination, equation of time) at the given time guess"""
+        position = self.positions.get(time)
+        if position is None:
+            position = sun_position(self.j_date + time)
+            self.positions[time] = position
+            self.evaluations += 1
+        return position
+
+
+def compute_day(params, lat, lng, timezone, jd, num_iterations=1, stats=None, tolerance=None, initial=None):
+    """
+    Compute the prayer times of one day as float hours
+
+    Pure function of its arguments: params is a CalculationParams, jd the
+    Julian day of the date (see julian()). Nothing is shared between calls,
+    so it is safe to run from thread pools and process pools.
+
+    With a tolerance in seconds, the main iterations run at least
+    num_iterations times and continue until no time changes by more than
+    the tolerance (at most MAX_ITERATIONS). initial replaces the initial
+    guesses (warm start), e.g. with extrapolate() of the previous days'
+    stats['solution']; see warm_start_guesses for which ones are used.
+
+    If a stats dict is given, it receives the number of sun position
+    evaluations, the number of iterations and the solution of the main
+    iterations (before timezone and other adjustments).
+    """
+    # Calculate Julian date and share the sun positions of this day
+    solar = SolarState(jd - lng / (15 * 24.0))
+
+    times = dict(INITIAL_TIMES)
+    if initial:
+        times.update(warm_start_guesses(initial))
+
+    # Main iterations
+    iterations = 0
+    converged = tolerance is None
+    while iterations < num_iterations or not (converged or iterations >= MAX_ITERATIONS):
+        previous, times = times, _compute_prayer_times(params, lat, solar, times)
+        iterations += 1
+        if tolerance is not None:
+            converged = max_change(previous, times) <= tolerance / 3600.0
+
+    if stats is not None:
+        stats['iterations'] = iterations
+        stats['solution'] = dict(times)
+
+    times = _adjust_times(params, lng, timezone, times)
+
+    # Add midnight time
+    if params.midnight is MidnightMethod.JAFARI:
+        times['midnight'] = times['sunset'] + time_diff(times['sunset'], times['fajr']) / 2
+    else:
+        times['midnight'] = times['sunset'] + time_diff(times['sunset'], times['sunrise']) / 2
+
+    if stats is not None:
+        stats['sun_position_evaluations'] = solar.evaluations
+
+    return _tune_times(params, times)
+
+
+def warm_start_guesses(solution):
+    """
+    Initial guesses taken from a neighbouring day's solution
+
+    Near the high latitude limits, whether a time is defined depends on the
+    guess, so times within WARM_START_MARGIN hours of solar midnight or
+    noon (and undefined ones) keep their INITIAL_TIMES guess. That keeps
+    warm started results within the tolerance of cold started ones.
+    """
+    guesses = {}
+    for name, value in solution.items():
+        if name not in INITIAL_TIMES or math.isnan(value):
+            continue
+        arc = abs((value % 24.0) - 12.0)  # Hours from solar noon
+        if name == 'dhuhr' or WARM_START_MARGIN <= arc <= 12.0 - WARM_START_MARGIN:
+            guesses[name] = value
+    return guesses
+
+
+def extrapolate(solution, previous=None):
+    """Guess of the next day's solution: linear from the last two days, else the last day's"""
+    if previous is None:
+        return dict(solution)
+    return {name: 2 * value - previous[name] for name, value in solution.items()}
+
+
+def max_change(previous, times):
+    """Largest change in hours between two iterations, ignoring undefined times"""
+    change = 0.0
+    for name, value in times.items():
+        difference = abs(value - previous[name])
+        if difference > change:  # False for NaN
+            change = difference
+    return change
+
+
+def _compute_prayer_times(params, lat, solar, times):
+    """Compute prayer times at given julian date"""
+    imsak = _sun_angle_time(lat, solar, params.imsak, times['imsak'], 'ccw')
+    fajr = _sun_angle_time(lat, solar, params.fajr, times['fajr'], 'ccw')
+    sunrise = _sun_angle_time(lat, solar, params.rise_set_angle, times['sunrise'], 'ccw')
+    dhuhr = _mid_day(solar, times['dhuhr'])
+    asr = _asr_time(lat, solar, params.asr_factor, times['asr'])
+    sunset = _sun_angle_time(lat, solar, params.rise_set_angle, times['sunset'])
+    maghrib = _sun_angle_time(lat, solar, params.maghrib, times['maghrib'])
+    isha = _sun_angle_time(lat, solar, params.isha, times['isha'])
+
+    return {
+        'imsak': imsak,
+        'fajr': fajr,
+        'sunrise': sunrise,
+        'dhuhr': dhuhr,
+        'asr': asr,
+        'sunset': sunset,
+        'maghrib': maghrib,
+        'isha': isha
+    }
+
+
+def _adjust_times(params, lng, timezone, times):
+    """Adjust times in a prayer time array"""
+    tz_adjust = timezone - lng / 15.0
+
+    for t, v in times.items():
+        times[t] += tz_adjust
+
+    if params.high_lats is not HighLatsMethod.NONE:
+        times = _adjust_high_lats(params, times)
+
+    if params.imsak_is_min:
+        times['imsak'] = times['fajr'] - params.imsak / 60.0
+
+    if params.maghrib_is_min:
+        times['maghrib'] = times['sunset'] - params.maghrib / 60.0
+
+    if params.isha_is_min:
+        times['isha'] = times['maghrib'] - params.isha / 60.0
+
+    times['dhuhr'] += params.dhuhr / 60.0
+    return times
+
+
+def _adjust_high_lats(params, times):
+    """Adjust times for locations in higher latitudes"""
+    night_time = time_diff(times['sunset'], times['sunrise'])
+
+    times['imsak'] = _adjust_hl_time(params, times['imsak'], times['sunrise'],
+                                     params.imsak, night_time, 'ccw')
+    times['fajr'] = _adjust_hl_time(params, times['fajr'], times['sunrise'],
+                                    params.fajr, night_time, 'ccw')
+    times['isha'] = _adjust_hl_time(params, times['isha'], times['sunset'],
+                                    params.isha, night_time)
+    times['maghrib'] = _adjust_hl_time(params, times['maghrib'], times['sunset'],
+                                       params.maghrib, night_time)
+    return times
+
+
+def _adjust_hl_time(params, time, base, angle, night, direction=None):
+    """Adjust a time for higher latitudes"""
+    portion = _night_portion(params, angle, night)
+    diff = time_diff(time, base) if direction == 'ccw' else time_diff(base, time)
+
+    if math.isnan(time) or diff > portion:
+        time = base + (-portion if direction == 'ccw' else portion)
+    return time
+
+
+def _night_portion(params, angle, night):
+    """The night portion used for adjusting times in higher latitudes"""
+    method = params.high_lats
+    portion = 1/2.0  # midnight
+
+    if method is HighLatsMethod.ANGLE_BASED:
+        portion = 1/60.0 * angle
+    elif method is HighLatsMethod.ONE_SEVENTH:
+        portion = 1/7.0
+
+    return portion * night
+
+
+def _tune_times(params, times):
+    """Apply offsets to the times"""
+    for name, offset in zip(times, params.offsets):
+        times[name] += offset / 60.0
+    return times
+
+
+def _mid_day(solar, time):
+    """Compute mid-day time"""
+    eqt = solar.sun_position(time)[1]
+    return fixhour(12 - eqt)
+
+
+def _sun_angle_time(lat, solar, angle, time, direction=None):
+    """Compute the time at which sun reaches a specific angle below horizon"""
+    try:
+        decl = solar.sun_position(time)[0]
+        noon = _mid_day(solar, time)
+        t = 1/15.0 * arccos((-sin(angle) - sin(decl) * sin(lat)) /
+                            (cos(decl) * cos(lat)))
+        return noon + (-t if direction == 'ccw' else t)
+    except ValueError:
+        return float('nan')
+
+
+def _asr_time(lat, solar, factor, time):
+    """Compute asr time"""
+    decl = solar.sun_position(time)[0]
+    angle = -arccot(factor + tan(abs(lat - decl)))
+    return _sun_angle_time(lat, solar, angle, time)
+
+
+def sun_position(jd):
+    """Compute declination angle of sun and equation of time"""
+    D = jd - 2451545.0
+    g = fixangle(357.529 + 0.98560028 * D)
+    q = fixangle(280.459 + 0.98564736 * D)
+    L = fixangle(q + 1.915 * sin(g) + 0.020 * sin(2*g))
+    e = 23.439 - 0.00000036 * D
+    RA = arctan2(cos(e) * sin(L), cos(L)) / 15.0
+    eqt = q/15.0 - fixhour(RA)
+    decl = arcsin(sin(e) * sin(L))
+    return (decl, eqt)
+
+
+def julian(year, month, day):
+    """Convert Gregorian date to Julian day"""
+    if month <= 2:
+        year -= 1
+        month += 12
+    A = int(year / 100)
+    B = 2 - A + int(A / 4)
+    return int(365.25 * (year + 4716)) + int(30.6001 * (month + 1)) + day + B - 1524.5
+
+
+def time_diff(time1, time2):
+    """Compute the difference between two times"""
+    return fixhour(time2 - time1)
+
+
+#----------------- Degree-Based Math Functions -------------------
+def sin(d):
+    return math.sin(math.radians(d))
+
+
+def cos(d):
+    return math.cos(math.radians(d))
+
+
+def tan(d):
+    return math.tan(math.radians(d))
+
+
+def arcsin(x):
+    return math.degrees(math.asin(x))
+
+
+def arccos(x):
+    return math.degrees(math.acos(x))
+
+
+def arctan(x):
+    return math.degrees(math.atan(x))
+
+
+def arccot(x):
+    return math.degrees(math.atan(1.0/x))
+
+
+def arctan2(y, x):
+    return math.degrees(math.atan2(y, x))
+
+
+def fixangle(angle):
+    return fix(angle, 360.0)
+
+
+def fixhour(hour):
+    return fix(hour, 24.0)
+
+
+def fix(a, mode):
+    if math.isnan(a):
+        return a
+    a = a - mode * (math.floor(a / mode))
+    return a + mode if a < 0 else a
@@ -0,0 +1,178 @@
+import numpy as np
+
+from calculation_params import TIME_NAMES, HighLatsMethod, MidnightMethod
+import prayer_core
+
+# Rows of the (event, day) arrays used during the main iterations
+IMSAK, FAJR, SUNRISE, DHUHR, ASR, SUNSET, MAGHRIB, ISHA = range(8)
+
+# Initial guesses for the main iterations (same as the scalar core)
+INITIAL_TIMES = tuple(prayer_core.INITIAL_TIMES.values())
+
+# The initial guesses only take five distinct values, so the first iteration
+# evaluates the sun position once per distinct value and gathers the rows
+INITIAL_UNIQUE, INITIAL_INDEX = np.unique(INITIAL_TIMES, return_inverse=True)
+
+RAD = np.pi / 180.0
+DEG = 180.0 / np.pi
+
+
+def julian_days(start_jd, num_days):
+    """Julian days of num_days consecutive dates starting at start_jd"""
+    return start_jd + np.arange(num_days, dtype=np.float64)
+
+
+def compute_times(params, lat, lng, timezone, jd, num_iterations=1, tolerance=None, stats=None):
+    """
+    Compute prayer times for an array of Julian days
+
+    params is a CalculationParams. jd holds the Julian day (at 0h UT) of every
+    date; lat, lng and timezone broadcast against it, so the same call serves
+    date ranges at one location and batches of locations. Returns a dict of event name -> float hours, with
+    the same values PrayerCalculator produces before formatting.
+
+    tolerance (seconds) iterates until no time of the array changes by more
+    than it, as in prayer_core.compute_day. A stats dict receives the number
+    of iterations.
+    """
+    jd = np.asarray(jd, dtype=np.float64) - lng / (15 * 24.0)
+    if np.ndim(lat):
+        jd = np.broadcast_to(jd, np.broadcast_shapes(jd.shape, np.shape(lat)))
+    expand = (slice(None),) + (np.newaxis,) * jd.ndim
+
+    times = None
+    iterations = 0
+    converged = tolerance is None
+    while iterations < num_iterations or not (converged or iterations >= prayer_core.MAX_ITERATIONS):
+        if times is None:
+            decl, eqt = _sun_position(jd + INITIAL_UNIQUE[expand])
+            decl, eqt = decl[INITIAL_INDEX], eqt[INITIAL_INDEX]
+            previous = np.array(INITIAL_TIMES, dtype=np.float64)[expand]
+        else:
+            decl, eqt = _sun_position(jd + times)
+            previous = times
+        times = _compute_prayer_times(params, lat, decl, eqt)
+        iterations += 1
+        if tolerance is not None:
+            change = np.nan_to_num(np.abs(times - previous), nan=0.0)
+            converged = change.max(initial=0.0) <= tolerance / 3600.0
+
+    if stats is not None:
+        stats['iterations'] = iterations
+    return _adjust_times(params, lng, timezone, times)
+
+
+def _compute_prayer_times(params, lat, decl, eqt):
+    """Compute all eight events at once from their sun positions, one row per event"""
+    noon = _fix(12 - eqt, 24.0)
+
+    sin_decl = np.sin(decl * RAD)
+    sin_lat = np.sin(lat * RAD)
+    angles = np.array([params.imsak, params.fajr, params.rise_set_angle, 0.0, 0.0,
+                       params.rise_set_angle, params.maghrib, params.isha])
+    expand = (slice(None),) + (np.newaxis,) * (decl.ndim - 1)
+    numerator = -np.sin(angles * RAD)[expand] - sin_decl * sin_lat
+
+    # Asr angle depends on the declination at the asr guess
+    asr_angle = -_arccot(params.asr_factor + _tan(np.abs(lat - decl[ASR])))
+    numerator[ASR] = -np.sin(asr_angle * RAD) - sin_decl[ASR] * sin_lat
+
+    with np.errstate(invalid='ignore'):
+        t = 1/15.0 * (DEG * np.arccos(numerator / (np.cos(decl * RAD) * np.cos(lat * RAD))))
+
+    result = noon + t
+    result[:SUNRISE + 1] = noon[:SUNRISE + 1] - t[:SUNRISE + 1]
+    result[DHUHR] = noon[DHUHR]
+    return result
+
+
+def _adjust_times(params, lng, timezone, times):
+    """Timezone, high latitude, minute based and offset adjustments"""
+    times = times + (timezone - lng / 15.0)
+
+    if params.high_lats is not HighLatsMethod.NONE:
+        night_time = _time_diff(times[SUNSET], times[SUNRISE])
+        times[IMSAK] = _adjust_hl_time(params, times[IMSAK], times[SUNRISE], params.imsak, night_time, True)
+        times[FAJR] = _adjust_hl_time(params, times[FAJR], times[SUNRISE], params.fajr, night_time, True)
+        times[ISHA] = _adjust_hl_time(params, times[ISHA], times[SUNSET], params.isha, night_time)
+        times[MAGHRIB] = _adjust_hl_time(params, times[MAGHRIB], times[SUNSET], params.maghrib, night_time)
+
+    if params.imsak_is_min:
+        times[IMSAK] = times[FAJR] - params.imsak / 60.0
+
+    if params.maghrib_is_min:
+        times[MAGHRIB] = times[SUNSET] - params.maghrib / 60.0
+
+    if params.isha_is_min:
+        times[ISHA] = times[MAGHRIB] - params.isha / 60.0
+
+    times[DHUHR] += params.dhuhr / 60.0
+
+    if params.midnight is MidnightMethod.JAFARI:
+        midnight = times[SUNSET] + _time_diff(times[SUNSET], times[FAJR]) / 2
+    else:
+        midnight = times[SUNSET] + _time_diff(times[SUNSET], times[SUNRISE]) / 2
+
+    result = {}
+    for row, name in enumerate(TIME_NAMES[:8]):
+        result[name] = times[row] + params.offsets[row] / 60.0
+    result['midnight'] = midnight + params.offsets[8] / 60.0
+    return result
+
+
+def _adjust_hl_time(params, time, base, angle, night, ccw=False):
+    """Adjust a time for higher latitudes"""
+    portion = _night_portion(params, angle, night)
+    if ccw:
+        diff = _time_diff(time, base)
+        adjusted = base - portion
+    else:
+        diff = _time_diff(base, time)
+        adjusted = base + portion
+
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isnan(time) | (diff > portion), adjusted, time)
+
+
+def _night_portion(params, angle, night):
+    """The night portion used for adjusting times in higher latitudes"""
+    portion = 1/2.0  # midnight
+
+    if params.high_lats is HighLatsMethod.ANGLE_BASED:
+        portion = 1/60.0 * angle
+    elif params.high_lats is HighLatsMethod.ONE_SEVENTH:
+        portion = 1/7.0
+
+    return portion * night
+
+
+def _sun_position(jd):
+    """Compute declination angle of sun and equation of time"""
+    D = jd - 2451545.0
+    g = _fix(357.529 + 0.98560028 * D, 360.0)
+    q = _fix(280.459 + 0.98564736 * D, 360.0)
+    L = _fix(q + 1.915 * np.sin(g * RAD) + 0.020 * np.sin(2*g * RAD), 360.0)
+    e = 23.439 - 0.00000036 * D
+    sin_l = np.sin(L * RAD)
+    RA = DEG * np.arctan2(np.cos(e * RAD) * sin_l, np.cos(L * RAD)) / 15.0
+    eqt = q/15.0 - _fix(RA, 24.0)
+    decl = DEG * np.arcsin(np.sin(e * RAD) * sin_l)
+    return decl, eqt
+
+
+def _time_diff(time1, time2):
+    """Compute the difference between two times"""
+    return _fix(time2 - time1, 24.0)
+
+
+def _tan(d):
+    return np.tan(d * RAD)
+
+
+def _arccot(x):
+    return DEG * np.arctan(1.0 / x)
+
+
+def _fix(a, mode):
+    a = a - mode * np.floor(a / mode)
+    return np.where(a < 0, a + mode, a)
@@ -0,0 +1,163 @@
+import datetime
+import math
+from types import MappingProxyType
+
+from lazy_import import lazy_import
+
+# Bulk formatting works on numpy arrays too, but keep numpy optional (and out of startup)
+try:
+    np = lazy_import('numpy')
+except ImportError:
+    np = None
+
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+UNDEFINED_TIME = '-----'
+
+# Display strings of every minute of the day, built once per format. Index
+# 1440 is "24:00", which _split_time can produce for times a rounding error
+# below a multiple of 24.
+_FORMAT_TABLES = {}
+
+
+def _format_minute(hours, minutes, format_type):
+    if format_type == "24h":
+        return f"{hours:02d}:{minutes:02d}"
+    else:  # 12h format
+        suffix = 'AM' if hours < 12 else 'PM'
+        display_hour = hours % 12
+        if display_hour == 0:
+            display_hour = 12
+        return f"{display_hour}:{minutes:02d} {suffix}"
+
+
+def format_table(format_type='24h'):
+    """Tuple of the display strings of minutes 0-1440 of the day"""
+    format_type = '24h' if format_type == '24h' else '12h'
+    table = _FORMAT_TABLES.get(format_type)
+    if table is None:
+        table = tuple(_format_minute(minute // 60, minute % 60, format_type) for minute in range(1441))
+        _FORMAT_TABLES[format_type] = table
+    return table
+
+
+def format_time(time, format_type='24h'):
+    """Convert float hours to a "HH:MM" (24h) or "H:MM AM" (12h) string"""
+    if math.isnan(time):
+        return UNDEFINED_TIME
+    return format_table(format_type)[minute_of_day(time)]
+
+
+def format_many(times, format_type='24h'):
+    """
+    Format many float hours at once
+
+    A numpy array (e.g. a column of get_times_range or a compute_batch
+    result) gives an array of strings of the same shape; any other iterable
+    gives a list. Strings are the same as format_time's.
+    """
+    if np is not None and isinstance(times, np.ndarray):
+        table = np.array(format_table(format_type) + (UNDEFINED_TIME,))
+        times = times.astype(np.float64, copy=False)
+        undefined = np.isnan(times)
+        index = minutes_of_day(np.where(undefined, 0.0, times))
+        index[undefined] = len(table) - 1
+        return table[index]
+
+    table = format_table(format_type)
+    return [UNDEFINED_TIME if math.isnan(time) else table[minute_of_day(time)] for time in times]
+
+
+def minutes_of_day(times):
+    """minute_of_day of a numpy array of float hours, same rounding"""
+    times = times + 0.5/60
+    times = times - 24.0 * np.floor(times / 24.0)
+    times = np.where(times < 0, times + 24.0, times)
+    hours = times.astype(np.int64)
+    return hours * 60 + ((times - hours) * 60).astype(np.int64)
+
+
+def minute_of_day(time):
+    """Round float hours to the displayed minute of the day (0-1439)"""
+    hours, minutes = _split_time(time)
+    return hours * 60 + minutes
+
+
+def _split_time(time):
+    """Round float hours to the displayed (hours, minutes)"""
+    time = time + 0.5/60  # Add 0.5 minutes to round
+    time = time - 24.0 * math.floor(time / 24.0)
+    if time < 0:
+        time += 24.0
+    hours = int(time)
+    minutes = int((time - hours) * 60)
+    return hours, minutes
+
+
+class PrayerTimes:
+    """
+    Numeric prayer times for one day at one location
+
+    Holds float hours in local time for each prayer. Epoch timestamps,
+    timezone-aware datetimes and display strings are derived on demand, so
+    callers such as the scheduler can work with integers and only the UI
+    pays for formatting.
+    """
+
+    __slots__ = ('date', 'timezone', 'source', 'hours', '_timestamps', '_formatted')
+
+    def __init__(self, date_obj, hours, timezone=0, source='offline'):
+        self.date = date_obj
+        self.timezone = timezone  # UTC offset in hours
+        self.source = source      # 'offline' or 'online'
+        self.hours = MappingProxyType(dict(hours))
+        self._timestamps = None
+        self._formatted = {}
+
+    def __repr__(self):
+        return f"PrayerTimes({self.date.isoformat()}, source={self.source!r}, tz={self.timezone})"
+
+    def __contains__(self, name):
+        return name in self.hours
+
+    def names(self):
+        """Return the prayer names in calculation order"""
+        return list(self.hours)
+
+    def timestamp(self, name):
+        """Epoch seconds of the displayed minute of a prayer, or None if undefined"""
+        return self.timestamps().get(name)
+
+    def timestamps(self):
+        """Return a dict of prayer name -> epoch seconds (undefined times are skipped)"""
+        if self._timestamps is None:
+            day_start = (self.date - EPOCH_DATE).days * 86400 - int(round(self.timezone * 3600))
+            timestamps = {}
+            for name, time in self.hours.items():
+                if time is None or math.isnan(time):
+                    continue
+                # Times past midnight (e.g. 24.5) belong to the following day
+                day_offset = math.floor((time + 0.5/60) / 24.0)
+                timestamps[name] = day_start + (day_offset * 1440 + minute_of_day(time)) * 60
+            self._timestamps = timestamps
+        return dict(self._timestamps)
+
+    def events(self):
+        """Return (timestamp, name) pairs sorted by time"""
+        return sorted((ts, name) for name, ts in self.timestamps().items())
+
+    def datetime(self, name):
+        """Timezone-aware datetime of a prayer, or None if undefined"""
+        ts = self.timestamp(name)
+        if ts is None:
+            return None
+        tzinfo = datetime.timezone(datetime.timedelta(hours=self.timezone))
+        return datetime.datetime.fromtimestamp(ts, tzinfo)
+
+    def formatted(self, time_format='24h'):
+        """Return a dict of prayer name -> display string, formatted once per format"""
+        formatted = self._formatted.get(time_format)
+        if formatted is None:
+            formatted = {name: format_time(time, time_format) for name, time in self.hours.items()}
+            self._formatted[time_format] = formatted
+        return dict(formatted)
@@ -8,9 +8,9 @@ class SecurityManager:
     Manages security, ethics, and user control aspects of the application
     """
     
-    def __init__(self, config_manager=None):
+    def __init__(self, config_manager=None, logger=None):
         self.config_manager = config_manager or ConfigManager()
-        self.logger = self._setup_logger()
+        self.logger = logger or self._setup_logger()
         self.emergency_access_enabled = True
         self.max_lock_duration = 30 * 60  # Maximum 30 minutes in seconds
         self.min_lock_duration = 2 * 60   # Minimum 2 minutes in seconds
@@ -25,8 +25,10 @@ class SecurityManager:
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
         
-        # Create file handler
+        # Create file handler, once per file however many managers are created
         log_file = os.path.join(log_dir, f"security_{datetime.now().strftime('%Y%m%d')}.log")
+        if any(getattr(handler, 'baseFilename', None) == os.path.abspath(log_file) for handler in logger.handlers):
+            return logger
         file_handler = logging.FileHandler(log_file)
         file_handler.setLevel(logging.INFO)
         
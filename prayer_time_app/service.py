@@ -1,13 +1,13 @@
 import threading
 import time
 from datetime import datetime, timedelta
-import sys
-import os
-
-# Add the current directory to the path to import local modules
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from clock import SystemClock
+from deadline_scheduler import DeadlineScheduler
+from event_ledger import EventLedger
 from prayer_calculator import PrayerCalculator
+from timezone_resolver import resolve_timezone
+from timetable_store import TimetableStore
 from system_lock import SystemLockManager
 from notification_manager import NotificationManager
 from config_manager import ConfigManager
@@ -16,22 +16,47 @@ from security_manager import SecurityManager
 class PrayerTimeService:
     """
     Main service that monitors prayer times and manages notifications/locking
+    
+    Time is read, waited on and timed through clock (see clock.py); the
+    managers can be passed in, so simulation.py runs the service on a
+    VirtualClock with recording lock and notification managers.
     """
     
-    def __init__(self):
-        self.config_manager = ConfigManager()
-        self.security_manager = SecurityManager(self.config_manager)
+    ROLLOVER_EVENT = 'rollover'  # Scheduled at local midnight to load the new day
+    EVENT_SOURCE = 'prayer'      # Ledger source of the Adhan, notification and lock pipeline
+    DEFAULT_EVENT_TYPES = ('fajr', 'dhuhr', 'asr', 'maghrib', 'isha')
+    # Sleep at most this long, so a suspend/resume or wall clock jump is noticed
+    # within a minute (monotonic timeouts do not run while the machine sleeps)
+    MAX_SLEEP_SECONDS = 60
+    CLOCK_JUMP_SECONDS = 5  # Wall and monotonic clocks disagreeing by more is a jump
+    CATCH_UP_POLICIES = ('fire_late', 'notify_only', 'skip')
+    
+    def __init__(self, config_manager=None, clock=None, system_lock_manager=None,
+                 notification_manager=None, security_manager=None):
+        self.clock = clock or SystemClock()
+        self.config_manager = config_manager or ConfigManager()
+        self.security_manager = security_manager or SecurityManager(self.config_manager)
         self.prayer_calculator = None
-        self.system_lock_manager = SystemLockManager()
-        self.notification_manager = NotificationManager()
+        self.system_lock_manager = system_lock_manager or SystemLockManager(self.clock)
+        self.notification_manager = notification_manager or NotificationManager(self.clock)
+        self.times_source = 'offline-first'  # Source of the loaded times, see PrayerCalculator.get_prayer_times
 
         # Initialize calculator with current config
         location = self.config_manager.get_location()
         coords = (location['latitude'], location['longitude'])
+        self.timetable_store = self._open_timetable_store()
+        self.event_ledger = self._open_event_ledger()
         self.prayer_calculator = PrayerCalculator(
             method=self.config_manager.get_calculation_method(),
-            coordinates=coords
+            coordinates=coords,
+            timezone=self._get_timezone_from_location(coords),
+            store=self.timetable_store
         )
+        api_url = self.config_manager.get_app_settings().get('api_url')
+        if api_url:
+            self.prayer_calculator.API_URL = api_url.rstrip('/')
+        self.prayer_calculator.subscribe(self._on_prayer_times_changed)
+        self.config_manager.subscribe(self._on_config_changed)
 
         # Set up callbacks
         self.system_lock_manager.set_lock_callback(self._on_lock_change)
@@ -40,8 +65,27 @@ class PrayerTimeService:
         # Service control
         self.is_running = False
         self.service_thread = None
-        self.today_prayer_times = {}
-        self.next_prayer_check = None
+        self.today_prayer_times = None  # PrayerTimes for today
+        self.next_prayer_check = None  # datetime of the next scheduled event
+        self.scheduler = DeadlineScheduler(self.clock)
+        # Times of the coming days, computed ahead so the midnight rollover never waits
+        self.precompute_in_background = True  # False computes them on the service thread (simulations)
+        self._precomputed = {}  # date -> PrayerTimes
+        self._precompute_lock = threading.Lock()
+        self._precompute_generation = 0  # Bumped when settings change, stale results are dropped
+        self._precompute_thread = (None, None)  # (worker thread, its generation)
+        self.precompute_stats = {'computed': 0, 'hits': 0, 'misses': 0, 'discarded': 0}
+        self._times_stale = False  # Set when settings change, the service thread reloads
+        self._last_wakeup = None  # (monotonic, wall) time of the last wakeup
+        self._catch_up_since = None  # Wall time since which overdue events are caught up
+        self.catch_up_stats = {
+            'forward_jumps': 0,   # Suspend/resume or wall clock set ahead
+            'backward_jumps': 0,  # Wall clock set back
+            'late': 0,            # Events found overdue, past their minute
+            'caught_up': 0,       # Late events fired anyway (fire_late)
+            'notified': 0,        # Late events only notified (notify_only)
+            'missed': 0           # Late events dropped (skip, or past the catch-up window)
+        }
 
         # Update volume settings
         notif_settings = self.config_manager.get_notification_settings()
@@ -50,6 +94,26 @@ class PrayerTimeService:
         # Enforce ethical guidelines
         self.security_manager.enforce_ethical_guidelines()
     
+    def _open_timetable_store(self):
+        """Open the persistent timetable store, so restarts reuse stored days"""
+        path = self.config_manager.get_app_settings().get('timetable_store')
+        if not path:
+            return None
+        try:
+            return TimetableStore(path)
+        except Exception as e:
+            print(f"Timetable store unavailable: {e}")
+            return None
+    
+    def _open_event_ledger(self):
+        """Open the fired event ledger, so restarts never fire an event twice"""
+        path = self.config_manager.get_app_settings().get('event_ledger')
+        try:
+            return EventLedger(path or ':memory:', self.clock.today())
+        except Exception as e:
+            print(f"Event ledger unavailable, keeping fired events in memory: {e}")
+            return EventLedger(':memory:')
+    
     def _on_lock_change(self, is_locked):
         """Callback when system lock state changes"""
         status = "LOCKED" if is_locked else "UNLOCKED"
@@ -65,47 +129,222 @@ class PrayerTimeService:
         """Update location from config"""
         location = self.config_manager.get_location()
         coords = (location['latitude'], location['longitude'])
-        timezone = self._get_timezone_from_location(coords)  # Simplified
+        timezone = self._get_timezone_from_location(coords)
         self.prayer_calculator.set_location(coords, timezone)
+        self._discard_precomputed()
+        self._invalidate_times()
+    
+    def _on_config_changed(self, section):
+        """Apply changed settings and re-arm the schedule"""
+        if section in ('location', None):
+            self.update_location()
+            return
+        if section == 'calculation_method':
+            self.prayer_calculator.method = self.config_manager.get_calculation_method()
+            self._discard_precomputed()
+        self._invalidate_times()
+    
+    def _invalidate_times(self):
+        """Make the service thread reload today's times and reschedule"""
+        self._times_stale = True
+        self.scheduler.rearm()
     
     def _get_timezone_from_location(self, coordinates):
-        """Get timezone from coordinates (simplified implementation)"""
-        # In a real implementation, this would use a timezone API or library
-        # For now, we'll return a simple approximation based on longitude
-        longitude = coordinates[1]
-        # Each 15 degrees of longitude is approximately 1 hour difference
-        return round(longitude / 15.0)
+        """IANA zone of the coordinates, resolved offline (DST is applied per date)"""
+        return resolve_timezone(coordinates[0], coordinates[1])
     
     def get_today_prayer_times(self):
-        """Get today's prayer times"""
-        return self.prayer_calculator.get_times_online()
+        """Get today's prayer times formatted for display"""
+        time_format = self.config_manager.get_time_format()
+        return self._load_today_prayer_times().formatted(time_format)
     
-    def _check_prayer_times(self):
-        """Check if it's time for prayer and take appropriate action"""
-        current_time = datetime.now().time()
-        current_time_str = current_time.strftime("%H:%M")
+    def _load_today_prayer_times(self):
+        """Get today's prayer times as a numeric PrayerTimes result, precomputed if available"""
+        today = self.clock.today()
+        with self._precompute_lock:
+            times = self._precomputed.get(today)
+        if times is not None:
+            self.precompute_stats['hits'] += 1
+            return times
+        self.precompute_stats['misses'] += 1
+        return self.prayer_calculator.get_prayer_times(today, source=self.times_source)
+    
+    def _precomputed_times(self, date_obj):
+        """Loaded or precomputed PrayerTimes of a date, None if not ready"""
+        with self._precompute_lock:
+            return self._precomputed.get(date_obj)
+    
+    def _precompute_days(self):
+        return max(0, int(self.config_manager.get_app_settings().get('precompute_days', 2)))
+    
+    def _precompute_ahead(self):
+        """
+        Start computing the days after today that are not precomputed yet,
+        and yesterday if the schedule lacks it
+        
+        Runs on one background thread (CPython has no thread priorities;
+        it is started after the day is scheduled, off the service's path),
+        so the next rollover finds its times ready. Days before yesterday
+        are dropped.
+        """
+        today = self.clock.today()
+        dates = [today + timedelta(days=offset) for offset in range(-1, self._precompute_days() + 1) if offset]
+        with self._precompute_lock:
+            self._precomputed = {date_obj: times for date_obj, times in self._precomputed.items()
+                                 if date_obj >= today - timedelta(days=1)}
+            dates = [date_obj for date_obj in dates if date_obj not in self._precomputed]
+            generation = self._precompute_generation
+            running, running_generation = self._precompute_thread
+            if not dates or (running is not None and running.is_alive() and running_generation == generation):
+                return
+            thread = None
+            if self.precompute_in_background:
+                thread = threading.Thread(target=self._precompute, args=(generation, dates), daemon=True)
+                self._precompute_thread = (thread, generation)
+        if thread is None:
+            self._precompute(generation, dates)
+        else:
+            thread.start()
+    
+    def _precompute(self, generation, dates):
+        """
+        Worker: compute (or fetch) the times of dates and publish them for the rollover
+        
+        A day the current schedule needs but lacks (yesterday, today) re-arms
+        the schedule once it is published.
+        """
+        try:
+            for date_obj in dates:
+                if generation != self._precompute_generation:
+                    return
+                times = self.prayer_calculator.get_prayer_times(date_obj, source=self.times_source)
+                with self._precompute_lock:
+                    if generation != self._precompute_generation:
+                        return
+                    self._precomputed[date_obj] = times
+                    self.precompute_stats['computed'] += 1
+                if date_obj <= self.clock.today():
+                    self._invalidate_times()
+        except Exception as e:
+            print(f"Error precomputing prayer times: {e}")
+    
+    def _discard_precomputed(self):
+        """Drop the precomputed days after a settings change; a running worker stops"""
+        with self._precompute_lock:
+            self._precompute_generation += 1
+            self.precompute_stats['discarded'] += len(self._precomputed)
+            self._precomputed = {}
+    
+    def _on_prayer_times_changed(self, date_obj, old_times, new_times):
+        """
+        Online times replaced the offline ones for a day
         
-        # Get today's prayer times if not already loaded or if it's a new day
-        if not self.today_prayer_times or self._is_new_day():
-            self.today_prayer_times = self.get_today_prayer_times()
-            self._schedule_prayer_notifications()
+        Runs on the calculator's reconcile thread, so it only swaps the
+        precomputed day; the service thread reloads and re-arms the schedule
+        if the day is scheduled (today or yesterday).
+        """
+        with self._precompute_lock:
+            if self._precomputed.get(date_obj) is old_times:
+                self._precomputed[date_obj] = new_times
+        today_times = self.today_prayer_times
+        if today_times is not None and timedelta(0) <= today_times.date - date_obj <= timedelta(days=1):
+            self._invalidate_times()
+    
+    def _check_clock(self):
+        """
+        Detect a suspend/resume or wall clock jump since the last wakeup
+
+        Compares the wall and monotonic time elapsed since the last wakeup.
+        After a jump the scheduler's deadlines no longer match the wall
+        clock, so the times are rescheduled, including events that passed
+        since the last wakeup; those go through the catch-up policy.
+        Returns the difference in seconds, or None without a jump.
+        """
+        mono, wall = self.clock.monotonic(), self.clock.time()
+        last, self._last_wakeup = self._last_wakeup, (mono, wall)
+        if last is None:
+            return None
+        drift = (wall - last[1]) - (mono - last[0])
+        if abs(drift) <= self.CLOCK_JUMP_SECONDS:
+            return None
+        self.catch_up_stats['forward_jumps' if drift > 0 else 'backward_jumps'] += 1
+        print(f"Clock jumped {drift:+.0f} s (suspend/resume or clock change), rescheduling")
+        self._catch_up_since = last[1] if self._catch_up_since is None else min(self._catch_up_since, last[1])
+        self._invalidate_times()
+        return drift
+    
+    def _check_prayer_times(self):
+        """Fire the events that are due, then reload and reschedule if the day or settings changed"""
+        for timestamp, name, date_obj in self.scheduler.pop_due():
+            if name != self.ROLLOVER_EVENT:
+                self._fire_event(date_obj, name, timestamp)
         
-        # Check each prayer time
-        for prayer_name, prayer_time in self.today_prayer_times.items():
-            if prayer_time and self._is_time_for_prayer(prayer_name, prayer_time, current_time_str):
-                self._handle_prayer_time(prayer_name)
+        # Get today's prayer times if not already loaded, stale or if it's a new day
+        if self.today_prayer_times is None or self._times_stale or self._is_new_day():
+            self._times_stale = False
+            self.today_prayer_times = self._load_today_prayer_times()
+            with self._precompute_lock:
+                # Kept as tomorrow's yesterday
+                self._precomputed.setdefault(self.today_prayer_times.date, self.today_prayer_times)
+            since, self._catch_up_since = self._catch_up_since, None
+            self._schedule_prayer_notifications(since)
+            self._precompute_ahead()
+        self._update_next_check()
     
     def _is_new_day(self):
         """Check if it's a new day and we need to refresh prayer times"""
-        if self.next_prayer_check:
-            return datetime.now().date() > self.next_prayer_check.date()
+        return self.today_prayer_times is None or self.today_prayer_times.date != self.clock.today()
+    
+    def _update_next_check(self):
+        upcoming = self.scheduler.next_event()
+        self.next_prayer_check = self.clock.fromtimestamp(upcoming[0]) if upcoming else None
+    
+    def _event_types(self):
+        """Names of the events that notify, lower case"""
+        event_types = self.config_manager.get_notification_settings().get('event_types', self.DEFAULT_EVENT_TYPES)
+        return {name.lower() for name in event_types}
+    
+    def _catch_up_policy(self):
+        """(policy, window in minutes) for events found past their minute"""
+        settings = self.config_manager.get_notification_settings()
+        policy = settings.get('catch_up_policy', 'fire_late')
+        if policy not in self.CATCH_UP_POLICIES:
+            policy = 'fire_late'
+        return policy, settings.get('catch_up_minutes', 15)
+    
+    def _fire_event(self, date_obj, prayer_name, timestamp):
+        """Handle a due event once, if its type notifies; returns True if handled"""
+        if prayer_name not in self._event_types():
+            return False
+        now = self.clock.time()
+        if not self.event_ledger.claim(date_obj, prayer_name, self.EVENT_SOURCE, timestamp, now):
+            return False
+        
+        now = int(now)
+        if not self._is_time_for_prayer(prayer_name, timestamp, now) and now > timestamp:
+            # Overdue, e.g. the machine slept through it: apply the catch-up policy
+            self.catch_up_stats['late'] += 1
+            policy, window = self._catch_up_policy()
+            if now - timestamp > window * 60 or policy == 'skip':
+                self.catch_up_stats['missed'] += 1
+                print(f"Missed {prayer_name} prayer by {(now - timestamp) // 60} minutes")
+                return False
+            if policy == 'notify_only':
+                self.catch_up_stats['notified'] += 1
+                self.notification_manager.show_notification(
+                    f"{prayer_name.capitalize()} Prayer Time Passed",
+                    f"{prayer_name.capitalize()} time was {(now - timestamp) // 60} minutes ago."
+                )
+                return False
+            self.catch_up_stats['caught_up'] += 1
+        self._handle_prayer_time(prayer_name)
         return True
     
-    def _is_time_for_prayer(self, prayer_name, prayer_time, current_time_str):
+    def _is_time_for_prayer(self, prayer_name, prayer_timestamp, now):
         """Check if it's time for a specific prayer"""
-        # Simple check: if the prayer time matches current time (within a minute)
+        # Simple check: if the current time falls within the prayer's minute
         # In a real implementation, you might want to allow a small window
-        return prayer_time == current_time_str
+        return prayer_timestamp <= now < prayer_timestamp + 60
     
     def _handle_prayer_time(self, prayer_name):
         """Handle when it's time for a prayer"""
@@ -146,11 +385,33 @@ class PrayerTimeService:
 
             self.system_lock_manager.lock_system_for_duration(validated_duration)
     
-    def _schedule_prayer_notifications(self):
-        """Schedule notifications for all prayer times today"""
-        # In a real implementation, you might use the schedule library
-        # For now, we'll just store the times and check them manually
-        pass
+    def _schedule_prayer_notifications(self, since=None):
+        """
+        Arm the scheduler with today's remaining prayer times and the midnight rollover
+
+        Events already past their minute are left out, except those after
+        the wall time since (after a clock jump), which are due at once and
+        go through the catch-up policy. The previous day's events are
+        included the same way: its Isha falls after midnight in high
+        latitude summers, and a jump may cross midnight.
+        
+        Only days already loaded are used, so arming never computes or
+        fetches; a missing previous day is filled by the precompute worker,
+        which re-arms the schedule when it arrives.
+        """
+        now = int(self.clock.time())
+        day = self.today_prayer_times.date
+        event_types = self._event_types()
+        days = [times for times in (self._precomputed_times(day - timedelta(days=1)), self.today_prayer_times)
+                if times is not None]
+        events = [(timestamp, name, times.date) for times in days for timestamp, name in times.events()
+                  if name in event_types
+                  and (timestamp >= now or self._is_time_for_prayer(name, timestamp, now)
+                       or (since is not None and timestamp >= since))
+                  and not self.event_ledger.has_fired(times.date, name, self.EVENT_SOURCE)]
+        tomorrow = datetime.combine(day + timedelta(days=1), datetime.min.time())
+        events.append((self.clock.timestamp(tomorrow), self.ROLLOVER_EVENT, day))
+        self.scheduler.replace(events)
     
     def start_service(self):
         """Start the prayer time monitoring service"""
@@ -159,6 +420,7 @@ class PrayerTimeService:
             return
         
         self.is_running = True
+        self._last_wakeup = None  # Time while stopped is not a clock jump
         self.service_thread = threading.Thread(target=self._service_loop, daemon=True)
         self.service_thread.start()
         print("Prayer time service started")
@@ -166,19 +428,32 @@ class PrayerTimeService:
     def stop_service(self):
         """Stop the prayer time monitoring service"""
         self.is_running = False
+        self.scheduler.rearm()
         if self.service_thread:
             self.service_thread.join(timeout=2)  # Wait up to 2 seconds for thread to finish
         print("Prayer time service stopped")
     
+    def step(self, max_wait=None):
+        """
+        One pass of the service loop: fire due events, reschedule if needed,
+        then wait until the next event (at most max_wait seconds)
+        
+        The service thread calls it forever; a simulation on a VirtualClock
+        calls it until the clock reaches its end date.
+        """
+        self._check_clock()
+        self._check_prayer_times()
+        # Sleep until the next event, or until times, settings or the date change
+        return self.scheduler.wait(max_wait)
+    
     def _service_loop(self):
         """Main service loop that runs in a separate thread"""
         while self.is_running:
             try:
-                self._check_prayer_times()
-                time.sleep(30)  # Check every 30 seconds
+                self.step(self.MAX_SLEEP_SECONDS)
             except Exception as e:
                 print(f"Error in service loop: {e}")
-                time.sleep(60)  # Wait a minute before retrying
+                self.scheduler.wait(60)  # Wait a minute before retrying
     
     def emergency_unlock(self):
         """Emergency unlock functionality"""
@@ -196,11 +471,23 @@ class PrayerTimeService:
     
     def get_current_status(self):
         """Get current service status"""
+        today_times = {}
+        upcoming = self.scheduler.next_event()
+        if self.today_prayer_times is not None:
+            today_times = self.today_prayer_times.formatted(self.config_manager.get_time_format())
+        with self._precompute_lock:
+            precompute = dict(self.precompute_stats, days=sorted(self._precomputed))
+        
         return {
             "is_running": self.is_running,
             "is_system_locked": self.system_lock_manager.is_system_locked(),
-            "today_prayer_times": self.today_prayer_times,
-            "next_check": self.next_prayer_check
+            "today_prayer_times": today_times,
+            "next_check": self.next_prayer_check,
+            "next_event": upcoming[1] if upcoming else None,
+            "next_deadline_seconds": round(upcoming[2], 3) if upcoming else None,
+            "scheduler": self.scheduler.get_stats(),
+            "catch_up": dict(self.catch_up_stats),
+            "precompute": precompute
         }
 
 
@@ -0,0 +1,245 @@
+"""
+Virtual-clock simulation of the prayer time service
+
+Runs the real PrayerTimeService loop (scheduler, event ledger, catch-up,
+lock timers) for a set of sites over a date range on a VirtualClock, so
+a year passes in well under a second per site. Locking and audio are
+replaced by managers that only record what would have happened: every
+Adhan, notification, lock and unlock, with its virtual time.
+
+    python simulation.py --start 2025-01-01 --days 365 --sites 1000
+    python simulation.py --city Makkah --city London --days 30 -o events.csv
+
+Sites are (name, latitude, longitude); each runs in its own timezone,
+resolved from the coordinates like the service does.
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from zoneinfo import ZoneInfo
+
+from cities import CITIES, find_city
+from clock import VirtualClock
+from config_manager import ConfigManager
+from notification_manager import NotificationManager
+from security_manager import SecurityManager
+from service import PrayerTimeService
+from system_lock import SystemLockManager
+from timezone_resolver import resolve_timezone
+
+EVENT_KINDS = ('adhan', 'notification', 'lock', 'unlock')
+
+
+class SimulationRecorder:
+    """
+    Counts, and optionally keeps, the events of one simulated site
+
+    Records are (epoch timestamp, site name, kind, detail) tuples.
+    """
+
+    def __init__(self, site_name, clock, keep_records=False):
+        self.site_name = site_name
+        self.clock = clock
+        self.keep_records = keep_records
+        self.counts = dict.fromkeys(EVENT_KINDS, 0)
+        self.records = []
+
+    def record(self, kind, detail=''):
+        self.counts[kind] += 1
+        if self.keep_records:
+            self.records.append((self.clock.time(), self.site_name, kind, detail))
+
+
+class SimulatedLockManager(SystemLockManager):
+    """SystemLockManager that records locks and unlocks instead of locking the workstation"""
+
+    def __init__(self, clock, recorder):
+        super().__init__(clock)
+        self.recorder = recorder
+
+    def lock_workstation(self):
+        self.recorder.record('lock', f"{self.lock_duration // 60} minutes")
+        return True
+
+    def _unlock_after_duration(self):
+        if not self._emergency_unlock_flag:
+            self.recorder.record('unlock')
+        super()._unlock_after_duration()
+
+
+class SimulatedNotificationManager(NotificationManager):
+    """NotificationManager that records the Adhan and notifications instead of playing and printing them"""
+
+    def __init__(self, clock, recorder):
+        super().__init__(clock)
+        self.recorder = recorder
+
+    def play_adhan(self, prayer_name, adhan_url=None):
+        self.recorder.record('adhan', prayer_name)
+        return True
+
+    def show_notification(self, title, message):
+        self.recorder.record('notification', title)
+
+
+def _null_logger():
+    """Security logger that drops everything, so simulations write no log files"""
+    logger = logging.getLogger('PrayerAppSimulation')
+    logger.disabled = True
+    return logger
+
+
+def build_service(site, start, clock, recorder, method='MWL'):
+    """PrayerTimeService for a site on clock, with in-memory config and ledger and recording managers"""
+    name, lat, lng = site
+    config = ConfigManager(None)
+    config.set_location(lat, lng, name)
+    config.set_calculation_method(method)
+    config.set_app_setting('timetable_store', '')
+    config.set_app_setting('event_ledger', '')
+    service = PrayerTimeService(
+        config_manager=config,
+        clock=clock,
+        system_lock_manager=SimulatedLockManager(clock, recorder),
+        notification_manager=SimulatedNotificationManager(clock, recorder),
+        security_manager=SecurityManager(config, _null_logger())
+    )
+    service.times_source = 'offline'  # Never touch the network
+    service.precompute_in_background = False  # Deterministic, and no thread per simulated day
+    return service
+
+
+def simulate_site(site, start, days, method='MWL', keep_records=False):
+    """
+    Run the service for one site from local midnight of start for days days
+
+    Returns (counts by kind, records), records being empty unless
+    keep_records is set.
+    """
+    name, lat, lng = site
+    clock = VirtualClock(datetime.datetime.combine(start, datetime.time.min), ZoneInfo(resolve_timezone(lat, lng)))
+    recorder = SimulationRecorder(name, clock, keep_records)
+    end = clock.timestamp(datetime.datetime.combine(start + datetime.timedelta(days=days), datetime.time.min))
+
+    with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+        service = build_service(site, start, clock, recorder, method)
+        # The previous day too, for catch-up across midnight
+        service.prayer_calculator.precompute(start - datetime.timedelta(days=1),
+                                             start + datetime.timedelta(days=days))
+        while clock.time() < end:
+            service.step(end - clock.time())
+        service.event_ledger.close()
+    return recorder.counts, recorder.records
+
+
+def _simulate_chunk(sites, start, days, method, keep_records):
+    totals = dict.fromkeys(EVENT_KINDS, 0)
+    records = []
+    for site in sites:
+        counts, site_records = simulate_site(site, start, days, method, keep_records)
+        for kind, count in counts.items():
+            totals[kind] += count
+        records.extend(site_records)
+    return totals, records
+
+
+def simulate(sites, start, days, method='MWL', keep_records=False, workers=None):
+    """
+    Simulate every site over the same date range
+
+    Sites are split over workers processes (default: one per CPU; 1 runs
+    in this process). Returns a dict with the total counts by kind, the
+    records (if keep_records), the number of sites and days and the
+    elapsed wall time in seconds.
+    """
+    sites = list(sites)
+    workers = min(workers or os.cpu_count() or 1, len(sites)) or 1
+    started = time.perf_counter()
+    if workers == 1:
+        results = [_simulate_chunk(sites, start, days, method, keep_records)]
+    else:
+        chunks = [sites[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_simulate_chunk, chunks, [start] * workers, [days] * workers,
+                                        [method] * workers, [keep_records] * workers))
+
+    totals = dict.fromkeys(EVENT_KINDS, 0)
+    records = []
+    for counts, chunk_records in results:
+        for kind, count in counts.items():
+            totals[kind] += count
+        records.extend(chunk_records)
+    records.sort(key=lambda record: record[0])
+    return {
+        'sites': len(sites),
+        'days': days,
+        'counts': totals,
+        'records': records,
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def random_sites(count, seed=0, jitter=0.5):
+    """count (name, latitude, longitude) sites near the reference cities, reproducible for a seed"""
+    rng = random.Random(seed)
+    sites = []
+    for index in range(count):
+        city, _, _, lat, lng, _ = rng.choice(CITIES)
+        sites.append((f"{city} #{index}", round(lat + rng.uniform(-jitter, jitter), 4),
+                      round(lng + rng.uniform(-jitter, jitter), 4)))
+    return sites
+
+
+def write_records(records, path):
+    """Write records as CSV with the local-independent UTC time of each event"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['utc_time', 'site', 'event', 'detail'])
+        for timestamp, site, kind, detail in records:
+            utc = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+            writer.writerow([utc.strftime('%Y-%m-%d %H:%M:%S'), site, kind, detail])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the prayer time service on a virtual clock")
+    parser.add_argument('--start', type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="First simulated date (YYYY-MM-DD, default today)")
+    parser.add_argument('--days', type=int, default=365, help="Number of simulated days")
+    parser.add_argument('--sites', type=int, default=1, help="Number of random sites near the reference cities")
+    parser.add_argument('--city', action='append', default=[], help="Simulate a reference city (repeatable)")
+    parser.add_argument('--method', default='MWL', help="Calculation method")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random sites")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--output', '-o', help="Write every event as CSV")
+    args = parser.parse_args(argv)
+
+    sites = []
+    for name in args.city:
+        city = find_city(name)
+        if city is None:
+            parser.error(f"Unknown city: {name}")
+        sites.append((city[0], city[3], city[4]))
+    if not sites:
+        sites = random_sites(args.sites, args.seed)
+
+    result = simulate(sites, args.start, args.days, args.method, keep_records=bool(args.output),
+                      workers=args.workers)
+    if args.output:
+        write_records(result['records'], args.output)
+    site_days = result['sites'] * result['days']
+    print(f"{result['sites']} sites x {result['days']} days in {result['elapsed_seconds']} s "
+          f"({site_days / max(result['elapsed_seconds'], 1e-9):.0f} site-days/s)")
+    for kind in EVENT_KINDS:
+        print(f"  {kind}: {result['counts'][kind]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,20 @@
 import ctypes
 import time
-import threading
 from datetime import datetime, timedelta
 import os
 
+from clock import SystemClock
+
 class SystemLockManager:
     """
     Manages Windows system locking and unlocking functionality
+    
+    The automatic unlock is a timer of clock (see clock.py), so a
+    VirtualClock can run it without waiting.
     """
     
-    def __init__(self):
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
         self.is_locked = False
         self.lock_thread = None
         self.lock_duration = 10 * 60  # Default 10 minutes in seconds
@@ -53,22 +58,15 @@ class SystemLockManager:
         if self.lock_callback:
             self.lock_callback(True)  # Notify that system is locked
         
-        # Create a thread to unlock after the specified duration
-        self.lock_thread = threading.Thread(
-            target=self._unlock_after_duration,
-            args=(self.lock_duration,)
-        )
-        self.lock_thread.daemon = True
-        self.lock_thread.start()
+        # Start a timer to unlock after the specified duration
+        self.lock_thread = self.clock.call_later(self.lock_duration, self._unlock_after_duration)
         
         return True
     
-    def _unlock_after_duration(self, duration_seconds):
+    def _unlock_after_duration(self):
         """
-        Internal method to unlock the system after a specified duration
+        Internal method to unlock the system when the lock duration is over
         """
-        time.sleep(duration_seconds)
-
         if not self._emergency_unlock_flag:
             self.is_locked = False
             if self.lock_callback:
@@ -6,17 +6,37 @@ import unittest
 import sys
 import os
 import time
-from datetime import datetime, timedelta
+import threading
+from datetime import date, datetime, timedelta, timezone
 
 # Add the current directory to the path to import local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from prayer_calculator import PrayerCalculator
+from prayer_calculator import PrayerCalculator, compute_batch
+from calculation_params import CalculationParams, AsrMethod, HighLatsMethod, MidnightMethod
+from prayer_times import PrayerTimes, format_time, format_many
+import prayer_core
+import generate_calendar
+import prayer_grid
+import benchmark
+import lazy_import
+import timezone_resolver
+import timezone_raster
+from timetable_store import TimetableStore
+from timetable_server import TimetableServer
+from online_fetcher import AsyncOnlineFetcher
+from http_client import HttpClient, CircuitBreaker, CircuitOpenError
 from system_lock import SystemLockManager
 from notification_manager import NotificationManager
 from config_manager import ConfigManager
 from service import PrayerTimeService
+from deadline_scheduler import DeadlineScheduler
+from clock import VirtualClock
+from zoneinfo import ZoneInfo
+import simulation
+from event_ledger import EventLedger
 from security_manager import SecurityManager
+from cities import CITIES
 
 
 class TestPrayerCalculator(unittest.TestCase):
@@ -51,6 +71,1201 @@ class TestPrayerCalculator(unittest.TestCase):
         self.assertEqual(self.calculator.lat, 35.6895)
         self.assertEqual(self.calculator.lng, 139.6917)
         self.assertEqual(self.calculator.timezone, 9)
+    
+    def test_sun_position_shared_per_day(self):
+        """Test each distinct time guess evaluates the sun position once"""
+        self.calculator.sun_position_evaluations = 0
+        self.calculator.get_times_offline(datetime(2026, 3, 1).date())
+        # Eight prayers share five distinct initial guesses (17 evaluations without sharing)
+        self.assertEqual(self.calculator.sun_position_evaluations, 5)
+
+
+class TestCalculationParams(unittest.TestCase):
+    """Test compiled calculation parameters"""
+    
+    def setUp(self):
+        self.calculator = PrayerCalculator(method='Makkah', coordinates=(21.4225, 39.8262), timezone=3)
+    
+    def test_compiled_values(self):
+        """Test settings strings are compiled into numbers and enums"""
+        params = self.calculator.params
+        self.assertEqual(params.fajr, 18.5)
+        self.assertEqual(params.isha, 90.0)
+        self.assertTrue(params.isha_is_min)
+        self.assertEqual(params.imsak, 10.0)
+        self.assertTrue(params.imsak_is_min)
+        self.assertIs(params.asr, AsrMethod.STANDARD)
+        self.assertEqual(params.asr_factor, 1.0)
+        self.assertIs(params.high_lats, HighLatsMethod.NIGHT_MIDDLE)
+        self.assertIs(params.midnight, MidnightMethod.STANDARD)
+    
+    def test_params_are_immutable(self):
+        """Test compiled parameters cannot be modified"""
+        with self.assertRaises(AttributeError):
+            self.calculator.params.fajr = 12
+    
+    def test_compiled_once(self):
+        """Test parameters are reused until the settings change"""
+        params = self.calculator.params
+        self.calculator.get_times_offline()
+        self.assertIs(self.calculator.params, params)
+        
+        self.calculator.settings['asr'] = 'Hanafi'
+        self.assertIsNot(self.calculator.params, params)
+        self.assertEqual(self.calculator.params.asr_factor, 2.0)
+    
+    def test_method_change_recompiles(self):
+        """Test changing the method reloads its settings"""
+        self.calculator.method = 'Tehran'
+        self.assertEqual(self.calculator.params.fajr, 17.7)
+        self.assertFalse(self.calculator.params.isha_is_min)
+        self.assertIs(self.calculator.params.midnight, MidnightMethod.JAFARI)
+    
+    def test_adjust_and_tune(self):
+        """Test adjust() and tune() update the compiled parameters"""
+        self.calculator.adjust(highLats='OneSeventh')
+        self.calculator.tune(fajr=2)
+        self.assertIs(self.calculator.params.high_lats, HighLatsMethod.ONE_SEVENTH)
+        self.assertEqual(self.calculator.params.offsets[1], 2.0)
+    
+    def test_equal_settings_hash_equal(self):
+        """Test equal settings compile to equal, hashable parameters"""
+        other = PrayerCalculator(method='Makkah')
+        self.assertEqual(other.params, self.calculator.params)
+        self.assertEqual(hash(other.params), hash(self.calculator.params))
+    
+    def test_invalid_setting(self):
+        """Test an unknown high latitude method is rejected"""
+        with self.assertRaises(ValueError):
+            CalculationParams.compile({'highLats': 'Unknown'})
+
+
+class TestPrayerTimesCache(unittest.TestCase):
+    """Test the cross-call LRU result cache"""
+    
+    def setUp(self):
+        self.calculator = PrayerCalculator(method='MWL', coordinates=(40.7128, -74.0060),
+                                           timezone=-5, cache_size=3)
+        self.day = datetime(2026, 3, 1).date()
+    
+    def test_repeated_lookup_hits(self):
+        """Test the same day is computed once"""
+        first = self.calculator.get_times_offline(self.day)
+        second = self.calculator.get_times_offline(self.day)
+        self.assertEqual(first, second)
+        info = self.calculator.cache_info()
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 1)
+    
+    def test_results_are_copies(self):
+        """Test callers cannot modify cached entries"""
+        self.calculator.get_times_offline(self.day)['fajr'] = 'changed'
+        self.assertNotEqual(self.calculator.get_times_offline(self.day)['fajr'], 'changed')
+    
+    def test_eviction(self):
+        """Test the least recently used day is evicted"""
+        for i in range(4):
+            self.calculator.get_times_offline(self.day + timedelta(days=i))
+        info = self.calculator.cache_info()
+        self.assertEqual(info['size'], 3)
+        self.assertEqual(info['evictions'], 1)
+        
+        self.calculator.get_times_offline(self.day)
+        self.assertEqual(self.calculator.cache_info()['misses'], 5)
+    
+    def test_invalidation(self):
+        """Test set_location and method changes clear the cache"""
+        self.calculator.get_times_offline(self.day)
+        self.calculator.set_location((51.5074, -0.1278), 0)
+        self.assertEqual(self.calculator.cache_info()['size'], 0)
+        
+        self.calculator.get_times_offline(self.day)
+        self.calculator.method = 'ISNA'
+        self.assertEqual(self.calculator.cache_info()['size'], 0)
+    
+    def test_settings_change_misses(self):
+        """Test changed settings are not served from the cache"""
+        standard = self.calculator.get_times_offline(self.day)
+        self.calculator.adjust(asr='Hanafi')
+        hanafi = self.calculator.get_times_offline(self.day)
+        self.assertNotEqual(standard['asr'], hanafi['asr'])
+    
+    def test_online_results_cached(self):
+        """Test successful online fetches are cached and failures are not"""
+        calls = []
+        
+        def fetch(date_obj, location):
+            calls.append(date_obj)
+            return {'fajr': 5.5} if len(calls) > 1 else None
+        
+        self.calculator._fetch_online = fetch
+        self.assertIn('isha', self.calculator.get_times_online(self.day))  # Offline fallback
+        self.assertEqual(self.calculator.get_times_online(self.day), {'fajr': 5.5})
+        self.assertEqual(self.calculator.get_times_online(self.day), {'fajr': 5.5})
+        self.assertEqual(len(calls), 2)
+
+
+class TestPrayerCore(unittest.TestCase):
+    """Test the stateless calculation core"""
+    
+    def setUp(self):
+        self.day = datetime(2026, 6, 21).date()
+        self.locations = [(21.4225, 39.8262, 3), (51.5074, -0.1278, 1), (-33.8688, 151.2093, 10),
+                          (40.7128, -74.0060, -4), (64.1466, -21.9426, 0)]
+    
+    def test_compute_day_matches_calculator(self):
+        """Test compute_day gives the calculator's float hours"""
+        calculator = PrayerCalculator(method='ISNA', coordinates=(40.7128, -74.0060), timezone=-4)
+        jd = prayer_core.julian(self.day.year, self.day.month, self.day.day)
+        stats = {}
+        hours = prayer_core.compute_day(calculator.params, 40.7128, -74.0060, -4, jd, stats=stats)
+        self.assertEqual(hours, dict(calculator.get_prayer_times(self.day).hours))
+        self.assertEqual(stats['sun_position_evaluations'], 5)
+    
+    def test_concurrent_calculations(self):
+        """Test one calculator shared by threads with changing locations"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        params = PrayerCalculator(method='MWL').params
+        jd = prayer_core.julian(self.day.year, self.day.month, self.day.day)
+        expected = [prayer_core.compute_day(params, lat, lng, tz, jd) for lat, lng, tz in self.locations]
+        
+        def work(index):
+            lat, lng, tz = self.locations[index % len(self.locations)]
+            return prayer_core.compute_day(params, lat, lng, tz, jd)
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(work, range(200)))
+        for index, result in enumerate(results):
+            self.assertEqual(result, expected[index % len(self.locations)])
+    
+    def test_params_pickle(self):
+        """Test compiled parameters can be sent to worker processes"""
+        import pickle
+        
+        params = PrayerCalculator(method='Tehran').params
+        copy = pickle.loads(pickle.dumps(params))
+        self.assertEqual(copy, params)
+        self.assertEqual(hash(copy), hash(params))
+
+
+class TestConvergence(unittest.TestCase):
+    """Test iterating to a tolerance and warm starting from previous days"""
+    
+    def setUp(self):
+        self.start = datetime(2026, 4, 1).date()
+        self.params = PrayerCalculator(method='MWL').params
+    
+    def assert_close(self, times, expected, seconds):
+        for name, value in expected.items():
+            if value != value:
+                self.assertNotEqual(times[name], times[name], name)  # Both undefined
+            else:
+                self.assertLess(abs(times[name] - value) * 3600, seconds, name)
+    
+    def test_tolerance_converges(self):
+        """Test iterating to a tolerance reaches the fully iterated times"""
+        jd = prayer_core.julian(2026, 4, 1)
+        reference = prayer_core.compute_day(self.params, 51.5074, -0.1278, 1, jd, num_iterations=prayer_core.MAX_ITERATIONS)
+        stats = {}
+        times = prayer_core.compute_day(self.params, 51.5074, -0.1278, 1, jd, stats=stats, tolerance=1)
+        self.assert_close(times, reference, 1)
+        self.assertGreater(stats['iterations'], 1)
+        self.assertLess(stats['iterations'], prayer_core.MAX_ITERATIONS)
+        
+        # Without a tolerance, num_iterations passes are run as before
+        stats = {}
+        prayer_core.compute_day(self.params, 51.5074, -0.1278, 1, jd, num_iterations=3, stats=stats)
+        self.assertEqual(stats['iterations'], 3)
+    
+    def test_warm_start_matches_cold_start(self):
+        """Test consecutive days warm started stay within tolerance of cold starts and iterate less"""
+        for lat, lng in ((21.4225, 39.8262), (59.9139, 10.7522), (-33.8688, 151.2093)):
+            warm = PrayerCalculator(coordinates=(lat, lng), cache_size=0)
+            cold = PrayerCalculator(coordinates=(lat, lng), cache_size=0)
+            warm.convergence_seconds = cold.convergence_seconds = 1
+            cold.warm_start = False
+            for index in range(120):
+                day = self.start + timedelta(days=index)
+                self.assert_close(warm.get_prayer_times(day).hours, cold.get_prayer_times(day).hours, 2)
+            self.assertLess(warm.iterations, cold.iterations)
+    
+    def test_warm_start_per_thread(self):
+        """Test a thread computing other days does not share the warm start of this one"""
+        calculator = PrayerCalculator(coordinates=(21.4225, 39.8262), cache_size=0)
+        calculator.convergence_seconds = 1
+        calculator.get_prayer_times(self.start)
+        worker = threading.Thread(target=calculator.get_prayer_times, args=(self.start + timedelta(days=100),))
+        worker.start()
+        worker.join()
+        self.assertEqual(calculator._warm.last_solution[3], self.start)
+    
+    def test_range_with_tolerance(self):
+        """Test the range engine iterates to the tolerance as well"""
+        calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1, cache_size=0)
+        calculator.convergence_seconds = 1
+        times = calculator.get_times_range(self.start, self.start + timedelta(days=59))
+        self.assertGreater(calculator.iterations, 1)
+        for index in (0, 30, 59):
+            day = self.start + timedelta(days=index)
+            expected = calculator.get_prayer_times(day).hours
+            self.assert_close({name: times[name][index] for name in expected}, expected, 2)
+    
+    def test_tolerance_keys_cache_and_store(self):
+        """Test results iterated to a tolerance are cached and stored apart from fixed passes"""
+        calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1)
+        fixed = calculator.get_prayer_times(self.start)
+        calculator.convergence_seconds = 1
+        self.assertIsNot(calculator.get_prayer_times(self.start), fixed)
+        self.assertTrue(calculator._store_settings(calculator.params).endswith(':1s'))
+
+
+class TestOnlineMonthCache(unittest.TestCase):
+    """Test whole months of the calendar API are cached"""
+    
+    class FakeResponse:
+        status_code = 200
+        
+        def __init__(self, payload):
+            self.payload = payload
+        
+        def json(self):
+            return self.payload
+    
+    class FakeClient:
+        def __init__(self):
+            self.urls = []
+        
+        def is_available(self, url):
+            return True
+        
+        def get(self, url, params=None, **kwargs):
+            self.urls.append(url)
+            year, month = map(int, url.rstrip('/').split('/')[-2:])
+            days = (datetime(year + month // 12, month % 12 + 1, 1) - datetime(year, month, 1)).days
+            data = [{'date': {'gregorian': {'day': f"{day:02d}"}},
+                     'timings': {'Fajr': '05:%02d (BST)' % day, 'Sunrise': '06:30 (BST)',
+                                 'Dhuhr': '12:10 (BST)', 'Asr': '15:40 (BST)',
+                                 'Maghrib': '18:20 (BST)', 'Isha': '19:45 (BST)'}}
+                    for day in range(1, days + 1)]
+            return TestOnlineMonthCache.FakeResponse({'code': 200, 'data': data})
+    
+    def setUp(self):
+        self.client = self.FakeClient()
+        self.calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1, http_client=self.client)
+    
+    def test_month_fetched_once(self):
+        """Test every day of a month is answered from one request"""
+        for day in range(1, 21):
+            times = self.calculator.get_prayer_times(datetime(2026, 4, day).date(), source='online')
+            self.assertEqual(times.source, 'online')
+            self.assertAlmostEqual(times.hours['fajr'], 5 + day / 60.0)
+        self.assertEqual(len(self.client.urls), 1)
+        self.assertTrue(self.client.urls[0].endswith('/v1/calendar/2026/4'))
+        self.assertEqual(self.calculator.cache_info()['month_hits'], 19)
+    
+    def test_next_month_prefetched(self):
+        """Test the next month is fetched in the background near month end"""
+        self.calculator.get_prayer_times(datetime(2026, 12, 30).date(), source='online')
+        for thread in list(self.calculator._prefetching.values()):
+            thread.join(5)
+        self.assertEqual(len(self.client.urls), 2)
+        self.assertTrue(self.client.urls[1].endswith('/v1/calendar/2027/1'))
+        
+        times = self.calculator.get_prayer_times(datetime(2027, 1, 1).date(), source='online')
+        self.assertEqual(times.source, 'online')
+        self.assertEqual(len(self.client.urls), 2)
+
+
+class TestTimetableStore(unittest.TestCase):
+    """Test the persistent SQLite timetable store"""
+    
+    def setUp(self):
+        self.path = "test_prayer_times.db"
+        self.store = TimetableStore(self.path)
+        self.day = datetime(2026, 5, 10).date()
+    
+    def tearDown(self):
+        self.store.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+    
+    def make_calculator(self):
+        return PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1, store=self.store)
+    
+    def test_wal_mode(self):
+        """Test the database runs in WAL mode"""
+        self.assertEqual(self.store._conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+    
+    def test_warm_start_without_calculation(self):
+        """Test a new calculator reads stored days instead of computing them"""
+        expected = self.make_calculator().get_prayer_times(self.day)
+        
+        calculator = self.make_calculator()
+        times = calculator.get_prayer_times(self.day)
+        self.assertEqual(dict(times.hours), dict(expected.hours))
+        self.assertEqual(calculator.sun_position_evaluations, 0)
+        self.assertIsNotNone(self.store.updated_at(51.5074, -0.1278, 'MWL', self.day))
+        
+        # Different settings do not reuse the stored day
+        calculator.adjust(asr='Hanafi')
+        self.assertNotEqual(calculator.get_prayer_times(self.day).hours['asr'], expected.hours['asr'])
+    
+    def test_online_rows_kept(self):
+        """Test offline results never replace an online day"""
+        online = PrayerTimes(self.day, {'fajr': 4.5}, 1, 'online')
+        self.store.put(51.5074, -0.1278, 'MWL', online)
+        self.store.put(51.5074, -0.1278, 'MWL', PrayerTimes(self.day, {'fajr': 4.0}, 1, 'offline'))
+        stored = self.store.get(51.5074, -0.1278, 'MWL', self.day)
+        self.assertEqual((stored.source, stored.hours['fajr']), ('online', 4.5))
+        
+        calculator = self.make_calculator()
+        calculator._fetch_online = lambda date_obj, location: self.fail("network used")
+        self.assertEqual(calculator.get_prayer_times(self.day, source='online').hours['fajr'], 4.5)
+    
+    def test_stored_range(self):
+        """Test bulk range reads fill missing days and read back in date order"""
+        calculator = self.make_calculator()
+        calculator.get_prayer_times(self.day)
+        days = calculator.get_stored_range(self.day - timedelta(days=5), self.day + timedelta(days=5))
+        self.assertEqual(len(days), 11)
+        self.assertEqual(days[5].hours['fajr'], calculator.get_prayer_times(self.day).hours['fajr'])
+        
+        stored = self.store.get_range(51.5074, -0.1278, 'MWL', days[0].date, days[-1].date)
+        self.assertEqual([times.date for times in stored], [times.date for times in days])
+
+
+class TestAsyncOnlineFetcher(unittest.TestCase):
+    """Test the concurrent online fetcher against the local stand-in server"""
+    
+    def setUp(self):
+        self.server = TimetableServer().start()
+        self.day = datetime(2026, 7, 15).date()
+        self.sites = [{'lat': 21.4225, 'lng': 39.8262, 'tz': 3, 'method': 'Makkah'},
+                      {'lat': 51.5074, 'lng': -0.1278, 'tz': 0, 'method': 'MWL'},
+                      {'lat': 51.5074, 'lng': -0.1278, 'tz': 0, 'method': 'MWL'},
+                      {'lat': -33.8688, 'lng': 151.2093, 'tz': 10}]
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def test_fetch_many(self):
+        """Test every site gets the server's times and duplicate sites share a request"""
+        fetcher = AsyncOnlineFetcher(self.server.url, concurrency=2)
+        results = fetcher.run(self.sites, self.day)
+        self.assertEqual([times.source for times in results], ['online'] * 4)
+        self.assertEqual(fetcher.stats['requests'], 3)
+        
+        expected = PrayerCalculator(method='Makkah', coordinates=(21.4225, 39.8262), timezone=3)
+        self.assertEqual(results[0].formatted()['fajr'], expected.get_times_offline(self.day)['fajr'])
+    
+    def test_deadline_falls_back_offline(self):
+        """Test requests past their deadline fall back to the offline calculation"""
+        self.server.delay = 1.0
+        fetcher = AsyncOnlineFetcher(self.server.url, timeout=0.1)
+        results = fetcher.run(self.sites[:2], self.day)
+        self.assertEqual([times.source for times in results], ['offline'] * 2)
+        self.assertEqual(fetcher.stats['timeouts'], 2)
+        
+        expected = PrayerCalculator(method='MWL', coordinates=(51.5074, -0.1278), timezone=0)
+        self.assertEqual(dict(results[1].hours), dict(expected.get_prayer_times(self.day).hours))
+    
+    def test_iana_zone_sites(self):
+        """Test sites with IANA zones get that day's offset, online and on the offline fallback"""
+        sites = [{'lat': 51.5074, 'lng': -0.1278, 'tz': 'Europe/London', 'method': 'MWL'}]
+        expected = PrayerCalculator(method='MWL', coordinates=(51.5074, -0.1278), timezone='Europe/London')
+        online = AsyncOnlineFetcher(self.server.url).run(sites, self.day)[0]
+        self.assertEqual((online.source, online.timezone), ('online', 1))  # British Summer Time
+        
+        self.server.stop()  # Unreachable host
+        fetcher = AsyncOnlineFetcher(self.server.url, timeout=1.0)
+        results = fetcher.run(sites + [{'lat': 21.4225, 'lng': 39.8262, 'tz': 3}], self.day)
+        self.assertEqual([times.source for times in results], ['offline'] * 2)
+        self.assertEqual(fetcher.stats['fallbacks'], 2)
+        self.assertEqual(dict(results[0].hours), dict(expected.get_prayer_times(self.day).hours))
+        self.assertEqual(results[0].timezone, 1)
+    
+    def test_rate_limit(self):
+        """Test requests to one host are spread out by the rate limiter"""
+        sites = [{'lat': 10.0 + i, 'lng': 20.0, 'tz': 1} for i in range(6)]
+        fetcher = AsyncOnlineFetcher(self.server.url, rate_per_host=20.0, burst=1)
+        start = time.monotonic()
+        fetcher.run(sites, self.day)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class TestOfflineFirst(unittest.TestCase):
+    """Test offline-first results reconciled with online times in the background"""
+    
+    def setUp(self):
+        self.calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1)
+        self.day = datetime(2026, 8, 3).date()
+        self.offline = self.calculator.get_prayer_times(self.day)
+        self.release = threading.Event()
+        self.events = []
+        self.calculator.subscribe(lambda *event: self.events.append(event))
+    
+    def fake_fetch(self, shift_minutes):
+        def fetch(date_obj, location):
+            self.release.wait(5)
+            return {name: value + shift_minutes / 60.0 for name, value in self.offline.hours.items()
+                    if name in ('fajr', 'sunrise', 'dhuhr', 'asr', 'maghrib', 'isha')}
+        self.calculator._fetch_online = fetch
+    
+    def wait_reconciled(self):
+        self.release.set()
+        for thread in list(self.calculator._reconciling.values()):
+            thread.join(5)
+    
+    def test_returns_offline_without_waiting(self):
+        """Test the offline result comes back while the online fetch is blocked"""
+        self.fake_fetch(5)
+        times = self.calculator.get_prayer_times(self.day, source='offline-first')
+        self.assertEqual(times.source, 'offline')
+        self.assertEqual(dict(times.hours), dict(self.offline.hours))
+        
+        self.wait_reconciled()
+        replaced = self.calculator.get_prayer_times(self.day, source='offline-first')
+        self.assertEqual(replaced.source, 'online')
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0][0], self.day)
+        self.assertIs(self.events[0][2], replaced)
+    
+    def test_small_difference_keeps_offline(self):
+        """Test online times within the threshold do not replace the result"""
+        self.fake_fetch(1)
+        self.calculator.get_prayer_times(self.day, source='offline-first')
+        self.wait_reconciled()
+        self.assertEqual(self.calculator.get_prayer_times(self.day, source='offline-first').source, 'offline')
+        self.assertEqual(self.events, [])
+    
+    def test_max_difference_wraps_midnight(self):
+        """Test differences across midnight are measured the short way"""
+        late = PrayerTimes(self.day, {'isha': 23.95})
+        early = PrayerTimes(self.day, {'isha': 0.05})
+        self.assertAlmostEqual(PrayerCalculator.max_difference(late, early), 6.0)
+
+
+class TestTimetableServer(unittest.TestCase):
+    """Test the local Aladhan-compatible server"""
+    
+    def setUp(self):
+        self.server = TimetableServer().start()
+        self.client = HttpClient(retries=0)
+    
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+    
+    def test_calendar_parsed_by_calculator(self):
+        """Test the calculator's online path parses the server's calendar"""
+        calculator = PrayerCalculator(method='ISNA', coordinates=(40.7128, -74.0060), timezone=-5,
+                                      http_client=self.client)
+        calculator.API_URL = self.server.url
+        day = datetime(2026, 1, 20).date()
+        times = calculator.get_prayer_times(day, source='online')
+        self.assertEqual(times.source, 'online')
+        offline = calculator.get_times_offline(day)
+        self.assertEqual(times.formatted()['fajr'], offline['fajr'])
+        self.assertEqual(times.formatted()['isha'], offline['isha'])
+    
+    def test_timings_by_city(self):
+        """Test timingsByCity resolves the city and its DST offset"""
+        response = self.client.get(self.server.url + "/v1/timingsByCity/01-07-2026",
+                                   params={'city': 'London', 'country': 'UK', 'method': 2})
+        data = response.json()['data']
+        self.assertEqual(data['meta']['timezone'], 'Europe/London')
+        expected = PrayerCalculator(method='ISNA', coordinates=(51.5074, -0.1278), timezone=1)
+        self.assertEqual(data['timings']['Dhuhr'], expected.get_times_offline(datetime(2026, 7, 1).date())['dhuhr'])
+        
+        unknown = self.client.get(self.server.url + "/v1/timingsByCity/01-07-2026", params={'city': 'Atlantis'})
+        self.assertEqual(unknown.status_code, 400)
+    
+    def test_unknown_method_number(self):
+        """Test method numbers without a method are a bad request instead of silently MWL"""
+        calendar_url = self.server.url + "/v1/calendar/2026/2"
+        response = self.client.get(calendar_url, params={'latitude': 21.4225, 'longitude': 39.8262, 'method': 99})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.server.url + "/v1/timingsByCity/01-07-2026",
+                                   params={'city': 'London', 'method': 99})
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.get(calendar_url, params={'latitude': 21.4225, 'longitude': 39.8262})
+        self.assertEqual(response.json()['data'][0]['meta']['method'], {'id': 3, 'name': 'Muslim World League'})
+    
+    def test_etag_and_cache(self):
+        """Test repeated requests are cached and If-None-Match gives 304"""
+        url = self.server.url + "/v1/calendar/2026/2"
+        params = {'latitude': 21.4225, 'longitude': 39.8262, 'method': 4}
+        first = self.client.get(url, params=params)
+        etag = first.headers['ETag']
+        
+        second = self.client.get(url, params=params, headers={'If-None-Match': etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(self.server.cache_stats, {'hits': 1, 'misses': 1})
+        self.assertEqual(len(first.json()['data']), 28)
+        self.assertEqual(first.json()['data'][0]['meta']['timezone'], 'Asia/Riyadh')
+
+
+class TestZoneRaster(unittest.TestCase):
+    """Test building and reading timezone raster files"""
+    
+    path = "test_timezone_raster.bin"
+    
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def test_borders(self):
+        """Test borders between samples are bisected to the raster resolution"""
+        def zone_at(lat, lng):
+            if lat < 0:
+                return None
+            return 'Europe/Paris' if lng < 10.03 else 'Europe/Berlin'
+        
+        timezone_raster.build_raster(self.path, zone_at, lat_step=1, resolution=0.01, sample_units=1000)
+        raster = timezone_raster.ZoneRaster(self.path)
+        self.assertEqual(raster.lookup(45.5, 10.02), 'Europe/Paris')
+        self.assertEqual(raster.lookup(45.5, 10.04), 'Europe/Berlin')
+        self.assertEqual(raster.lookup(45.5, 180.0), 'Europe/Paris')  # Wraps to -180
+        self.assertIsNone(raster.lookup(-45.5, 10.04))
+        self.assertEqual(len(raster), 180 + 90)  # One run per row, two north of the equator
+
+
+class TestTimezoneResolver(unittest.TestCase):
+    """Test offline timezone and DST resolution"""
+    
+    # Places near zone borders, where the nearest reference point is in another zone
+    BORDER_CASES = (
+        ('Indianapolis', 39.7684, -86.1581, 'America/Indiana/Indianapolis'),
+        ('Lviv', 49.8397, 24.0297, 'Europe/Kyiv'),
+        ('Kaliningrad', 54.7104, 20.4522, 'Europe/Kaliningrad'),
+        ('El Paso', 31.7619, -106.4850, 'America/Denver'),
+        ('Juneau', 58.3019, -134.4197, 'America/Juneau'),
+        ('Thunder Bay', 48.3809, -89.2477, 'America/Toronto'),
+        ('Amritsar', 31.6340, 74.8723, 'Asia/Kolkata'),
+        ('Abadan', 30.3473, 48.2934, 'Asia/Tehran'),
+        ('Iqaluit', 63.7467, -68.5170, 'America/Iqaluit'),
+        ('Norilsk', 69.3558, 88.1893, 'Asia/Krasnoyarsk'),
+    )
+    
+    def assert_same_offsets(self, zone, expected, label):
+        """Zones agree in winter and summer (names may differ by tzdata version)"""
+        for day in (datetime(2025, 1, 15).date(), datetime(2025, 7, 15).date()):
+            self.assertEqual(timezone_resolver.utc_offset(zone, day), timezone_resolver.utc_offset(expected, day),
+                             f"{label}: {zone} on {day}")
+    
+    def test_border_cases(self):
+        """Test places near zone borders resolve to the zone they are in"""
+        for name, lat, lng, expected in self.BORDER_CASES:
+            self.assert_same_offsets(timezone_resolver.resolve_timezone(lat, lng), expected, name)
+    
+    def test_cities_resolve_to_their_zone(self):
+        """Test every reference city resolves to its listed zone"""
+        for city, _, _, lat, lng, zone in CITIES:
+            self.assert_same_offsets(timezone_resolver.resolve_timezone(lat, lng), zone, city)
+    
+    def test_nearest_zone_fallback(self):
+        """Test the reference point search used without the raster"""
+        self.assertEqual(timezone_resolver.nearest_zone(51.5, -0.1), 'Europe/London')
+        self.assertEqual(timezone_resolver.nearest_zone(0.0, -140.0), 'Etc/GMT+9')
+    
+    def test_resolve_timezone(self):
+        """Test coordinates resolve to their zone, at sea to the nautical zone"""
+        self.assertEqual(timezone_resolver.resolve_timezone(51.5, -0.1), 'Europe/London')
+        self.assertEqual(timezone_resolver.resolve_timezone(33.45, -112.07), 'America/Phoenix')
+        self.assertEqual(timezone_resolver.resolve_timezone(27.7, 85.3), 'Asia/Kathmandu')
+        self.assertEqual(timezone_resolver.resolve_timezone(-34.9, 138.6), 'Australia/Adelaide')
+        self.assertEqual(timezone_resolver.resolve_timezone(-8.0, 179.0), 'Etc/GMT-12')  # Open sea
+        self.assertEqual(timezone_resolver.resolve_timezone(0.0, -140.0), 'Etc/GMT+9')
+    
+    def test_transitions_match_zoneinfo(self):
+        """Test cached transitions give the zoneinfo offset at noon of every day"""
+        from zoneinfo import ZoneInfo
+        
+        start = datetime(2026, 1, 1).date()
+        for zone in ('Europe/London', 'Australia/Sydney', 'Africa/Casablanca', 'Asia/Riyadh'):
+            offsets = timezone_resolver.day_offsets(zone, start, 365)
+            for index, offset in enumerate(offsets):
+                noon = datetime(2026, 1, 1, 12) + timedelta(days=index)
+                expected = noon.replace(tzinfo=ZoneInfo(zone)).utcoffset().total_seconds() / 3600
+                self.assertEqual(offset, expected, (zone, index))
+        self.assertEqual(timezone_resolver.year_transitions('Europe/London', 2026), ((0, 0.0), (87, 1.0), (297, 0.0)))
+    
+    def test_offsets_across_years(self):
+        """Test ranges spanning a new year match the single date offsets"""
+        start = datetime(2025, 10, 1).date()
+        offsets = timezone_resolver.day_offsets('America/New_York', start, 250)
+        self.assertEqual(offsets, [timezone_resolver.utc_offset('America/New_York', start + timedelta(days=i))
+                                   for i in range(250)])
+    
+    def test_calculator_applies_dst(self):
+        """Test a calculator with an IANA zone uses each date's offset"""
+        calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone='Europe/London')
+        self.assertEqual(calculator.get_prayer_times(datetime(2026, 1, 10).date()).timezone, 0)
+        self.assertEqual(calculator.get_prayer_times(datetime(2026, 7, 10).date()).timezone, 1)
+        
+        summer = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1)
+        times = calculator.get_times_range(datetime(2026, 3, 28).date(), datetime(2026, 3, 29).date())
+        self.assertEqual(times['dhuhr'][1], summer.get_prayer_times(datetime(2026, 3, 29).date()).hours['dhuhr'])
+        self.assertAlmostEqual(times['dhuhr'][1] - times['dhuhr'][0], 1, delta=0.01)
+    
+    def test_batch_with_zones(self):
+        """Test compute_batch resolves IANA zones per date"""
+        dates = [datetime(2026, 1, 10).date(), datetime(2026, 7, 10).date()]
+        zones = compute_batch([51.5074, 40.7128], [-0.1278, -74.0060], ['Europe/London', 'America/New_York'], dates)
+        self.assertEqual(zones.shape, (2, 2, 9))
+        for day, offsets, result in zip(dates, ([0, -5], [1, -4]), zones):
+            fixed = compute_batch([51.5074, 40.7128], [-0.1278, -74.0060], offsets, day)
+            self.assertTrue((result == fixed).all())
+
+
+class TestHttpClient(unittest.TestCase):
+    """Test retries and the circuit breaker of the shared HTTP client"""
+    
+    def setUp(self):
+        self.client = HttpClient(retries=2, failure_threshold=2, reset_timeout=60)
+        self.client._sleep = lambda seconds: None
+        self.calls = []
+    
+    def failing_get(self, url, params=None, **kwargs):
+        import requests
+        self.calls.append(kwargs.get('timeout'))
+        raise requests.ConnectionError("unreachable")
+    
+    def test_retries_with_timeout(self):
+        """Test connection errors are retried and every attempt has a timeout"""
+        import requests
+        
+        self.client.session.get = self.failing_get
+        with self.assertRaises(requests.ConnectionError):
+            self.client.get("http://api.example.test/v1/calendar")
+        self.assertEqual(self.calls, [(3.05, 10)] * 3)
+    
+    def test_breaker_opens(self):
+        """Test repeated failures open the breaker and skip the network"""
+        import requests
+        
+        self.client.session.get = self.failing_get
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                self.client.get("http://api.example.test/a")
+        self.assertFalse(self.client.is_available("http://api.example.test/b"))
+        self.assertTrue(self.client.is_available("http://other.example.test/"))
+        
+        with self.assertRaises(CircuitOpenError):
+            self.client.get("http://api.example.test/a")
+        self.assertEqual(len(self.calls), 6)
+    
+    def test_breaker_half_open(self):
+        """Test a single trial request is allowed after the reset timeout"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        now[0] = 61
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_calculator_falls_back_when_open(self):
+        """Test the calculator goes straight to offline times while the breaker is open"""
+        self.client.session.get = self.failing_get
+        calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=0, http_client=self.client)
+        day = datetime(2026, 3, 1).date()
+        for _ in range(3):
+            times = calculator.get_prayer_times(day, source='online')
+            self.assertEqual(times.source, 'offline')
+        self.assertEqual(len(self.calls), 6)  # Two failed requests with retries, then none
+
+
+class TestPrayerTimesResult(unittest.TestCase):
+    """Test the numeric PrayerTimes result"""
+    
+    def setUp(self):
+        self.calculator = PrayerCalculator(method='MWL', coordinates=(40.7128, -74.0060), timezone=-5)
+        self.day = datetime(2026, 3, 1).date()
+    
+    def test_formatting_matches_offline(self):
+        """Test lazy formatting gives the get_times_offline strings"""
+        times = self.calculator.get_prayer_times(self.day)
+        self.assertIsInstance(times, PrayerTimes)
+        self.assertEqual(times.formatted('24h'), self.calculator.get_times_offline(self.day))
+        self.assertTrue(times.formatted('12h')['isha'].endswith('PM'))
+    
+    def test_timestamps(self):
+        """Test epoch timestamps match the displayed local minute"""
+        times = PrayerTimes(self.day, {'fajr': 5.25, 'isha': 19.999}, timezone=-5)
+        expected = datetime(2026, 3, 1, 10, 15, tzinfo=timezone.utc).timestamp()
+        self.assertEqual(times.timestamp('fajr'), int(expected))
+        self.assertEqual(times.datetime('fajr').utcoffset(), timedelta(hours=-5))
+        self.assertEqual(times.datetime('isha').hour, 20)
+        self.assertEqual(times.datetime('isha').minute, 0)
+    
+    def test_times_after_midnight_belong_to_next_day(self):
+        """Test a midnight past 24h is timestamped on the following day"""
+        times = PrayerTimes(self.day, {'isha': 23.5, 'midnight': 24.25})
+        self.assertEqual(times.timestamp('midnight') - times.timestamp('isha'), 45 * 60)
+        self.assertEqual(times.formatted()['midnight'], '00:15')
+    
+    def test_undefined_times(self):
+        """Test undefined (NaN) times have no timestamp"""
+        times = PrayerTimes(self.day, {'fajr': float('nan'), 'dhuhr': 12.0})
+        self.assertIsNone(times.timestamp('fajr'))
+        self.assertEqual(times.formatted()['fajr'], '-----')
+        self.assertEqual([name for _, name in times.events()], ['dhuhr'])
+    
+    def test_format_tables(self):
+        """Test table formatting rounds like the arithmetic, in both formats"""
+        self.assertEqual(format_time(5.25), '05:15')
+        self.assertEqual(format_time(12.0 - 0.4 / 60, '12h'), '12:00 PM')
+        self.assertEqual(format_time(23.995), '00:00')
+        self.assertEqual(format_time(-0.25, '12h'), '11:45 PM')
+        self.assertEqual(format_time(float('nan')), '-----')
+    
+    def test_format_many(self):
+        """Test bulk formatting of lists and engine arrays matches format_time"""
+        import numpy as np
+        
+        values = [0.0, 5.2583, 11.99, 12.5, 24.25, -1.0, float('nan')]
+        for time_format in ('24h', '12h'):
+            expected = [format_time(value, time_format) for value in values]
+            self.assertEqual(format_many(values, time_format), expected)
+            self.assertEqual(format_many(np.array(values), time_format).tolist(), expected)
+        
+        times = self.calculator.get_times_range(self.day, self.day + timedelta(days=30))
+        formatted = format_many(times['fajr'])
+        self.assertEqual(formatted.shape, (31,))
+        self.assertEqual(formatted[0], self.calculator.get_times_offline(self.day)['fajr'])
+        
+        batch = compute_batch([21.4, 51.5], [39.8, -0.1], [3, 0], self.day)
+        self.assertEqual(format_many(batch).shape, batch.shape)
+
+
+class TestPrayerTimesRange(unittest.TestCase):
+    """Test the vectorized date range engine against the scalar path"""
+    
+    def assert_range_matches_offline(self, calculator, start, end):
+        result = calculator.get_times_range(start, end)
+        num_days = (end - start).days + 1
+        self.assertEqual(len(result['date']), num_days)
+    
+        for i in range(num_days):
+            expected = calculator.get_times_offline(start + timedelta(days=i))
+            for name, time_str in expected.items():
+                actual = calculator._get_formatted_time(float(result[name][i]), calculator.time_format)
+                self.assertEqual(actual, time_str, f"{name} on day {i}")
+    
+    def test_full_year_matches_offline(self):
+        """Test a whole year gives the same minutes as get_times_offline"""
+        calculator = PrayerCalculator(method='MWL', coordinates=(40.7128, -74.0060), timezone=-5)
+        self.assert_range_matches_offline(calculator, datetime(2026, 1, 1).date(), datetime(2026, 12, 31).date())
+    
+    def test_high_latitude_methods_match_offline(self):
+        """Test high latitude rules and minute based settings"""
+        for method in ('Makkah', 'Tehran', 'ISNA'):
+            for high_lats in ('NightMiddle', 'AngleBased', 'OneSeventh'):
+                calculator = PrayerCalculator(method=method, coordinates=(64.1466, -21.9426), timezone=0)
+                calculator.settings['highLats'] = high_lats
+                self.assert_range_matches_offline(calculator, datetime(2026, 5, 20).date(), datetime(2026, 7, 20).date())
+    
+    def test_single_day(self):
+        """Test a range of one day"""
+        calculator = PrayerCalculator(method='ISNA', coordinates=(21.4225, 39.8262), timezone=3)
+        day = datetime(2026, 3, 1).date()
+        result = calculator.get_times_range(day, day)
+        self.assertEqual(len(result['fajr']), 1)
+    
+    def test_invalid_range(self):
+        """Test the end date must not be before the start date"""
+        with self.assertRaises(ValueError):
+            PrayerCalculator().get_times_range(datetime(2026, 3, 2).date(), datetime(2026, 3, 1).date())
+
+
+class TestComputeBatch(unittest.TestCase):
+    """Test batch computation over arrays of locations"""
+    
+    def setUp(self):
+        self.locations = [
+            (40.7128, -74.0060, -5),  # New York
+            (21.4225, 39.8262, 3),    # Makkah
+            (51.5074, -0.1278, 0),    # London
+            (-33.8688, 151.2093, 10), # Sydney
+            (64.1466, -21.9426, 0),   # Reykjavik
+        ]
+        self.latitudes = [loc[0] for loc in self.locations]
+        self.longitudes = [loc[1] for loc in self.locations]
+        self.timezones = [loc[2] for loc in self.locations]
+    
+    def test_single_date_matches_offline(self):
+        """Test each location matches its own calculator"""
+        day = datetime(2026, 6, 21).date()
+        result = compute_batch(self.latitudes, self.longitudes, self.timezones, day, 'ISNA')
+        self.assertEqual(result.shape, (len(self.locations), 9))
+        
+        for i, (lat, lng, tz) in enumerate(self.locations):
+            calculator = PrayerCalculator(method='ISNA', coordinates=(lat, lng), timezone=tz)
+            expected = calculator.get_times_offline(day)
+            for j, name in enumerate(calculator.get_time_names()):
+                self.assertEqual(calculator._get_formatted_time(result[i, j], '24h'), expected[name])
+    
+    def test_date_axis(self):
+        """Test a sequence of dates adds a leading date axis"""
+        days = [datetime(2026, 1, 1).date() + timedelta(days=i) for i in range(4)]
+        result = compute_batch(self.latitudes, self.longitudes, self.timezones, days, 'MWL')
+        self.assertEqual(result.shape, (4, len(self.locations), 9))
+        
+        calculator = PrayerCalculator(method='MWL', coordinates=self.locations[2][:2], timezone=0)
+        expected = calculator.get_times_offline(days[3])
+        self.assertEqual(calculator._get_formatted_time(result[3, 2, 1], '24h'), expected['fajr'])
+
+
+class TestCalendarGenerator(unittest.TestCase):
+    """Test the bulk timetable generator"""
+    
+    def setUp(self):
+        self.sites_file = "test_sites.csv"
+        with open(self.sites_file, "w") as f:
+            f.write("name,lat,lng,tz,method\n")
+            f.write("Makkah,21.4225,39.8262,3,Makkah\n")
+            f.write("London,51.5074,-0.1278,0,MWL\n")
+            f.write("Tromso,69.6492,18.9553,1,ISNA\n")
+        self.sites = generate_calendar.load_sites(self.sites_file)
+    
+    def tearDown(self):
+        if os.path.exists(self.sites_file):
+            os.remove(self.sites_file)
+    
+    def test_load_sites(self):
+        """Test sites are read from CSV and validated"""
+        self.assertEqual([site['name'] for site in self.sites], ['Makkah', 'London', 'Tromso'])
+        self.assertEqual(self.sites[0]['tz'], 3.0)
+        with open(self.sites_file, "a") as f:
+            f.write("Oslo,59.9139,10.7522,Europe/Oslo,MWL\n")
+        self.assertEqual(generate_calendar.load_sites(self.sites_file)[3]['tz'], 'Europe/Oslo')
+        with open(self.sites_file, "a") as f:
+            f.write("Atlantis,0,0,Atlantis/Capital,MWL\n")
+        with self.assertRaises(ValueError):
+            generate_calendar.load_sites(self.sites_file)
+        with open(self.sites_file, "w") as f:
+            f.write("name,lat,lng,tz,method\n")
+            f.write("Nowhere,0,0,0,Unknown\n")
+        with self.assertRaises(ValueError):
+            generate_calendar.load_sites(self.sites_file)
+    
+    def test_csv_matches_calculator(self):
+        """Test worker output matches the calculator, in site order"""
+        import io
+        
+        output = io.StringIO()
+        generate_calendar.generate(self.sites, 2027, 2027, output, 'csv', workers=2, chunk_size=1)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + 3 * 365)
+        
+        row = lines[1 + 365 + 31].split(',')  # London, 1 February
+        self.assertEqual(row[:3], ['1', 'London', '2027-02-01'])
+        calculator = PrayerCalculator(method='MWL', coordinates=(51.5074, -0.1278), timezone=0)
+        expected = calculator.get_times_offline(datetime(2027, 2, 1).date())
+        self.assertEqual(row[3:], [expected[name] for name in calculator.get_time_names()])
+    
+    def test_binary_round_trip(self):
+        """Test binary records read back as float hours"""
+        import io
+        
+        output = io.BytesIO()
+        generate_calendar.generate(self.sites[:1], 2026, 2027, output, 'binary', workers=0)
+        output.seek(0)
+        records = list(generate_calendar.read_binary(output))
+        self.assertEqual(len(records), 365 * 2)
+        
+        site_index, day, times = records[-1]
+        self.assertEqual((site_index, day), (0, datetime(2027, 12, 31).date()))
+        calculator = PrayerCalculator(method='Makkah', coordinates=(21.4225, 39.8262), timezone=3)
+        expected = calculator.get_prayer_times(day).hours
+        for name, value in times.items():
+            self.assertAlmostEqual(value, expected[name], places=4)
+
+
+class TestPrayerGrid(unittest.TestCase):
+    """Test the precomputed prayer time grid"""
+    
+    path = "test_prayer_grid.bin"
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.grid = prayer_grid.build_grid(cls.path, 'MWL', step=5)
+    
+    @classmethod
+    def tearDownClass(cls):
+        del cls.grid
+        if os.path.exists(cls.path):
+            os.remove(cls.path)
+    
+    def setUp(self):
+        self.day = datetime(2026, 3, 5).date()
+    
+    def exact(self, lat, lng, tz, day):
+        calculator = PrayerCalculator(coordinates=(lat, lng), timezone=tz, cache_size=0)
+        return calculator.get_prayer_times(day).hours
+    
+    def test_header(self):
+        """Test the grid file records its method and settings"""
+        grid = prayer_grid.PrayerGrid(self.path)
+        self.assertEqual(grid.method, 'MWL')
+        self.assertEqual((grid.num_days, grid.num_lats, grid.num_lngs), (366, 37, 73))
+        self.assertTrue(grid.matches(PrayerCalculator().params))
+        self.assertFalse(grid.matches(PrayerCalculator(method='ISNA').params))
+    
+    def test_lookup_close_to_exact(self):
+        """Test interpolated times stay within a minute of the calculation, in any year"""
+        for day in (self.day, datetime(2031, 11, 20).date()):
+            times = self.grid.lookup(30.0444, 31.2357, 2, day)  # Cairo
+            expected = self.exact(30.0444, 31.2357, 2, day)
+            for name, value in times.items():
+                self.assertLess(abs(value - expected[name]) * 60, 1.0, name)
+    
+    def test_calculator_uses_grid(self):
+        """Test the calculator answers from a matching grid without computing"""
+        calculator = PrayerCalculator(coordinates=(30.0444, 31.2357), timezone=2)
+        calculator.set_grid(self.grid)
+        times = calculator.get_prayer_times(self.day)
+        self.assertEqual(calculator.sun_position_evaluations, 0)
+        expected = self.exact(30.0444, 31.2357, 2, self.day)
+        for name, value in times.hours.items():
+            self.assertAlmostEqual(value, expected[name], delta=1 / 60)
+        
+        # Other settings are computed exactly
+        calculator.adjust(asr='Hanafi')
+        calculator.get_prayer_times(self.day)
+        self.assertGreater(calculator.sun_position_evaluations, 0)
+    
+    def test_flagged_cells_computed_exactly(self):
+        """Test days the grid cannot interpolate fall back to the exact calculation"""
+        day = datetime(2026, 6, 21).date()
+        times = self.grid.lookup(51.5074, -0.1278, 1, day)  # London, next to the persistent twilight cells
+        self.assertTrue(any(value != value for value in times.values()))
+        
+        calculator = PrayerCalculator(coordinates=(51.5074, -0.1278), timezone=1)
+        calculator.set_grid(self.grid)
+        self.assertEqual(dict(calculator.get_prayer_times(day).hours), dict(self.exact(51.5074, -0.1278, 1, day)))
+        self.assertGreater(calculator.sun_position_evaluations, 0)
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test the accuracy and throughput benchmark"""
+    
+    def test_matrix_covers_high_latitudes(self):
+        """Test the benchmark cities include latitudes above 60 degrees"""
+        self.assertTrue(any(abs(lat) > 60 for _, lat, _, _ in benchmark.benchmark_sites()))
+        reference = benchmark.load_reference()
+        self.assertEqual(len(reference), len(benchmark.BENCHMARK_CITIES) * len(PrayerCalculator.METHODS) *
+                         len(benchmark.BENCHMARK_DATES))
+    
+    def test_engines_match_reference(self):
+        """Test the scalar, range and batch paths reproduce the reference fixtures"""
+        accuracy = benchmark.measure_accuracy(benchmark.load_reference())
+        self.assertEqual(set(accuracy), {'scalar', 'range', 'batch'})
+        for path, result in accuracy.items():
+            self.assertEqual(result['max_minutes'], 0, path)
+            self.assertEqual(result['undefined_mismatches'], 0, path)
+            self.assertGreater(result['compared'], 0, path)
+    
+    def test_compare_flags_regressions(self):
+        """Test compare reports slower or less accurate paths only"""
+        accuracy = {'max_minutes': 0, 'mean_minutes': 0.0, 'compared': 10, 'undefined_mismatches': 0}
+        baseline = {'throughput': {'scalar': 1000.0, 'batch': 1000.0}, 'accuracy': {'scalar': accuracy}}
+        results = {'throughput': {'scalar': 900.0, 'batch': 500.0},
+                   'accuracy': {'scalar': dict(accuracy, max_minutes=2, mean_minutes=0.5)}}
+        regressions = benchmark.compare(baseline, results, slowdown=0.2)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith('batch'))
+        self.assertEqual(benchmark.compare(baseline, baseline), [])
+    
+    def test_startup_defers_heavy_imports(self):
+        """Test starting the service imports none of the deferred dependencies"""
+        result = benchmark.measure_startup(repeat=1)
+        self.assertEqual(result['deferred_imported'], [])
+        self.assertGreater(result['import_ms'], 0)
+        self.assertEqual(benchmark.check_startup(result, {'import': float('inf'), 'build': float('inf')}), [])
+        self.assertEqual(len(benchmark.check_startup(result, {'import': 0.0, 'build': 0.0})), 2)
+
+
+class TestLazyImport(unittest.TestCase):
+    """Test deferred imports of heavy dependencies"""
+    
+    def test_loads_on_first_attribute(self):
+        """Test a lazy module is only imported when used"""
+        sys.modules.pop('colorsys', None)
+        module = lazy_import.lazy_import('colorsys')
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertFalse(module.loaded)
+        self.assertEqual(module.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertTrue(module.loaded)
+        self.assertIn('colorsys', sys.modules)
+    
+    def test_imported_and_missing_modules(self):
+        """Test imported modules are returned as is and missing ones raise ImportError"""
+        self.assertIs(lazy_import.lazy_import('json'), sys.modules['json'])
+        with self.assertRaises(ImportError):
+            lazy_import.lazy_import('no_such_module_here')
+
+
+class TestVirtualClock(unittest.TestCase):
+    """Test the simulated clock"""
+    
+    def setUp(self):
+        self.clock = VirtualClock(datetime(2025, 3, 30, 0, 30), ZoneInfo('Europe/London'))
+    
+    def test_timers_run_in_order(self):
+        """Test time only moves when advanced, running due timers in order"""
+        fired = []
+        self.clock.call_later(20, fired.append, 'second')
+        self.clock.call_later(10, fired.append, 'first')
+        self.clock.call_later(30, fired.append, 'cancelled').cancel()
+        start = self.clock.time()
+        self.clock.advance(25)
+        self.assertEqual(fired, ['first', 'second'])
+        self.assertEqual(self.clock.time(), start + 25)
+        self.clock.advance(10)
+        self.assertEqual(fired, ['first', 'second'])
+    
+    def test_wait(self):
+        """Test wait stops at the timer that sets the event, or times out"""
+        event = threading.Event()
+        start = self.clock.time()
+        self.assertFalse(self.clock.wait(event, 5))
+        self.assertEqual(self.clock.time(), start + 5)
+        self.clock.call_later(100, event.set)
+        self.assertTrue(self.clock.wait(event))
+        self.assertEqual(self.clock.time(), start + 105)
+        event.clear()
+        with self.assertRaises(RuntimeError):
+            self.clock.wait(event)
+    
+    def test_local_time(self):
+        """Test local dates and times follow the clock's zone across a DST change"""
+        self.assertEqual(self.clock.now(), datetime(2025, 3, 30, 0, 30))
+        self.clock.advance(3600)  # Clocks go forward at 01:00 UTC
+        self.assertEqual(self.clock.now(), datetime(2025, 3, 30, 2, 30))
+        self.clock.advance(22 * 3600)
+        self.assertEqual(self.clock.today(), datetime(2025, 3, 31).date())
+        self.assertEqual(self.clock.timestamp(datetime(2025, 3, 31)), datetime(2025, 3, 30, 23, tzinfo=timezone.utc).timestamp())
+    
+    def test_jump(self):
+        """Test a jump moves wall time but not monotonic time or the timers waiting on it"""
+        fired = []
+        self.clock.call_later(60, fired.append, 'timer')
+        wall, mono = self.clock.time(), self.clock.monotonic()
+        self.clock.jump(3600)
+        self.assertEqual(self.clock.time(), wall + 3600)
+        self.assertEqual(self.clock.monotonic(), mono)
+        self.assertEqual(fired, [])
+        self.clock.advance(60)
+        self.assertEqual(fired, ['timer'])
+
+
+class TestDeadlineScheduler(unittest.TestCase):
+    """Test the heap based deadline scheduler"""
+    
+    def setUp(self):
+        self.clock = VirtualClock(1000000)
+        self.scheduler = DeadlineScheduler(self.clock)
+    
+    def advance(self, seconds):
+        self.clock.advance(seconds)
+    
+    def test_pops_due_events_in_order(self):
+        """Test events fire in deadline order, each once"""
+        self.scheduler.replace([(1000030, 'asr'), (1000010, 'dhuhr'), (1000090, 'maghrib')])
+        self.assertEqual(self.scheduler.next_event(), (1000010, 'dhuhr', 10.0))
+        self.assertEqual(self.scheduler.pop_due(), [])
+        self.advance(31)
+        self.assertEqual([name for _, name, _ in self.scheduler.pop_due()], ['dhuhr', 'asr'])
+        self.assertEqual(self.scheduler.pop_due(), [])
+        self.assertEqual(len(self.scheduler), 1)
+        stats = self.scheduler.get_stats()
+        self.assertEqual(stats['fired'], 2)
+        self.assertEqual(stats['max_jitter_ms'], 21000.0)
+    
+    def test_deadlines_ignore_wall_clock_changes(self):
+        """Test a scheduled deadline is monotonic, not moved by the wall clock"""
+        self.scheduler.schedule(1000060, 'fajr')
+        self.clock.jump(3600)  # Wall clock jumps an hour ahead
+        self.assertEqual(self.scheduler.pop_due(), [])
+        self.advance(60)
+        self.assertEqual(len(self.scheduler.pop_due()), 1)
+    
+    def test_rearm_wakes_wait(self):
+        """Test wait returns early on rearm and otherwise sleeps until the deadline"""
+        scheduler = DeadlineScheduler()
+        scheduler.schedule(time.time() + 60, 'isha')
+        threading.Timer(0.05, scheduler.rearm).start()
+        start = time.monotonic()
+        self.assertTrue(scheduler.wait())
+        self.assertLess(time.monotonic() - start, 5)
+        
+        scheduler.replace([(time.time() + 0.05, 'isha')])
+        self.assertTrue(scheduler.wait())  # replace re-arms
+        self.assertFalse(scheduler.wait())
+        self.assertEqual(len(scheduler.pop_due()), 1)
+
+
+class TestEventLedger(unittest.TestCase):
+    """Test the persistent fired event ledger"""
+    
+    path = "test_prayer_events.db"
+    
+    def setUp(self):
+        self.remove()
+        self.ledger = EventLedger(self.path)
+        self.day = datetime.now().date()  # Older dates are pruned on open
+    
+    def tearDown(self):
+        self.ledger.close()
+        self.remove()
+    
+    def remove(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+    
+    def test_claim_once(self):
+        """Test an event is claimed once per date, prayer and source"""
+        self.assertTrue(self.ledger.claim(self.day, 'fajr', 'prayer', 1000))
+        self.assertFalse(self.ledger.claim(self.day, 'fajr', 'prayer', 1000))
+        self.assertTrue(self.ledger.claim(self.day, 'fajr', 'reminder', 1000))
+        self.assertTrue(self.ledger.claim(self.day + timedelta(days=1), 'fajr', 'prayer', 87400))
+        self.assertEqual([row[0] for row in self.ledger.fired(self.day, 'prayer')], ['fajr'])
+    
+    def test_survives_restart(self):
+        """Test fired events are remembered by a new ledger on the same file"""
+        self.ledger.claim(self.day, 'asr', 'prayer', 1000)
+        self.ledger.close()
+        self.ledger = EventLedger(self.path)
+        self.assertTrue(self.ledger.has_fired(self.day, 'asr', 'prayer'))
+        self.assertFalse(self.ledger.claim(self.day, 'asr', 'prayer', 1000))
+    
+    def test_prune(self):
+        """Test old events are deleted"""
+        self.ledger.claim(self.day, 'isha', 'prayer', 1000)
+        self.ledger.prune(self.day + timedelta(days=1))
+        self.assertFalse(self.ledger.has_fired(self.day, 'isha', 'prayer'))
+    
+    def test_prune_uses_given_today(self):
+        """Test opening prunes relative to the caller's today, not the system date"""
+        past = date(2020, 1, 1)
+        self.ledger.claim(past, 'fajr', 'prayer', 1000)
+        self.ledger.claim(past - timedelta(days=EventLedger.KEEP_DAYS + 1), 'fajr', 'prayer', 1000)
+        self.ledger.close()
+        self.ledger = EventLedger(self.path, today=past)
+        self.assertTrue(self.ledger.has_fired(past, 'fajr', 'prayer'))
+        self.assertFalse(self.ledger.has_fired(past - timedelta(days=EventLedger.KEEP_DAYS + 1), 'fajr', 'prayer'))
+        self.ledger.close()
+        self.ledger = EventLedger(self.path)
+        self.assertFalse(self.ledger.has_fired(past, 'fajr', 'prayer'))
 
 
 class TestSystemLockManager(unittest.TestCase):
@@ -75,6 +1290,21 @@ class TestSystemLockManager(unittest.TestCase):
         """Test checking if system is locked"""
         # Initially should be unlocked
         self.assertFalse(self.lock_manager.is_system_locked())
+    
+    def test_unlock_after_duration(self):
+        """Test the lock is released by a clock timer after its duration"""
+        clock = VirtualClock(1000000)
+        lock_manager = SystemLockManager(clock)
+        lock_manager.lock_workstation = lambda: True
+        changes = []
+        lock_manager.set_lock_callback(changes.append)
+        self.assertTrue(lock_manager.lock_system_for_duration(2))
+        self.assertFalse(lock_manager.lock_system_for_duration(2))
+        clock.advance(119)
+        self.assertTrue(lock_manager.is_system_locked())
+        clock.advance(1)
+        self.assertFalse(lock_manager.is_system_locked())
+        self.assertEqual(changes, [True, False])
 
 
 class TestNotificationManager(unittest.TestCase):
@@ -194,7 +1424,12 @@ class TestPrayerTimeService(unittest.TestCase):
     """Test the main service"""
     
     def setUp(self):
-        self.service = PrayerTimeService()
+        # In-memory config, store and ledger, and no network, like simulation.build_service
+        config = ConfigManager(None)
+        config.set_app_setting('timetable_store', '')
+        config.set_app_setting('event_ledger', '')
+        self.service = PrayerTimeService(config_manager=config)
+        self.service.times_source = 'offline'
     
     def test_init(self):
         """Test service initialization"""
@@ -221,6 +1456,261 @@ class TestPrayerTimeService(unittest.TestCase):
         self.service.config_manager.set_location(51.5074, -0.1278, "London", "UK")
         self.service.update_location()
         # Just verify it doesn't crash
+    
+    def test_is_time_for_prayer(self):
+        """Test prayers match on epoch timestamps within their minute"""
+        self.assertTrue(self.service._is_time_for_prayer('fajr', 1000, 1000))
+        self.assertTrue(self.service._is_time_for_prayer('fajr', 1000, 1059))
+        self.assertFalse(self.service._is_time_for_prayer('fajr', 1000, 1060))
+        self.assertFalse(self.service._is_time_for_prayer('fajr', 1000, 999))
+    
+    def test_schedule_armed_with_remaining_events(self):
+        """Test loading today's times arms the scheduler up to the midnight rollover"""
+        self.service._check_prayer_times()
+        upcoming = self.service.scheduler.next_event()
+        self.assertIsNotNone(upcoming)
+        self.assertGreaterEqual(upcoming[0], int(time.time()) - 60)
+        status = self.service.get_current_status()
+        self.assertEqual(status['next_event'], upcoming[1])
+        self.assertIsNotNone(status['next_check'])
+        self.assertIn('mean_jitter_ms', status['scheduler'])
+        
+        rollover = max(self.service.scheduler._heap)
+        self.assertEqual(rollover[3], PrayerTimeService.ROLLOVER_EVENT)
+        self.assertEqual(datetime.fromtimestamp(rollover[2]).date(), datetime.now().date() + timedelta(days=1))
+    
+    def test_config_change_rearms(self):
+        """Test changing settings wakes the service and reloads the times"""
+        self.service.precompute_in_background = False
+        self.service._check_prayer_times()
+        before = self.service.today_prayer_times
+        self.service.config_manager.set_calculation_method('ISNA')
+        self.assertEqual(self.service.prayer_calculator.method, 'ISNA')
+        self.assertTrue(self.service._times_stale)
+        self.assertTrue(self.service.scheduler.wait(0))
+        self.service._check_prayer_times()  # Reloads; refilling yesterday re-arms once more
+        self.assertIsNot(self.service.today_prayer_times, before)
+        self.service._check_prayer_times()
+        self.assertFalse(self.service._times_stale)
+        self.service.config_manager.set_calculation_method('MWL')
+    
+    def test_events_fire_exactly_once(self):
+        """Test a due event is handled once however often it is scheduled, and only for prayers"""
+        handled = []
+        self.service._handle_prayer_time = handled.append
+        self.service.event_ledger = EventLedger(':memory:')
+        self.service._check_prayer_times()
+        day = self.service.today_prayer_times.date
+        
+        now = int(time.time())
+        self.service.scheduler.replace([(now - 5, 'dhuhr', day), (now - 5, 'dhuhr', day), (now - 5, 'sunrise', day)])
+        self.service._check_prayer_times()
+        self.assertEqual(handled, ['dhuhr'])
+        
+        # Rescheduling (new times, restart) skips fired events and non-prayer events
+        self.service._schedule_prayer_notifications()
+        scheduled = [entry[3] for entry in self.service.scheduler._heap]
+        self.assertNotIn('dhuhr', scheduled)
+        self.assertNotIn('sunrise', scheduled)
+        self.assertNotIn('midnight', scheduled)
+    
+    def test_clock_jump_detected(self):
+        """Test a wall clock that moved apart from the monotonic clock reschedules with catch-up"""
+        self.service._check_prayer_times()
+        self.assertIsNone(self.service._check_clock())
+        self.assertIsNone(self.service._check_clock())
+        
+        mono, wall = self.service._last_wakeup
+        self.service._last_wakeup = (mono, wall - 3600)  # An hour passed that the monotonic clock missed
+        self.assertGreater(self.service._check_clock(), 3000)
+        self.assertEqual(self.service.catch_up_stats['forward_jumps'], 1)
+        self.assertTrue(self.service._times_stale)
+        self.assertAlmostEqual(self.service._catch_up_since, wall - 3600, delta=1)
+        
+        mono, wall = self.service._last_wakeup
+        self.service._last_wakeup = (mono, wall + 600)
+        self.assertLess(self.service._check_clock(), 0)
+        self.assertEqual(self.service.catch_up_stats['backward_jumps'], 1)
+        self.assertEqual(self.service.get_current_status()['catch_up']['backward_jumps'], 1)
+    
+    def test_catch_up_schedules_events_since_jump(self):
+        """Test events that passed during a suspend are scheduled again, those before it are not"""
+        self.service.event_ledger = EventLedger(':memory:')
+        self.service._check_prayer_times()
+        times = self.service.today_prayer_times
+        since = min(timestamp for timestamp, _ in times.events()) - 3600
+        self.service._schedule_prayer_notifications(since=since)
+        scheduled = {(entry[4], entry[3]) for entry in self.service.scheduler._heap}
+        for timestamp, name in times.events():
+            if name in self.service.DEFAULT_EVENT_TYPES:
+                self.assertIn((times.date, name), scheduled)
+        self.assertTrue(all(entry[2] >= since for entry in self.service.scheduler._heap))
+    
+    def test_catch_up_policies(self):
+        """Test overdue events fire late, only notify or are skipped as configured"""
+        handled, notified = [], []
+        self.service._handle_prayer_time = handled.append
+        self.service.notification_manager.show_notification = lambda title, message: notified.append(title)
+        self.service.event_ledger = EventLedger(':memory:')
+        settings = self.service.config_manager.get_notification_settings()
+        day = datetime.now().date()
+        now = int(time.time())
+        
+        self.assertTrue(self.service._fire_event(day, 'fajr', now - 600))  # fire_late within 15 minutes
+        self.assertFalse(self.service._fire_event(day, 'dhuhr', now - 3600))  # Past the window
+        settings['catch_up_policy'] = 'notify_only'
+        self.assertFalse(self.service._fire_event(day, 'asr', now - 600))
+        settings['catch_up_policy'] = 'skip'
+        self.assertFalse(self.service._fire_event(day, 'maghrib', now - 600))
+        self.assertTrue(self.service._fire_event(day, 'isha', now))  # On time
+        settings['catch_up_policy'] = 'fire_late'
+        
+        self.assertEqual(handled, ['fajr', 'isha'])
+        self.assertEqual(notified, ['Asr Prayer Time Passed'])
+        stats = self.service.catch_up_stats
+        self.assertEqual((stats['late'], stats['caught_up'], stats['notified'], stats['missed']), (4, 1, 1, 2))
+    
+    def test_rollover_uses_precomputed_times(self):
+        """Test the coming days are computed ahead and the midnight rollover only swaps them in"""
+        clock = VirtualClock(datetime(2025, 1, 1, 23, 0), ZoneInfo('Asia/Riyadh'))
+        recorder = simulation.SimulationRecorder('Makkah', clock)
+        service = simulation.build_service(('Makkah', 21.4225, 39.8262), clock.today(), clock, recorder)
+        service.precompute_in_background = True
+        service.step()  # Loads today, starts the worker and sleeps until midnight
+        service._precompute_thread[0].join(5)
+        tomorrow = datetime(2025, 1, 2).date()
+        self.assertEqual(sorted(service._precomputed), [tomorrow - timedelta(days=offset) for offset in (2, 1, 0, -1)])
+        precomputed = service._precomputed[tomorrow]
+        
+        while service.today_prayer_times.date != tomorrow:
+            service.step()  # Until the rollover at midnight
+        self.assertIs(service.today_prayer_times, precomputed)
+        self.assertEqual(service.precompute_stats['hits'], 2)  # Re-armed with yesterday, then the rollover
+        self.assertEqual(service.precompute_stats['misses'], 1)
+    
+    def test_rollover_computes_nothing_on_service_thread(self):
+        """Test the rollover takes today and yesterday from the worker's days, never computing inline"""
+        clock = VirtualClock(datetime(2025, 1, 1, 23, 0), ZoneInfo('Asia/Riyadh'))
+        recorder = simulation.SimulationRecorder('Makkah', clock)
+        service = simulation.build_service(('Makkah', 21.4225, 39.8262), clock.today(), clock, recorder)
+        service.precompute_in_background = True
+        service.step()
+        service._precompute_thread[0].join(5)
+        
+        threads = []
+        calculator = service.prayer_calculator
+        get_prayer_times = calculator.get_prayer_times
+        calculator.get_prayer_times = lambda *args, **kwargs: (threads.append(threading.current_thread())
+                                                               or get_prayer_times(*args, **kwargs))
+        today = clock.today()
+        while service.today_prayer_times.date == today:
+            service.step()
+        service._precompute_thread[0].join(5)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual(len(threads), 1)  # The new last day ahead, on the worker
+    
+    def test_scheduling_uses_loaded_days_only(self):
+        """Test arming the scheduler never computes, taking yesterday from the loaded days"""
+        self.service.event_ledger = EventLedger(':memory:')
+        self.service.precompute_in_background = False
+        self.service._check_prayer_times()
+        
+        calls = []
+        calculator = self.service.prayer_calculator
+        get_prayer_times = calculator.get_prayer_times
+        calculator.get_prayer_times = lambda *args, **kwargs: calls.append(args) or get_prayer_times(*args, **kwargs)
+        self.service._check_prayer_times()
+        self.service._schedule_prayer_notifications(since=0)  # Everything not fired since the epoch
+        self.assertEqual(calls, [])
+        yesterday = self.service.today_prayer_times.date - timedelta(days=1)
+        self.assertIn(yesterday, {entry[4] for entry in self.service.scheduler._heap})
+    
+    def test_worker_fills_yesterday(self):
+        """Test a missing yesterday is filled by the precompute worker, which re-arms the schedule"""
+        self.service.event_ledger = EventLedger(':memory:')
+        self.service.precompute_in_background = False
+        self.service._check_prayer_times()
+        yesterday = self.service.today_prayer_times.date - timedelta(days=1)
+        self.assertIn(yesterday, self.service._precomputed)
+        self.assertTrue(self.service._times_stale)
+        self.service._check_prayer_times()
+        self.assertFalse(self.service._times_stale)  # Nothing missing any more
+    
+    def test_reconciled_times_reload_on_service_thread(self):
+        """Test online times replacing today's only swap the precomputed day and wake the service thread"""
+        self.service.event_ledger = EventLedger(':memory:')
+        self.service.precompute_in_background = False
+        self.service._check_prayer_times()
+        self.service._check_prayer_times()  # Re-armed with yesterday
+        old_times = self.service.today_prayer_times
+        new_times = PrayerTimes(old_times.date, old_times.hours, old_times.timezone, 'online')
+        heap = list(self.service.scheduler._heap)
+        
+        self.service._on_prayer_times_changed(old_times.date, old_times, new_times)
+        self.assertIs(self.service.today_prayer_times, old_times)  # Untouched off the service thread
+        self.assertEqual(self.service.scheduler._heap, heap)
+        self.assertTrue(self.service._times_stale)
+        self.service._check_prayer_times()
+        self.assertIs(self.service.today_prayer_times, new_times)
+        
+        self.service._on_prayer_times_changed(old_times.date + timedelta(days=5), None, new_times)
+        self.assertFalse(self.service._times_stale)  # Not a scheduled day
+    
+    def test_settings_change_discards_precomputed(self):
+        """Test precomputed days, and results of a worker still running, are dropped on a settings change"""
+        self.service.precompute_in_background = False
+        self.service._check_prayer_times()
+        self.assertEqual(len(self.service._precomputed), 4)  # Yesterday, today and two days ahead
+        generation = self.service._precompute_generation
+        
+        self.service.config_manager.set_calculation_method('ISNA')
+        self.assertEqual(self.service.get_current_status()['precompute']['days'], [])
+        self.service._precompute(generation, [self.service.clock.today() + timedelta(days=1)])
+        self.assertEqual(self.service._precomputed, {})
+    
+    def test_stop_wakes_service_thread(self):
+        """Test stopping the service does not wait for the next event"""
+        self.service.start_service()
+        time.sleep(0.2)
+        start = time.monotonic()
+        self.service.stop_service()
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertFalse(self.service.service_thread.is_alive())
+
+
+class TestSimulation(unittest.TestCase):
+    """Test the virtual clock simulation of the service"""
+    
+    def test_simulate_site(self):
+        """Test every prayer of every day notifies, locks and unlocks once, at its time"""
+        site = ('Makkah', 21.4225, 39.8262)
+        start = datetime(2025, 1, 1).date()
+        counts, records = simulation.simulate_site(site, start, 3, keep_records=True)
+        self.assertEqual(counts, {'adhan': 15, 'notification': 15, 'lock': 15, 'unlock': 15})
+        
+        calculator = PrayerCalculator('MWL', (21.4225, 39.8262), 'Asia/Riyadh')
+        expected = [timestamp for day in range(3)
+                    for timestamp, name in calculator.get_prayer_times(start + timedelta(days=day)).events()
+                    if name in PrayerTimeService.DEFAULT_EVENT_TYPES]
+        self.assertEqual([record[0] for record in records if record[2] == 'adhan'], expected)
+        locks = [record[0] for record in records if record[2] == 'lock']
+        unlocks = [record[0] for record in records if record[2] == 'unlock']
+        self.assertEqual(unlocks, [timestamp + 600 for timestamp in locks])
+    
+    def test_isha_after_midnight(self):
+        """Test an Isha past local midnight (high latitude summer) still fires after the rollover"""
+        site = ('Vancouver', 48.88, -122.82)
+        counts, records = simulation.simulate_site(site, datetime(2025, 6, 20).date(), 2, keep_records=True)
+        self.assertEqual(counts['adhan'], 10)
+    
+    def test_simulate(self):
+        """Test sites are simulated over the same range and counted together"""
+        sites = simulation.random_sites(3, seed=1)
+        self.assertEqual(sites, simulation.random_sites(3, seed=1))
+        result = simulation.simulate(sites, datetime(2025, 1, 1).date(), 2, workers=1)
+        self.assertEqual(result['sites'], 3)
+        self.assertEqual(result['counts']['adhan'], 30)
+        self.assertEqual(result['records'], [])
 
 
 def run_comprehensive_test():
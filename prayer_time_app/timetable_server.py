@@ -0,0 +1,282 @@
+"""
+Local Aladhan-compatible timetable server
+
+Answers the Aladhan endpoints the apps use, with the same JSON shapes as
+the public API, computed by the offline engine:
+
+    /v1/calendar/{year}/{month}?latitude=..&longitude=..&method=..[&timezonestring=..]
+    /v1/timingsByCity/{DD-MM-YYYY}?city=..&country=..&method=..
+
+Responses are kept in an LRU cache and carry an ETag; a request with a
+matching If-None-Match gets 304 Not Modified. Cities are resolved with
+the reference table in cities.py, timezones of coordinates with
+timezone_resolver.
+
+Run one node for the LAN and point clients at it (app_settings.api_url):
+    python timetable_server.py --host 0.0.0.0 --port 8080
+
+It also serves as the offline stand-in for the API in tests and
+benchmarks.
+"""
+import argparse
+import calendar
+import datetime
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from cities import find_city
+from prayer_calculator import PrayerCalculator
+from prayer_times import format_many
+from timezone_resolver import day_offsets, resolve_timezone, utc_offset
+
+# Our prayer names -> Aladhan timing keys
+API_NAMES = {
+    'imsak': 'Imsak',
+    'fajr': 'Fajr',
+    'sunrise': 'Sunrise',
+    'dhuhr': 'Dhuhr',
+    'asr': 'Asr',
+    'sunset': 'Sunset',
+    'maghrib': 'Maghrib',
+    'isha': 'Isha',
+    'midnight': 'Midnight'
+}
+
+# Aladhan method numbers -> our methods
+METHODS_BY_NUMBER = {number: method for method, number in PrayerCalculator.API_METHODS.items()}
+
+CALENDAR_PATH = re.compile(r'^/v1/calendar/(\d{4})/(\d{1,2})/?$')
+TIMINGS_BY_CITY_PATH = re.compile(r'^/v1/timingsByCity/(\d{1,2})-(\d{1,2})-(\d{4})/?$')
+
+
+def _day_entry(date_obj, timings, index, lat, lng, timezone, timezone_name, method_number, method):
+    return {
+        'timings': {api_name: str(timings[name][index]) for name, api_name in API_NAMES.items()},
+        'date': {
+            'readable': date_obj.strftime('%d %b %Y'),
+            'gregorian': {
+                'date': date_obj.strftime('%d-%m-%Y'),
+                'format': 'DD-MM-YYYY',
+                'day': f"{date_obj.day:02d}",
+                'month': {'number': date_obj.month},
+                'year': str(date_obj.year)
+            }
+        },
+        'meta': {
+            'latitude': lat,
+            'longitude': lng,
+            'timezone': timezone_name or f"UTC{timezone:+g}",
+            'method': {'id': method_number, 'name': PrayerCalculator.METHODS[method]['name']}
+        }
+    }
+
+
+def method_for_number(method_number):
+    """Our method of an Aladhan method number, ValueError for numbers without one"""
+    try:
+        return METHODS_BY_NUMBER[method_number]
+    except KeyError:
+        raise ValueError(f"unknown method {method_number}") from None
+
+
+def calendar_response(lat, lng, method_number, year, month, timezone_name=None):
+    """Build an Aladhan style calendar response for one month (ValueError for an unknown method)"""
+    method = method_for_number(method_number)
+    # Like the API, infer the timezone from the coordinates unless one is given
+    timezone_name = timezone_name or resolve_timezone(lat, lng)
+    calculator = PrayerCalculator(method=method, coordinates=(lat, lng), timezone=timezone_name, cache_size=0)
+
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    times = calculator.get_times_range(start, end)
+    timings = {name: format_many(times[name]) for name in API_NAMES}
+    offsets = day_offsets(timezone_name, start, (end - start).days + 1)
+
+    data = [_day_entry(start + datetime.timedelta(days=index), timings, index, lat, lng, offsets[index],
+                       timezone_name, method_number, method)
+            for index in range((end - start).days + 1)]
+    return {'code': 200, 'status': 'OK', 'data': data}
+
+
+def timings_by_city_response(city, country, method_number, date_obj):
+    """Build an Aladhan style timingsByCity response, None for an unknown city, ValueError for an unknown method"""
+    method = method_for_number(method_number)
+    entry = find_city(city, country)
+    if entry is None:
+        return None
+    lat, lng, timezone_name = entry[3], entry[4], entry[5]
+    timezone = utc_offset(timezone_name, date_obj)
+
+    calculator = PrayerCalculator(method=method, coordinates=(lat, lng), timezone=timezone_name, cache_size=0)
+    times = calculator.get_times_range(date_obj, date_obj)
+    timings = {name: format_many(times[name]) for name in API_NAMES}
+    data = _day_entry(date_obj, timings, 0, lat, lng, timezone, timezone_name, method_number, method)
+    return {'code': 200, 'status': 'OK', 'data': data}
+
+
+def error_response(code, message):
+    return {'code': code, 'status': message, 'data': message}
+
+
+class TimetableRequestHandler(BaseHTTPRequestHandler):
+    """Serves the Aladhan endpoints of a TimetableServer"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        cache_key = (url.path, tuple(sorted(query.items())))
+
+        cached = self.server.cache_get(cache_key)
+        if cached is None:
+            status, body = self._build_response(url.path, query)
+            payload = json.dumps(body).encode('utf-8')
+            etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+            cached = (status, payload, etag)
+            if status == 200:
+                self.server.cache_put(cache_key, cached)
+
+        status, payload, etag = cached
+        if status == 200 and etag in self._if_none_match():
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f"public, max-age={self.server.max_age}")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _build_response(self, path, query):
+        """Return (status, body) for a request"""
+        try:
+            method_number = int(query.get('method', 3))
+            match = CALENDAR_PATH.match(path)
+            if match:
+                year, month = int(match.group(1)), int(match.group(2))
+                if not 1 <= month <= 12:
+                    raise ValueError("month must be between 1 and 12")
+                timezone_name = query.get('timezonestring')
+                if timezone_name:
+                    ZoneInfo(timezone_name)  # Unknown zones are a bad request
+                return 200, calendar_response(float(query['latitude']), float(query['longitude']),
+                                              method_number, year, month, timezone_name)
+
+            match = TIMINGS_BY_CITY_PATH.match(path)
+            if match:
+                day, month, year = (int(value) for value in match.groups())
+                body = timings_by_city_response(query['city'], query.get('country'), method_number,
+                                                datetime.date(year, month, day))
+                if body is None:
+                    return 400, error_response(400, "Unable to find city and country pair")
+                return 200, body
+        except (KeyError, ValueError, ZoneInfoNotFoundError) as e:
+            return 400, error_response(400, f"Bad Request: {e}")
+        return 404, error_response(404, "Not Found")
+
+    def _if_none_match(self):
+        header = self.headers.get('If-None-Match', '')
+        return [tag.strip() for tag in header.split(',')]
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TimetableServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server for the Aladhan compatible endpoints
+
+    cache_size bounds the number of cached responses. delay adds a fixed
+    latency to every request, to simulate the public API in benchmarks.
+    Port 0 picks a free port; see url.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), cache_size=1024, max_age=3600, delay=0.0, verbose=False):
+        super().__init__(address, TimetableRequestHandler)
+        self.cache_size = cache_size
+        self.max_age = max_age
+        self.delay = delay
+        self.verbose = verbose
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._thread = None
+
+    def cache_get(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.cache_stats['misses'] += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_stats['hits'] += 1
+            return entry
+
+    def cache_put(self, key, entry):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aladhan-compatible prayer timetable server")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (0.0.0.0 for the LAN)")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache-size', type=int, default=1024, help="Cached responses")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args(argv)
+
+    server = TimetableServer((args.host, args.port), cache_size=args.cache_size, verbose=args.verbose)
+    print(f"Serving prayer timetables on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from prayer_times import PrayerTimes
+
+
+class TimetableStore:
+    """
+    Persistent SQLite store of daily prayer times
+
+    One row per location, method and date holds the float hours, the UTC
+    offset they were computed for, where they came from ('offline' or
+    'online'), the settings fingerprint of offline rows and when the row was
+    written. The database runs in WAL mode, so readers are never blocked by
+    the service writing new days.
+
+    Online rows are never replaced by offline ones for the same day.
+    """
+
+    # Coordinates are rounded to this many decimals (about 11 m) in keys
+    COORD_PRECISION = 4
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS timetable (
+            location TEXT NOT NULL,
+            method TEXT NOT NULL,
+            date TEXT NOT NULL,
+            timezone REAL NOT NULL,
+            source TEXT NOT NULL,
+            settings TEXT NOT NULL,
+            times TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (location, method, date)
+        )
+    """
+
+    UPSERT = """
+        INSERT INTO timetable (location, method, date, timezone, source, settings, times, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (location, method, date) DO UPDATE SET
+            timezone = excluded.timezone,
+            source = excluded.source,
+            settings = excluded.settings,
+            times = excluded.times,
+            updated_at = excluded.updated_at
+        WHERE excluded.source = 'online' OR timetable.source = 'offline'
+    """
+
+    def __init__(self, path="prayer_times.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(self.SCHEMA)
+
+    def location_key(self, lat, lng):
+        return f"{round(lat, self.COORD_PRECISION)},{round(lng, self.COORD_PRECISION)}"
+
+    def put(self, lat, lng, method, times, settings=''):
+        """Store a PrayerTimes result"""
+        self.put_many(lat, lng, method, [times], settings)
+
+    def put_many(self, lat, lng, method, results, settings=''):
+        """Store several PrayerTimes results in one transaction"""
+        location = self.location_key(lat, lng)
+        now = time.time()
+        rows = [(location, method, times.date.isoformat(), times.timezone, times.source,
+                 settings if times.source == 'offline' else '', json.dumps(dict(times.hours)), now)
+                for times in results]
+        with self._lock, self._conn:
+            self._conn.executemany(self.UPSERT, rows)
+
+    def get(self, lat, lng, method, date_obj, timezone=None, source=None, settings=None):
+        """
+        Return the stored PrayerTimes of one date, or None
+
+        timezone, source and settings filter the row: offline rows only match
+        when computed with the same settings fingerprint.
+        """
+        results = self.get_range(lat, lng, method, date_obj, date_obj, timezone, source, settings)
+        return results[0] if results else None
+
+    def get_range(self, lat, lng, method, start, end, timezone=None, source=None, settings=None):
+        """Return the stored PrayerTimes from start to end (inclusive), ordered by date"""
+        query = ("SELECT date, timezone, source, settings, times FROM timetable "
+                 "WHERE location = ? AND method = ? AND date BETWEEN ? AND ?")
+        args = [self.location_key(lat, lng), method, start.isoformat(), end.isoformat()]
+        if timezone is not None:
+            query += " AND timezone = ?"
+            args.append(timezone)
+        if source is not None:
+            query += " AND source = ?"
+            args.append(source)
+        if settings is not None:
+            query += " AND (source = 'online' OR settings = ?)"
+            args.append(settings)
+        query += " ORDER BY date"
+
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [PrayerTimes(date.fromisoformat(day), json.loads(times), tz, row_source)
+                for day, tz, row_source, row_settings, times in rows]
+
+    def updated_at(self, lat, lng, method, date_obj):
+        """Epoch seconds when a date was last written, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM timetable WHERE location = ? AND method = ? AND date = ?",
+                (self.location_key(lat, lng), method, date_obj.isoformat())).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
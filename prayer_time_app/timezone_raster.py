@@ -0,0 +1,152 @@
+"""
+Raster of IANA zones derived from timezone boundary polygons
+
+The file holds, for rows of latitude every LAT_STEP degrees, the runs of
+equal zone along the row: the longitude where each run starts, in units
+of RESOLUTION degrees, and its zone. A lookup picks the row of the
+latitude and bisects the run starts, so it costs a few comparisons and
+the whole world fits in a few hundred kilobytes (zlib compressed).
+
+Runs are found by sampling each row every SAMPLE_UNITS units and bisecting
+every interval whose ends differ down to one unit, so borders are placed
+to RESOLUTION degrees along a row and LAT_STEP / 2 across rows. A zone
+narrower than the sample interval that starts and ends between two
+samples of the same zone is missed.
+
+The shipped timezone_raster.bin is built from the timezone-boundary-builder
+polygons with the timezonefinder package, which is only needed to build:
+    pip install timezonefinder
+    python timezone_raster.py timezone_raster.bin
+"""
+import argparse
+import bisect
+import math
+import struct
+import sys
+import zlib
+from array import array
+
+MAGIC = b'TZRASTER'
+VERSION = 1
+HEADER = struct.Struct('<8sHddIII')  # magic, version, lat step, resolution, rows, runs, zones
+
+LAT_STEP = 0.02      # Degrees between rows
+RESOLUTION = 0.01    # Degrees per longitude unit
+SAMPLE_UNITS = 10    # Units between the samples of a row
+
+UNKNOWN = 0  # Zone id of places the source has no zone for
+
+
+def build_raster(path, zone_at, lat_step=LAT_STEP, resolution=RESOLUTION, sample_units=SAMPLE_UNITS):
+    """
+    Build a raster file from zone_at(lat, lng), which returns a zone name or None
+
+    Returns the number of runs written.
+    """
+    num_rows = int(round(180 / lat_step))
+    num_units = int(round(360 / resolution))
+    zones = ['']
+    zone_ids = {None: UNKNOWN, '': UNKNOWN}
+    row_offsets = array('I', [0])
+    starts = array('H')
+    ids = array('H')
+
+    for row in range(num_rows):
+        lat = -90 + (row + 0.5) * lat_step
+
+        def zone(unit):
+            name = zone_at(lat, -180 + (unit + 0.5) * resolution)
+            if name not in zone_ids:
+                zone_ids[name] = len(zones)
+                zones.append(name)
+            return zone_ids[name]
+
+        value = zone(0)
+        starts.append(0)
+        ids.append(value)
+        samples = list(range(0, num_units, sample_units)) + [num_units - 1]
+        for low, high in zip(samples, samples[1:]):
+            while zone(high) != value:
+                # zone(low) == value != zone(high); find the first changed unit
+                first, end = low, high
+                while end - first > 1:
+                    middle = (first + end) // 2
+                    if zone(middle) == value:
+                        first = middle
+                    else:
+                        end = middle
+                value = zone(end)
+                starts.append(end)
+                ids.append(value)
+                low = end
+        row_offsets.append(len(starts))
+
+    names = '\n'.join(zones).encode('utf-8')
+    payload = (struct.pack('<I', len(names)) + names + row_offsets.tobytes() +
+               starts.tobytes() + ids.tobytes())
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, lat_step, resolution, num_rows, len(starts), len(zones)))
+        f.write(zlib.compress(payload, 9))
+    return len(starts)
+
+
+class ZoneRaster:
+    """A raster file loaded for lookups"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.lat_step, self.resolution, self.num_rows, num_runs, num_zones = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a timezone raster file")
+        payload = zlib.decompress(data[HEADER.size:])
+
+        names_size = struct.unpack_from('<I', payload)[0]
+        offset = 4 + names_size
+        self.zones = payload[4:offset].decode('utf-8').split('\n')
+        if len(self.zones) != num_zones:
+            raise ValueError(f"{path}: corrupt zone table")
+        self.row_offsets = array('I')
+        self.row_offsets.frombytes(payload[offset:offset + 4 * (self.num_rows + 1)])
+        offset += 4 * (self.num_rows + 1)
+        self.starts = array('H')
+        self.starts.frombytes(payload[offset:offset + 2 * num_runs])
+        self.ids = array('H')
+        self.ids.frombytes(payload[offset + 2 * num_runs:offset + 4 * num_runs])
+        self.num_units = int(round(360 / self.resolution))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, lat, lng):
+        """Zone name at coordinates, or None where the source had none"""
+        row = min(self.num_rows - 1, max(0, int(math.floor((lat + 90) / self.lat_step))))
+        lng = (lng + 180) % 360
+        unit = min(self.num_units - 1, int(lng / self.resolution))
+        first, end = self.row_offsets[row], self.row_offsets[row + 1]
+        index = bisect.bisect_right(self.starts, unit, first, end) - 1
+        return self.zones[self.ids[index]] or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the timezone raster from tz boundary polygons")
+    parser.add_argument('output', help="Raster file to write (timezone_raster.bin is shipped)")
+    parser.add_argument('--lat-step', type=float, default=LAT_STEP, help="Degrees between rows")
+    parser.add_argument('--resolution', type=float, default=RESOLUTION, help="Degrees per longitude unit")
+    parser.add_argument('--sample-units', type=int, default=SAMPLE_UNITS, help="Units between row samples")
+    args = parser.parse_args(argv)
+
+    try:
+        from timezonefinder import TimezoneFinder
+    except ImportError:
+        parser.error("building needs the timezonefinder package (pip install timezonefinder)")
+    finder = TimezoneFinder()
+    runs = build_raster(args.output, lambda lat, lng: finder.timezone_at(lat=lat, lng=lng),
+                        args.lat_step, args.resolution, args.sample_units)
+    print(f"Wrote {runs} runs to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+Offline timezone resolution
+
+resolve_timezone() maps coordinates to an IANA zone name by looking them
+up in timezone_raster.bin, a raster derived from the tz boundary polygons
+(see timezone_raster.py), so places near a zone border get the zone they
+are in. Without the raster file, or for a zone this system's tzdata lacks,
+nearest_zone() is used: a nearest reference point search over the cities
+of cities.py plus ZONE_POINTS, bucketed into CELL_DEGREES cells so a
+lookup only measures the points of the surrounding cells. Coordinates
+farther than MAX_DISTANCE_KM from every reference point (open sea, polar
+regions) get the nautical Etc/GMT zone of their longitude.
+
+Offsets come from zoneinfo. The DST transitions of a zone are found once
+per year and cached, so offsets of date ranges are filled from the
+transition list instead of asking zoneinfo for every date. A day's offset
+is the one in effect at local noon, as used for its prayer times.
+"""
+import bisect
+import calendar
+import datetime
+import functools
+import math
+import os
+import zlib
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from cities import CITIES
+from timezone_raster import ZoneRaster
+
+# Extra (latitude, longitude, IANA zone) reference points for zones and
+# regions the city table does not cover
+ZONE_POINTS = (
+    (61.2181, -149.9003, 'America/Anchorage'),
+    (64.8378, -147.7164, 'America/Anchorage'),
+    (21.3069, -157.8583, 'Pacific/Honolulu'),
+    (47.6062, -122.3321, 'America/Los_Angeles'),
+    (45.5152, -122.6784, 'America/Los_Angeles'),
+    (33.4484, -112.0740, 'America/Phoenix'),
+    (40.7608, -111.8910, 'America/Denver'),
+    (51.0447, -114.0719, 'America/Edmonton'),
+    (53.5461, -113.4938, 'America/Edmonton'),
+    (49.8951, -97.1384, 'America/Winnipeg'),
+    (50.4452, -104.6189, 'America/Regina'),
+    (44.9778, -93.2650, 'America/Chicago'),
+    (32.7767, -96.7970, 'America/Chicago'),
+    (29.9511, -90.0715, 'America/Chicago'),
+    (39.0997, -94.5786, 'America/Chicago'),
+    (33.7490, -84.3880, 'America/New_York'),
+    (25.7617, -80.1918, 'America/New_York'),
+    (42.3601, -71.0589, 'America/New_York'),
+    (44.6488, -63.5752, 'America/Halifax'),
+    (47.5615, -52.7126, 'America/St_Johns'),
+    (62.4540, -114.3718, 'America/Yellowknife'),
+    (60.7212, -135.0568, 'America/Whitehorse'),
+    (64.1814, -51.6941, 'America/Nuuk'),
+    (20.9674, -89.5926, 'America/Merida'),
+    (25.6866, -100.3161, 'America/Monterrey'),
+    (14.6349, -90.5069, 'America/Guatemala'),
+    (9.9281, -84.0907, 'America/Costa_Rica'),
+    (8.9824, -79.5199, 'America/Panama'),
+    (23.1136, -82.3666, 'America/Havana'),
+    (18.4861, -69.9312, 'America/Santo_Domingo'),
+    (4.7110, -74.0721, 'America/Bogota'),
+    (10.4806, -66.9036, 'America/Caracas'),
+    (-0.1807, -78.4678, 'America/Guayaquil'),
+    (-12.0464, -77.0428, 'America/Lima'),
+    (-16.4897, -68.1193, 'America/La_Paz'),
+    (-33.4489, -70.6693, 'America/Santiago'),
+    (-25.2637, -57.5759, 'America/Asuncion'),
+    (-34.9011, -56.1645, 'America/Montevideo'),
+    (-3.1190, -60.0217, 'America/Manaus'),
+    (-15.8267, -47.9218, 'America/Sao_Paulo'),
+    (-8.0476, -34.8770, 'America/Recife'),
+    (-1.4558, -48.4902, 'America/Belem'),
+    (-54.8019, -68.3030, 'America/Argentina/Ushuaia'),
+    (38.7223, -9.1393, 'Europe/Lisbon'),
+    (37.7412, -25.6756, 'Atlantic/Azores'),
+    (28.1235, -15.4363, 'Atlantic/Canary'),
+    (52.2297, 21.0122, 'Europe/Warsaw'),
+    (50.0755, 14.4378, 'Europe/Prague'),
+    (47.4979, 19.0402, 'Europe/Budapest'),
+    (44.4268, 26.1025, 'Europe/Bucharest'),
+    (42.6977, 23.3219, 'Europe/Sofia'),
+    (37.9838, 23.7275, 'Europe/Athens'),
+    (50.4501, 30.5234, 'Europe/Kyiv'),
+    (53.9006, 27.5590, 'Europe/Minsk'),
+    (54.6872, 25.2797, 'Europe/Vilnius'),
+    (56.9496, 24.1052, 'Europe/Riga'),
+    (59.4370, 24.7536, 'Europe/Tallinn'),
+    (55.6761, 12.5683, 'Europe/Copenhagen'),
+    (46.9480, 7.4474, 'Europe/Zurich'),
+    (44.7866, 20.4489, 'Europe/Belgrade'),
+    (45.8150, 15.9819, 'Europe/Zagreb'),
+    (41.3275, 19.8187, 'Europe/Tirane'),
+    (41.9981, 21.4254, 'Europe/Skopje'),
+    (47.0105, 28.8638, 'Europe/Chisinau'),
+    (35.1856, 33.3823, 'Asia/Nicosia'),
+    (35.8989, 14.5146, 'Europe/Malta'),
+    (68.9585, 33.0827, 'Europe/Moscow'),
+    (59.9311, 30.3609, 'Europe/Moscow'),
+    (48.7080, 44.5133, 'Europe/Volgograd'),
+    (53.1959, 50.1002, 'Europe/Samara'),
+    (56.8389, 60.6057, 'Asia/Yekaterinburg'),
+    (54.9885, 73.3242, 'Asia/Omsk'),
+    (55.0084, 82.9357, 'Asia/Novosibirsk'),
+    (56.0153, 92.8932, 'Asia/Krasnoyarsk'),
+    (52.2870, 104.3050, 'Asia/Irkutsk'),
+    (62.0355, 129.6755, 'Asia/Yakutsk'),
+    (43.1198, 131.8869, 'Asia/Vladivostok'),
+    (59.5613, 150.8030, 'Asia/Magadan'),
+    (53.0452, 158.6483, 'Asia/Kamchatka'),
+    (41.7151, 44.8271, 'Asia/Tbilisi'),
+    (40.1792, 44.4991, 'Asia/Yerevan'),
+    (37.9601, 58.3261, 'Asia/Ashgabat'),
+    (38.5598, 68.7870, 'Asia/Dushanbe'),
+    (42.8746, 74.5698, 'Asia/Bishkek'),
+    (51.1694, 71.4491, 'Asia/Almaty'),
+    (47.9184, 106.9177, 'Asia/Ulaanbaatar'),
+    (27.7172, 85.3240, 'Asia/Kathmandu'),
+    (27.4728, 89.6390, 'Asia/Thimphu'),
+    (22.5726, 88.3639, 'Asia/Kolkata'),
+    (13.0827, 80.2707, 'Asia/Kolkata'),
+    (34.0837, 74.7973, 'Asia/Kolkata'),
+    (16.8409, 96.1735, 'Asia/Yangon'),
+    (21.0278, 105.8342, 'Asia/Bangkok'),
+    (10.8231, 106.6297, 'Asia/Ho_Chi_Minh'),
+    (11.5564, 104.9282, 'Asia/Phnom_Penh'),
+    (17.9757, 102.6331, 'Asia/Vientiane'),
+    (5.4141, 100.3288, 'Asia/Kuala_Lumpur'),
+    (1.5533, 110.3592, 'Asia/Kuching'),
+    (5.9804, 116.0735, 'Asia/Kuching'),
+    (3.5952, 98.6722, 'Asia/Jakarta'),
+    (-0.9471, 100.4172, 'Asia/Jakarta'),
+    (-2.9761, 104.7754, 'Asia/Jakarta'),
+    (-0.0263, 109.3425, 'Asia/Pontianak'),
+    (-8.6500, 115.2167, 'Asia/Makassar'),
+    (1.4748, 124.8421, 'Asia/Makassar'),
+    (-3.6954, 128.1814, 'Asia/Jayapura'),
+    (-2.5337, 140.7181, 'Asia/Jayapura'),
+    (-8.5569, 125.5603, 'Asia/Dili'),
+    (7.0731, 125.6128, 'Asia/Manila'),
+    (22.3193, 114.1694, 'Asia/Hong_Kong'),
+    (25.0330, 121.5654, 'Asia/Taipei'),
+    (31.2304, 121.4737, 'Asia/Shanghai'),
+    (30.5728, 104.0668, 'Asia/Shanghai'),
+    (36.0611, 103.8343, 'Asia/Shanghai'),
+    (29.6520, 91.1721, 'Asia/Shanghai'),
+    (45.8038, 126.5350, 'Asia/Shanghai'),
+    (39.4704, 75.9898, 'Asia/Urumqi'),
+    (39.0392, 125.7625, 'Asia/Pyongyang'),
+    (43.0618, 141.3545, 'Asia/Tokyo'),
+    (33.5904, 130.4017, 'Asia/Tokyo'),
+    (-9.4438, 147.1803, 'Pacific/Port_Moresby'),
+    (-12.4634, 130.8456, 'Australia/Darwin'),
+    (-23.6980, 133.8807, 'Australia/Darwin'),
+    (-27.4698, 153.0251, 'Australia/Brisbane'),
+    (-19.2590, 146.8169, 'Australia/Brisbane'),
+    (-34.9285, 138.6007, 'Australia/Adelaide'),
+    (-42.8821, 147.3272, 'Australia/Hobart'),
+    (-35.2809, 149.1300, 'Australia/Sydney'),
+    (-20.3106, 118.5878, 'Australia/Perth'),
+    (-41.2865, 174.7762, 'Pacific/Auckland'),
+    (-43.5321, 172.6362, 'Pacific/Auckland'),
+    (-22.2758, 166.4580, 'Pacific/Noumea'),
+    (-18.1416, 178.4419, 'Pacific/Fiji'),
+    (-13.8333, -171.7500, 'Pacific/Apia'),
+    (-21.1394, -175.2018, 'Pacific/Tongatapu'),
+    (-17.5516, -149.5585, 'Pacific/Tahiti'),
+    (13.4443, 144.7937, 'Pacific/Guam'),
+    (-4.6796, 55.4920, 'Indian/Mahe'),
+    (-20.1609, 57.5012, 'Indian/Mauritius'),
+    (-20.8821, 55.4507, 'Indian/Reunion'),
+    (-18.8792, 47.5079, 'Indian/Antananarivo'),
+    (-11.7172, 43.2473, 'Indian/Comoro'),
+    (11.5721, 43.1456, 'Africa/Djibouti'),
+    (15.3229, 38.9251, 'Africa/Asmara'),
+    (4.8594, 31.5713, 'Africa/Juba'),
+    (0.3476, 32.5825, 'Africa/Kampala'),
+    (-1.9441, 30.0619, 'Africa/Kigali'),
+    (-3.3614, 29.3599, 'Africa/Bujumbura'),
+    (-4.0435, 39.6682, 'Africa/Nairobi'),
+    (-15.3875, 28.3228, 'Africa/Lusaka'),
+    (-17.8252, 31.0335, 'Africa/Harare'),
+    (-13.9626, 33.7741, 'Africa/Blantyre'),
+    (-25.9692, 32.5732, 'Africa/Maputo'),
+    (-24.6282, 25.9231, 'Africa/Gaborone'),
+    (-22.5609, 17.0658, 'Africa/Windhoek'),
+    (-8.8390, 13.2894, 'Africa/Luanda'),
+    (-4.4419, 15.2663, 'Africa/Kinshasa'),
+    (-11.6876, 27.5026, 'Africa/Lubumbashi'),
+    (-4.2634, 15.2429, 'Africa/Brazzaville'),
+    (0.4162, 9.4673, 'Africa/Libreville'),
+    (3.8480, 11.5021, 'Africa/Douala'),
+    (4.3947, 18.5582, 'Africa/Bangui'),
+    (12.1348, 15.0557, 'Africa/Ndjamena'),
+    (13.5116, 2.1254, 'Africa/Niamey'),
+    (12.6392, -8.0029, 'Africa/Bamako'),
+    (12.3714, -1.5197, 'Africa/Ouagadougou'),
+    (6.3703, 2.3912, 'Africa/Porto-Novo'),
+    (6.1725, 1.2314, 'Africa/Lome'),
+    (5.3600, -4.0083, 'Africa/Abidjan'),
+    (6.3156, -10.8074, 'Africa/Monrovia'),
+    (8.4657, -13.2317, 'Africa/Freetown'),
+    (9.6412, -13.5784, 'Africa/Conakry'),
+    (11.8817, -15.6178, 'Africa/Bissau'),
+    (13.4549, -16.5790, 'Africa/Banjul'),
+    (18.0735, -15.9582, 'Africa/Nouakchott'),
+    (27.1536, -13.2033, 'Africa/El_Aaiun'),
+    (31.6295, -7.9811, 'Africa/Casablanca'),
+    (27.8750, -0.2939, 'Africa/Algiers'),
+    (25.1000, 17.0000, 'Africa/Tripoli'),
+    (19.6158, 37.2164, 'Africa/Khartoum'),
+    (25.6872, 32.6396, 'Africa/Cairo'),
+    (14.1000, 38.2800, 'Africa/Addis_Ababa'),
+    (30.5085, 47.7804, 'Asia/Baghdad'),
+    (36.1901, 44.0091, 'Asia/Baghdad'),
+    (29.5918, 52.5837, 'Asia/Tehran'),
+    (38.0800, 46.2919, 'Asia/Tehran'),
+    (31.6289, 65.7372, 'Asia/Kabul'),
+    (30.1798, 66.9750, 'Asia/Karachi'),
+    (34.0151, 71.5249, 'Asia/Karachi'),
+    (17.0151, 54.0924, 'Asia/Muscat'),
+    (26.4207, 50.0888, 'Asia/Riyadh'),
+    (18.2164, 42.5053, 'Asia/Riyadh'),
+    (12.7855, 45.0187, 'Asia/Aden'),
+    (37.0662, 37.3833, 'Europe/Istanbul'),
+    (38.4237, 27.1428, 'Europe/Istanbul'),
+    (39.9208, 41.2675, 'Europe/Istanbul'),
+    (40.1885, 29.0610, 'Europe/Istanbul'),
+    (50.1109, 8.6821, 'Europe/Berlin'),
+    (48.1351, 11.5820, 'Europe/Berlin'),
+    (53.5511, 9.9937, 'Europe/Berlin'),
+    (45.4642, 9.1900, 'Europe/Rome'),
+    (40.8518, 14.2681, 'Europe/Rome'),
+    (41.3851, 2.1734, 'Europe/Madrid'),
+    (37.3891, -5.9845, 'Europe/Madrid'),
+    (45.7640, 4.8357, 'Europe/Paris'),
+    (44.8378, -0.5792, 'Europe/Paris'),
+    (55.9533, -3.1883, 'Europe/London'),
+    (54.5973, -5.9301, 'Europe/London'),
+    (63.4305, 10.3951, 'Europe/Oslo'),
+    (78.2232, 15.6267, 'Arctic/Longyearbyen'),
+    (65.5848, 22.1547, 'Europe/Stockholm'),
+    (57.7089, 11.9746, 'Europe/Stockholm'),
+    (65.0121, 25.4651, 'Europe/Helsinki'),
+    (62.0079, -6.7900, 'Atlantic/Faroe'),
+)
+
+# Zone raster shipped next to this module, loaded on the first lookup
+RASTER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timezone_raster.bin')
+
+# Points farther than this from every reference point use Etc/GMT zones
+MAX_DISTANCE_KM = 800
+
+# Size of the cells reference points are bucketed in
+CELL_DEGREES = 10
+
+EARTH_RADIUS_KM = 6371.0
+
+# Days between offset probes when searching a year for DST transitions
+PROBE_DAYS = 7
+
+_index = None
+_raster = None  # ZoneRaster, or False when the file is unavailable
+
+
+def _reference_points():
+    return [(entry[3], entry[4], entry[5]) for entry in CITIES] + list(ZONE_POINTS)
+
+
+def _cell(lat, lng):
+    return (int(math.floor(lat / CELL_DEGREES)), int(math.floor(lng / CELL_DEGREES)))
+
+
+def _build_index():
+    """Bucket the reference points by cell"""
+    index = {}
+    for point in _reference_points():
+        index.setdefault(_cell(point[0], point[1]), []).append(point)
+    return index
+
+
+def _distance_km(lat1, lng1, lat2, lng2):
+    """Great circle distance (haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def nautical_zone(lng):
+    """Etc/GMT zone of a longitude (note the inverted POSIX sign)"""
+    offset = max(-12, min(12, round(lng / 15.0)))
+    return f"Etc/GMT{-offset:+d}" if offset else "Etc/GMT"
+
+
+def _get_raster():
+    global _raster
+    if _raster is None:
+        try:
+            _raster = ZoneRaster(RASTER_FILE)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Timezone raster unavailable, using reference points: {e}")
+            _raster = False
+    return _raster or None
+
+
+@functools.lru_cache(maxsize=None)
+def _zone_available(zone):
+    """True if this system's tzdata knows the zone"""
+    try:
+        ZoneInfo(zone)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, OSError):
+        return False
+
+
+def resolve_timezone(lat, lng):
+    """IANA zone name of coordinates, from the zone raster or else the nearest reference point"""
+    raster = _get_raster()
+    if raster is not None:
+        zone = raster.lookup(lat, lng)
+        if zone and _zone_available(zone):
+            return zone
+    return nearest_zone(lat, lng)
+
+
+def nearest_zone(lat, lng):
+    """IANA zone name of coordinates, from the nearest reference point"""
+    global _index
+    if _index is None:
+        _index = _build_index()
+
+    # Cells within MAX_DISTANCE_KM; longitude cells widen towards the poles
+    row, column = _cell(lat, lng)
+    reach = int(math.ceil(MAX_DISTANCE_KM / 111.0 / CELL_DEGREES))
+    columns = int(360 / CELL_DEGREES)
+    widen = 1 / max(math.cos(math.radians(min(abs(lat) + reach * CELL_DEGREES, 89.0))), 1e-6)
+    column_reach = min(columns // 2, int(math.ceil(reach * widen)))
+
+    best, best_distance = None, MAX_DISTANCE_KM
+    for r in range(row - reach, row + reach + 1):
+        for c in range(column - column_reach, column + column_reach + 1):
+            # Wrap across the antimeridian
+            cell_column = (c + columns // 2) % columns - columns // 2
+            for point_lat, point_lng, zone in _index.get((r, cell_column), ()):
+                distance = _distance_km(lat, lng, point_lat, point_lng)
+                if distance < best_distance:
+                    best, best_distance = zone, distance
+    return best or nautical_zone(lng)
+
+
+@functools.lru_cache(maxsize=256)
+def year_transitions(zone, year):
+    """
+    Offsets of a zone through a year as ((day of year, hours), ...)
+
+    Days count from 0 for 1 January. The first entry is 1 January; each
+    further entry is a day whose noon offset differs from the day before.
+    """
+    tzinfo = ZoneInfo(zone)
+    first_noon = datetime.datetime(year, 1, 1, 12)
+
+    def offset(day):
+        noon = (first_noon + datetime.timedelta(days=day)).replace(tzinfo=tzinfo)
+        return noon.utcoffset().total_seconds() / 3600
+
+    # Probe every PROBE_DAYS and bisect the intervals whose offset changed
+    num_days = 366 if calendar.isleap(year) else 365
+    probes = list(range(0, num_days, PROBE_DAYS)) + [num_days - 1]
+    transitions = [(0, offset(0))]
+    for low, high in zip(probes, probes[1:]):
+        value = transitions[-1][1]
+        while offset(high) != value:
+            # offset(low) == value != offset(end); find the first changed day
+            first, end = low, high
+            while end - first > 1:
+                middle = (first + end) // 2
+                if offset(middle) == value:
+                    first = middle
+                else:
+                    end = middle
+            value = offset(end)
+            transitions.append((end, value))
+            low = end
+    return tuple(transitions)
+
+
+def utc_offset(zone, date_obj):
+    """UTC offset in hours of a zone on a date"""
+    transitions = year_transitions(zone, date_obj.year)
+    day = date_obj.timetuple().tm_yday - 1
+    index = bisect.bisect_right(transitions, (day, math.inf)) - 1
+    return transitions[index][1]
+
+
+def day_offsets(zone, start, num_days):
+    """UTC offsets in hours of a zone for num_days dates from start, as a list"""
+    offsets = []
+    year, day = start.year, start.timetuple().tm_yday - 1
+    while len(offsets) < num_days:
+        transitions = year_transitions(zone, year)
+        year_end = min(366 if calendar.isleap(year) else 365, day + num_days - len(offsets))
+        ends = [first for first, _ in transitions[1:]] + [year_end]
+        for (first, value), end in zip(transitions, ends):
+            count = min(end, year_end) - max(first, day)
+            if count > 0:
+                offsets.extend([value] * count)
+        year, day = year + 1, 0
+    return offsets